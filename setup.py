@@ -14,5 +14,6 @@ setup(
   packages=['tk'],
   package_dir={'tk': 'tk'},
   install_requires=['requests'],
+  extras_require={'async': ['aiohttp']},
   scripts=['bin/tkdbox'],
 )
@@ -0,0 +1,94 @@
+"""Microbenchmarks over saved pages: `make bench` (or `python -m tests.bench`).
+
+Not collected by pytest; numbers are printed, not asserted.
+"""
+import os
+import re
+import sys
+import timeit
+
+from html.parser import HTMLParser
+
+from tk.dbox.provider import meta
+from tk.dbox.utils import text
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _page(name: str) -> bytes:
+  with open(os.path.join(DATA, name), 'rb') as f:
+    return f.read()
+
+
+class _WholePage(HTMLParser):
+  """The extractor as it was: whole page in, `dict(attrs)` per meta tag."""
+
+  def __init__(self):
+    super().__init__()
+    self.description = {}
+
+  def handle_starttag(self, tag, attrs):
+    if tag != 'meta': return
+    attrs = dict(attrs)
+    if (k := attrs.get('name', '')).startswith('citation_'):
+      self.description.setdefault(k[len('citation_'):], attrs['content'])
+
+
+def meta_extraction(page: str = 'arxiv.html', chunk_size: int = 2**14):
+  data = _page(page)
+  chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+  fetcher = meta.WithHtmlFetcher(None, '', '')
+  read = 0
+
+  def streamed():
+    nonlocal read
+    read = 0
+    def stream():
+      nonlocal read
+      for chunk in chunks:
+        read += len(chunk)
+        yield chunk
+    return fetcher._get_meta(stream())
+
+  def whole():
+    parser = _WholePage()
+    parser.feed(data.decode('utf8'))
+    return parser.description
+
+  n = 200
+  t_whole = min(timeit.repeat(whole, number=n, repeat=5)) / n
+  t_streamed = min(timeit.repeat(streamed, number=n, repeat=5)) / n
+  print(f'{page}: {len(data)} bytes, {chunk_size}B chunks')
+  print(f'  whole page: {t_whole * 1e6:8.1f}us, read {len(data)} bytes')
+  print(f'  streamed:   {t_streamed * 1e6:8.1f}us, read {read} bytes')
+
+
+def url_classifier(n_dots: int = 20):
+  """`text.is_url` vs the regex it replaced, on inputs `put` & co. see."""
+  with open(os.path.join(DATA, 'url_regex.txt')) as f:
+    old = re.compile(f.read().strip())
+  inputs = [
+    'https://arxiv.org/pdf/2011.14522.pdf',
+    'https://aclanthology.org/2020.acl-main.1.pdf',
+    'arxiv.org/abs/2011.14522',
+    '2011.14522',
+    '/home/me/Papers/SomePaper.pdf',
+  ]
+  n = 20_000
+  for s in inputs:
+    t_old = min(timeit.repeat(lambda: old.match(s), number=n, repeat=5)) / n
+    t_new = min(timeit.repeat(lambda: text.is_url(s), number=n, repeat=5)) / n
+    print(f'{s:48} regex: {t_old * 1e6:6.2f}us, is_url: {t_new * 1e6:6.2f}us')
+  s = 'http://' + '.' * n_dots
+  t_old = min(timeit.repeat(lambda: old.match(s), number=1, repeat=3))
+  t_new = min(timeit.repeat(lambda: text.is_url(s), number=1, repeat=3))
+  label = f'http:// + {n_dots} dots'
+  print(f'{label:48} regex: {t_old * 1e3:6.0f}ms, is_url: {t_new * 1e6:6.2f}us')
+
+
+BENCHMARKS = {'meta_extraction': meta_extraction, 'url_classifier': url_classifier}
+
+
+if __name__ == '__main__':
+  for name in sys.argv[1:] or BENCHMARKS:
+    BENCHMARKS[name]()
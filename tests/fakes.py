@@ -0,0 +1,124 @@
+"""Fakes shared across tests."""
+import http.server
+import json as jsonlib
+import threading
+import typing as ty
+
+import requests
+
+
+def response(
+    status: int = 200,
+    json: ty.Any = None,
+    body: bytes = b'',
+    headers: ty.Optional[dict] = None,
+    url: str = '') -> requests.Response:
+  r = requests.Response()
+  r.status_code = status
+  r.url = url
+  if json is not None:
+    r.headers['Content-Type'] = 'application/json'
+  r.headers.update(headers or {})
+  r._content = jsonlib.dumps(json).encode('utf8') if json is not None else body
+  r._content_consumed = True  # as if read, e.g. for `iter_content`
+  return r
+
+
+class FakeTransport:
+  """Replays canned responses in order, records every request made.
+
+  Responses can also be callables `(method, url, **kwargs) -> Response`.
+  """
+
+  def __init__(self, *responses: ty.Union[requests.Response, ty.Callable]):
+    self.responses = list(responses)
+    self.calls: list[tuple[str, str, dict]] = []
+
+  def request(self, method: str, url: str, **kwargs) -> requests.Response:
+    self.calls.append((method, url, kwargs))
+    if not self.responses:
+      raise AssertionError(f'Unexpected request: {method} {url}')
+    r = self.responses.pop(0)
+    return r(method, url, **kwargs) if callable(r) else r
+
+  @property
+  def urls(self) -> list[str]:
+    return [url for _, url, _ in self.calls]
+
+
+class FakeServer:
+  """Local HTTP server standing in for Dropbox / Notion / web pages.
+
+  `routes` maps a path to a JSON-able value, a `str` (served as HTML), or a
+  callable `(body: bytes, headers) -> (status, value, headers)`. A `value`
+  that's an iterator of bytes is streamed, chunk by chunk.
+  """
+
+  def __init__(self):
+    self.routes: dict[str, ty.Any] = {}
+    self.requests: list[tuple[str, str, dict, bytes]] = []
+    server = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'  # keep-alive
+
+      def _handle(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?')[0]
+        server.requests.append((self.command, self.path, dict(self.headers), body))
+        route = server.routes.get(path)
+        status, value, headers = 404, {'error': path}, {}
+        if callable(route):
+          status, value, headers = route(body, self.headers)
+        elif route is not None:
+          status, value = 200, route
+        if isinstance(value, ty.Iterator):  # bytes, sent as they come
+          self._stream(status, value, headers)
+          return
+        payload = value if isinstance(value, bytes) else (
+          value.encode('utf8') if isinstance(value, str) else
+          jsonlib.dumps(value).encode('utf8'))
+        self.send_response(status)
+        self.send_header('Content-Type', (
+          'application/octet-stream' if isinstance(value, bytes) else
+          'text/html' if isinstance(value, str) else 'application/json'))
+        self.send_header('Content-Length', str(len(payload)))
+        for k, v in headers.items():
+          self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def _stream(self, status, chunks, headers):
+        self.send_response(status)
+        self.send_header('Transfer-Encoding', 'chunked')
+        for k, v in headers.items():
+          self.send_header(k, v)
+        self.end_headers()
+        try:
+          for chunk in chunks:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.flush()
+          self.wfile.write(b'0\r\n\r\n')
+        except ConnectionError:  # client hung up early
+          self.close_connection = True
+
+      do_GET = do_POST = _handle
+
+      def log_message(self, *args):
+        pass
+
+    self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self._httpd.daemon_threads = True
+
+  @property
+  def url(self) -> str:
+    host, port = self._httpd.server_address
+    return f'http://{host}:{port}'
+
+  def __enter__(self) -> 'FakeServer':
+    threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *exc):
+    self._httpd.shutdown()
+    self._httpd.server_close()
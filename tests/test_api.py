@@ -0,0 +1,253 @@
+import json as jsonlib
+
+import pytest
+import requests
+
+from tk.dbox import api
+from tk.dbox import ratelimit
+from tk.dbox import retry
+from tk.dbox import transport as xport
+from tests.fakes import FakeTransport, response
+
+
+@pytest.fixture(autouse=True)
+def unlimited():
+  with ratelimit.use(ratelimit.RateLimiter({})) as limiter:
+    yield limiter
+
+def test_transport_session_reusedPerHost():
+  t = xport.Transport(pool_size=2)
+
+  a = t.session('https://api.dropboxapi.com/2/files/list_folder')
+  b = t.session('https://api.dropboxapi.com/2/files/move_v2')
+  c = t.session('https://api.notion.com/v1/pages')
+
+  assert a is b
+  assert a is not c
+  assert a.get_adapter('https://api.dropboxapi.com')._pool_maxsize == 2
+
+
+def test_fakeTransportSwappedIn_dropboxMv_usesTransport():
+  fake = FakeTransport(response(json={'metadata': {
+    'id': 'id:1', 'name': 'b.pdf', 'path_display': '/b.pdf',
+    'server_modified': None, 'content_hash': None}}))
+
+  with xport.use(fake):
+    result = api.Dropbox('token').mv('/a.pdf', 'b.pdf')
+
+  method, url, kwargs = fake.calls[0]
+  assert (method, url) == ('POST', 'https://api.dropboxapi.com/2/files/move_v2')
+  assert kwargs['headers']['Authorization'] == 'Bearer token'
+  assert kwargs['json']['to_path'] == '/b.pdf'
+  assert result.content.path == '/b.pdf'
+
+
+def test_failedResponse_apiGet_raises():
+  fake = FakeTransport(response(status=409, body=b'conflict'))
+
+  with pytest.raises(Exception, match='conflict'):
+    api.GenericHtml(transport=fake).get('https://example.org')
+
+
+def _no_sleep(waits: list):
+  return lambda s: waits.append(s)
+
+
+def test_dropboxTooManyRequests_mv_retriesHonouringRetryAfter():
+  waits = []
+  fake = FakeTransport(
+    response(status=429, headers={'Retry-After': '3'}, json={
+      'error_summary': 'too_many_requests/..',
+      'error': {'reason': {'.tag': 'too_many_requests'}, 'retry_after': 3}}),
+    response(json={'metadata': {'id': 'id:1', 'name': 'b.pdf'}}),
+  )
+  dropbox = api.Dropbox('token', transport=fake)
+  dropbox.retry.sleep = _no_sleep(waits)
+
+  dropbox.mv('/a.pdf', '/b.pdf')
+
+  assert len(fake.calls) == 2
+  assert 3 <= waits[0] <= 3 + dropbox.retry.base
+  assert dropbox.stats[-1].attempts == 2
+
+
+def test_notionRateLimited_post_retried():
+  fake = FakeTransport(
+    response(status=429, json={'object': 'error', 'code': 'rate_limited'}),
+    response(json={'id': 'page'}),
+  )
+  notion = api.Notion('secret', 'db', transport=fake)
+  notion.retry.sleep = _no_sleep([])
+
+  assert notion.post('pages', json={}) == {'id': 'page'}
+
+
+@pytest.mark.parametrize('idempotent,n_calls', [(True, 2), (False, 1)])
+def test_serverError_post_retriedOnlyIfIdempotent(idempotent, n_calls):
+  fake = FakeTransport(response(status=503), response(json={}))
+  dropbox = api.Dropbox('token', transport=fake)
+  dropbox.retry.sleep = _no_sleep([])
+
+  try:
+    dropbox.post('files', 'x', json={}, idempotent=idempotent)
+  except retry.ApiError as e:
+    assert e.status == 503
+
+  assert len(fake.calls) == n_calls
+
+
+def test_streamedServerError_htmlStream_closesItBeforeRetrying():
+  failed, closed = response(status=503), []
+  failed.close = lambda: closed.append(True)
+  fake = FakeTransport(failed, response(body=b'page'))
+  html = api.GenericHtml(transport=fake)
+  html.limiter = ratelimit.RateLimiter({})
+  html.retry.sleep = _no_sleep([])
+
+  assert b''.join(html.stream('https://x.org/a')) == b'page'
+  assert closed == [True]
+
+
+def test_rateLimitedResponse_request_throttlesHostBucket():
+  fake = FakeTransport(
+    response(status=429, headers={'Retry-After': '2'}), response(json={}))
+  dropbox = api.Dropbox('token', transport=fake)
+  dropbox.retry.sleep = _no_sleep([])
+  dropbox.limiter = limiter = ratelimit.RateLimiter(sleep=lambda _: None)
+
+  dropbox.post('files', 'x', json={})
+
+  bucket = limiter.bucket(dropbox.url('files', 'x'))
+  assert bucket.rate < bucket.nominal
+
+
+def test_manyPages_pages_streamsAndPrefetches():
+  fetched = []
+
+  def page(i: int):
+    fetched.append(i)
+    return api.GenericResponse(
+      meta={'has_more': i < 2, 'cursor': f'c{i}'}, content=[f'{i}a', f'{i}b'])
+
+  pages = api.Pages(lambda: page(0), lambda c: page(int(c[1:]) + 1))
+  it = iter(pages)
+
+  assert next(it) == '0a'
+  assert pages.cursor is None  # page 0 not fully consumed yet
+  assert list(it) == ['0b', '1a', '1b', '2a', '2b']
+  assert fetched == [0, 1, 2]
+  assert pages.cursor == 'c2'
+
+
+def test_singlePage_pages_doesNotFollowCursor():
+  pages = api.Pages(lambda: api.GenericResponse(
+    meta={'has_more': True, 'cursor': 'c'}, content=[1]))
+  assert pages.content == [1]
+
+
+def test_moreThanBatchSize_mvBatch_splitsAndPollsJobs():
+  meta = lambda n: {'id': f'id:{n}', 'name': n, 'path_display': f'/d/{n}'}
+  fake = FakeTransport(
+    response(json={'.tag': 'complete', 'entries': [
+      {'.tag': 'success', 'success': meta('a')},
+      {'.tag': 'failure', 'failure': {'.tag': 'from_lookup'}}]}),
+    response(json={'.tag': 'async_job_id', 'async_job_id': 'job'}),
+    response(json={'.tag': 'in_progress'}),
+    response(json={'.tag': 'complete', 'entries': [
+      {'.tag': 'success', 'success': meta('c')}]}),
+  )
+  dropbox = api.Dropbox('token', transport=fake)
+  dropbox.BATCH_SIZE = 2
+  waits = []
+  dropbox.retry.sleep = _no_sleep(waits)
+
+  result = dropbox.mv_batch([('/a', '/d/a'), ('/b', '/d/b'), ('c', 'd/c')])
+
+  assert [u.rsplit('/2/', 1)[1] for u in fake.urls] == [
+    'files/move_batch_v2', 'files/move_batch_v2',
+    'files/move_batch/check_v2', 'files/move_batch/check_v2']
+  assert fake.calls[1][2]['json']['entries'] == [
+    {'from_path': '/c', 'to_path': '/d/c'}]
+  assert fake.calls[2][2]['json'] == {'async_job_id': 'job'}
+  assert waits[1] > waits[0]
+  a, b, c = result.content
+  assert (a.path, c.path) == ('/d/a', '/d/c')
+  assert b['failure'] == {'.tag': 'from_lookup'}
+
+
+def test_cursor_longpoll_hitsNotifyHostWithoutAuth():
+  fake = FakeTransport(response(json={'changes': True}))
+
+  with xport.use(fake):
+    result = api.Dropbox('token').longpoll('c1', timeout=60)
+
+  method, url, kwargs = fake.calls[0]
+  assert url == 'https://notify.dropboxapi.com/2/files/list_folder/longpoll'
+  assert 'Authorization' not in kwargs['headers']
+  assert kwargs['json'] == {'cursor': 'c1', 'timeout': 60}
+  assert kwargs['timeout'][1] > 60 + 90
+  assert result == {'changes': True}
+
+
+def test_appendFailsWithCorrectOffset_up_resumesSessionFromThere(tmp_path):
+  bodies = []
+
+  def reply(status=200, **json):
+    def _reply(method, url, data, headers, **kwargs):
+      bodies.append((url.rsplit('/', 1)[1], bytes(data),
+                     jsonlib.loads(headers['Dropbox-API-Arg'])))
+      return response(status=status, json=json)
+    return _reply
+  fake = FakeTransport(
+    reply(session_id='s'),
+    reply(409, error={'.tag': 'incorrect_offset', 'correct_offset': 6}),
+    reply(name='big.pdf'))
+  (local := tmp_path / 'big.pdf').write_bytes(b'0123456789')
+  content = api.DropboxContent('token', transport=fake)
+  content.SESSION_THRESHOLD = content.CHUNK_SIZE = 4
+  progress = []
+
+  with local.open('rb') as fp:
+    result = content.up(fp, 'books/big.pdf', lambda *p: progress.append(p))
+
+  assert result.content == {'name': 'big.pdf'}
+  assert [(endpoint, body) for endpoint, body, _ in bodies] == [
+    ('start', b'0123'), ('append_v2', b'4567'), ('finish', b'6789')]
+  finish = bodies[-1][2]
+  assert finish['cursor'] == {'session_id': 's', 'offset': 6}
+  assert finish['commit']['path'] == '/books/big.pdf'
+  assert progress == [(4, 10), (6, 10), (10, 10)]
+
+
+def test_transportFailsMidUpload_up_raisesItsError(tmp_path):
+  def fail(method, url, data, **kwargs):
+    sent = memoryview(data)[1:]  # like a send still holding on to the body
+    raise requests.ConnectionError('connection reset')
+  fake = FakeTransport(response(json={'session_id': 's'}), *[fail] * 10)
+  (local := tmp_path / 'big.pdf').write_bytes(b'0123456789')
+  content = api.DropboxContent('token', transport=fake)
+  content.SESSION_THRESHOLD = content.CHUNK_SIZE = 4
+  content.retry = retry.RetryPolicy(base=0.)
+
+  with local.open('rb') as fp, pytest.raises(
+      requests.ConnectionError, match='connection reset'):
+    content.up(fp, 'books/big.pdf')
+
+
+def test_closedSessions_finishUploadBatch_commitsInOneCall():
+  fake = FakeTransport(response(json={'entries': [
+    {'.tag': 'success', 'id': 'id:a', 'name': 'a.pdf', 'path_display': '/p/a.pdf'},
+    {'.tag': 'failure', 'failure': {'.tag': 'too_many_write_operations'}}]}))
+  dropbox = api.Dropbox('token', transport=fake)
+
+  result = dropbox.finish_upload_batch([
+    ({'session_id': 's1', 'offset': 3}, '/p/a.pdf'),
+    ({'session_id': 's2', 'offset': 5}, 'p/b.pdf')])
+
+  _, url, kwargs = fake.calls[0]
+  assert url.endswith('/2/files/upload_session/finish_batch_v2')
+  assert [e['commit']['path'] for e in kwargs['json']['entries']] == [
+    '/p/a.pdf', '/p/b.pdf']
+  ok, failed = result.content
+  assert ok.path == '/p/a.pdf'
+  assert failed['failure']['.tag'] == 'too_many_write_operations'
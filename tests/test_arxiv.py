@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from unittest import mock
+
+from tk.dbox.provider import arxiv
+from tk.dbox.provider import auto
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _read(name: str, mode: str = 'rb'):
+  with open(os.path.join(DATA, name), mode) as f:
+    return f.read()
+
+
+def _chunks(data: bytes, n: int = 100):
+  return [data[i:i + n] for i in range(0, len(data), n)]
+
+
+def test_recordedFeedInChunks_parseFeed_yieldsEntriesButNotErrors():
+  found = list(arxiv.parse_feed(_chunks(_read('arxiv_feed.xml'))))
+
+  assert [f.paper_id for f in found] == ['2106.09608', '1706.03762']
+  first = found[0]
+  assert first.title == (
+    'Learning Knowledge Graph-based World Models of Textual Environments')
+  assert first.author == ['Prithviraj Ammanabrolu', 'Mark O. Riedl']
+  assert first.date == '2021/06/17'
+  assert first.pdf_url == 'http://arxiv.org/pdf/2106.09608v1'
+  assert first.abstract.startswith("World models improve a learning agent's")
+  assert first.meta['category'] == 'cs.CL'
+
+
+@pytest.fixture
+def fetcher():
+  return arxiv.ExportApiFetcher(
+    mock.Mock(return_value=_read('arxiv.html', 'r')),
+    pdfurl='https://arxiv.org/pdf/{id}.pdf',
+    absurl='https://arxiv.org/abs/{id}',
+    feed_getter=mock.Mock(return_value=_chunks(_read('arxiv_feed.xml'))))
+
+
+def test_prefetchedIds_call_noFurtherRequests(fetcher):
+  assert fetcher.prefetch(
+    ['2106.09608', 'https://arxiv.org/abs/1706.03762v5', '1234.56789']) == 2
+  url, = fetcher.feed_getter.call_args.args
+  assert 'id_list=2106.09608,1706.03762v5,1234.56789&max_results=3' in url
+
+  (name, meta), pdfurl = fetcher('1706.03762v5')
+
+  assert name == '1706.03762v5_AttentionIsAllYouNeed.pdf'
+  assert meta.author == ['Ashish Vaswani', 'Noam Shazeer']
+  assert pdfurl == 'https://arxiv.org/pdf/1706.03762v5.pdf'
+  fetcher.feed_getter.assert_called_once()
+  fetcher.html_getter.assert_not_called()
+
+
+def test_idNotInFeed_call_fallsBackToAbstractPage(fetcher):
+  fetcher.feed_getter.return_value = []
+
+  (name, meta), _ = fetcher('2106.09608')
+
+  fetcher.html_getter.assert_called_once_with('https://arxiv.org/abs/2106.09608')
+  assert meta.title == (
+    'Learning Knowledge Graph-based World Models of Textual Environments')
+
+
+def test_mixedItems_dispatcherPrefetch_asksOnlyForArxivOnes():
+  html = mock.Mock()
+  html.stream.return_value = _chunks(_read('arxiv_feed.xml'))
+  dispatcher = auto.Dispatcher(html)
+
+  assert dispatcher.prefetch([
+    'https://arxiv.org/abs/2106.09608', 'https://x.org/paper.pdf',
+    '1706.03762']) == 2
+
+  url, = html.stream.call_args.args
+  assert 'id_list=2106.09608,1706.03762&' in url
@@ -0,0 +1,60 @@
+import stat
+import time
+from unittest import mock
+
+from tk.dbox import api
+from tk.dbox import auth as oauth
+from tests.fakes import FakeTransport, response
+
+
+def test_expiredStoredToken_accessToken_refreshesAndStoresSecurely(tmp_path):
+  store = oauth.TokenStore(tmp_path / 'tokens.json')
+  store.save('app', oauth.Token('old', time.time() + 10, refresh_token='r'))
+  fake = FakeTransport(response(json={'access_token': 'new', 'expires_in': 14400}))
+  credentials = oauth.Credentials.of(
+    {'client_id': 'app', 'client_secret': 's'}, fake, store)
+
+  assert credentials.access_token() == 'new'
+  assert credentials.access_token() == 'new'  # no second request
+
+  _, url, kwargs = fake.calls[0]
+  assert url == oauth.TOKEN_URL
+  assert kwargs['data']['grant_type'] == 'refresh_token'
+  assert kwargs['data']['refresh_token'] == 'r'
+  stored = store.load('app')
+  assert (stored.access_token, stored.refresh_token) == ('new', 'r')
+  assert stat.S_IMODE(store.path.stat().st_mode) == 0o600
+
+
+def test_noStoredToken_accessToken_authorizesOnlyOnce(tmp_path):
+  store = oauth.TokenStore(tmp_path / 'tokens.json')
+  authorize = mock.Mock(return_value={
+    'access_token': 'a', 'expires_in': 14400, 'refresh_token': 'r'})
+
+  first = oauth.Credentials('app', 's', store=store, authorize=authorize)
+  second = oauth.Credentials('app', 's', store=store, authorize=authorize)
+
+  assert first.access_token() == second.access_token() == 'a'
+  authorize.assert_called_once()
+
+
+def test_unauthorized_request_renewsTokenAndRetries():
+  unauthorized, closed = response(
+    status=401, json={'error_summary': 'expired_access_token/'}), []
+  unauthorized.close = lambda: closed.append(True)
+  fake = FakeTransport(
+    unauthorized,
+    response(json={'access_token': 'new', 'expires_in': 14400}),
+    response(json={'cursor': 'c'}))
+  credentials = oauth.Credentials(
+    'app', 's', token=oauth.Token('old', refresh_token='r'), transport=fake)
+  dropbox = api.Dropbox(credentials, transport=fake)
+  content = api.DropboxContent(credentials, transport=fake)
+
+  assert dropbox.latest_cursor('/books') == 'c'
+
+  first, _, retried = fake.calls
+  assert first[2]['headers']['Authorization'] == 'Bearer old'
+  assert retried[2]['headers']['Authorization'] == 'Bearer new'
+  assert content.credentials.cached() == 'new'
+  assert closed == [True]
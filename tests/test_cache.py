@@ -0,0 +1,63 @@
+import os
+
+import pytest
+import requests
+from unittest import mock
+
+from tk.dbox import cache
+from tk.dbox import retry
+from tk.dbox.provider import meta
+
+HTML = os.path.join(os.path.dirname(__file__), 'data', 'arxiv.html')
+
+
+@pytest.fixture
+def metacache(tmp_path) -> cache.MetaCache:
+  return cache.MetaCache(tmp_path / 'db.sqlite')
+
+
+def _fetcher(metacache, html_getter) -> meta.WithHtmlFetcher:
+  return meta.WithHtmlFetcher(
+    html_getter, pdfurl='https://arxiv.org/pdf/{id}.pdf',
+    absurl='https://arxiv.org/abs/{id}', cache=metacache)
+
+
+def test_fetchedOnce_withHtmlFetcher_answersRepeatsFromCache(metacache):
+  with open(HTML) as f:
+    getter = mock.Mock(return_value=f.read())
+
+  first = _fetcher(metacache, getter)('2106.09608')
+  again = _fetcher(cache.MetaCache(metacache._path), getter)('2106.09608')
+
+  getter.assert_called_once()
+  assert again == first
+  assert metacache.get('arxiv.org', '2106.09608')[0]
+
+
+def test_notFound_withHtmlFetcher_cachesTheMiss(metacache):
+  response = requests.Response()
+  response.status_code = 404
+  getter = mock.Mock(side_effect=retry.ApiError(response))
+
+  with pytest.raises(retry.ApiError):
+    _fetcher(metacache, getter)('0000.00000')
+  with pytest.raises(LookupError):
+    _fetcher(metacache, getter)('0000.00000')
+
+  getter.assert_called_once()
+  assert metacache.get('arxiv.org', '0000.00000') == (True, None)
+
+
+def test_expiredOrOverCapacity_metaCache_forgetsOldest(metacache):
+  r = lambda t: meta.CitationMetaExtractor.Response(meta={}, title=t)
+  metacache.max_entries = 2
+  for id in 'abc':
+    metacache.put('p', id, r(id))
+  metacache.put('p', 'gone', None)
+
+  assert metacache.prune() == 2
+  assert [metacache.get('p', id)[0] for id in ('a', 'b', 'c', 'gone')] == [
+    False, False, True, True]
+  metacache.ttl = metacache.negative_ttl = -1.
+  assert metacache.get('p', 'c') == (False, None)
+  assert metacache.prune() == 2
@@ -0,0 +1,289 @@
+"""Blocking and asyncio clients against one local fake server.
+
+Every test runs for both flavours; `call` hides the difference.
+"""
+import asyncio
+import inspect
+import io
+import json
+import threading
+import time
+import types
+
+import pytest
+
+from tk.dbox import api
+from tk.dbox import httpcache
+from tk.dbox import ratelimit
+from tests.fakes import FakeServer
+
+aio = pytest.importorskip('tk.dbox.aio')
+
+
+def _file(name: str, **kw) -> dict:
+  return {'.tag': 'file', 'id': f'id:{name}', 'name': name,
+          'path_display': f'/{name}', 'server_modified': '2023-01-02T03:04:05Z',
+          'content_hash': 'abc', **kw}
+
+
+@pytest.fixture(scope='module')
+def server():
+  with FakeServer() as server:
+    yield server
+
+
+@pytest.fixture(params=['sync', 'async'])
+def clients(request, server):
+  server.routes.clear()
+  server.requests.clear()
+  if request.param == 'sync':
+    c = types.SimpleNamespace(
+      dropbox=api.Dropbox('token'),
+      content=api.DropboxContent('token'),
+      notion=api.Notion('secret', 'db'),
+      html=api.GenericHtml())
+  else:
+    c = types.SimpleNamespace(
+      dropbox=aio.AsyncDropbox('token'),
+      content=aio.AsyncDropboxContent('token'),
+      notion=aio.AsyncNotion('secret', 'db'),
+      html=aio.AsyncGenericHtml())
+  c.dropbox.base = server.url + '/2/{}'
+  c.content.base = server.url + '/content/2/{}'
+  c.notion.base = server.url + '/v1/{}'
+  for client in vars(c).values():
+    client.limiter = ratelimit.RateLimiter({})
+  return c
+
+
+def call(client, method: str, *args, **kwargs):
+  result = getattr(client, method)(*args, **kwargs)
+  if not inspect.isawaitable(result):
+    return result
+
+  async def _run():
+    try:
+      return await result
+    finally:
+      await client.close()
+  return asyncio.run(_run())
+
+
+def test_pagedListing_lsExhaust_returnsAllFiles(clients, server):
+  server.routes['/2/files/list_folder'] = {
+    'entries': [_file('a.pdf')], 'has_more': True, 'cursor': 'c1'}
+  server.routes['/2/files/list_folder/continue'] = {
+    'entries': [_file('b.pdf')], 'has_more': False, 'cursor': 'c2'}
+
+  result = call(clients.dropbox, 'ls', '/books', exhaust=True)
+
+  assert [f.name for f in result.content] == ['a.pdf', 'b.pdf']
+  assert result.meta['cursor'] == result.cursor == 'c2'
+  _, _, headers, body = server.requests[0]
+  assert headers['Authorization'] == 'Bearer token'
+  assert json.loads(body)['path'] == '/books'
+
+
+def test_filenameMatches_search_remapsToFileResponses(clients, server):
+  server.routes['/2/files/search_v2'] = {'has_more': False, 'matches': [{
+    'match_type': {'.tag': 'filename'},
+    'metadata': {'.tag': 'metadata', 'metadata': _file('x.pdf')}}]}
+
+  result = call(clients.dropbox, 'search', 'x', file_extensions=['pdf'])
+
+  file, = result.content
+  assert isinstance(file, api.FileResponse)
+  assert file.path == '/x.pdf' and file.last_modified.year == 2023
+
+
+def test_fileResponseInput_mv_unwrapsPathAndMetadata(clients, server):
+  server.routes['/2/files/move_v2'] = {'metadata': _file('b.pdf')}
+  src = api.FileResponse.fromdict(_file('a.pdf'))
+
+  result = call(clients.dropbox, 'mv', src, 'b.pdf')
+
+  assert result.content.name == 'b.pdf'
+  assert json.loads(server.requests[0][3]) == {
+    'from_path': '/a.pdf', 'to_path': '/b.pdf',
+    'autorename': True, 'allow_ownership_transfer': False}
+
+
+def test_copyReference_ln_savesReference(clients, server):
+  server.routes['/2/files/copy_reference/get'] = {'copy_reference': 'ref'}
+  server.routes['/2/files/copy_reference/save'] = {'metadata': _file('l.pdf')}
+
+  result = call(clients.dropbox, 'ln', '/a.pdf', '/l.pdf')
+
+  assert result.content.name == 'l.pdf'
+  assert json.loads(server.requests[1][3])['copy_reference'] == 'ref'
+
+
+def test_bytes_up_sendsBodyAndApiArg(clients, server):
+  server.routes['/content/2/files/upload'] = _file('u.pdf')
+
+  result = call(clients.content, 'up', io.BytesIO(b'%PDF'), 'papers/u.pdf')
+
+  _, _, headers, body = server.requests[0]
+  assert body == b'%PDF'
+  assert json.loads(headers['Dropbox-API-Arg'])['path'] == '/papers/u.pdf'
+  assert result.content['name'] == 'u.pdf'
+
+
+def test_paper_addPaper_createsDatabasePage(clients, server):
+  server.routes['/v1/pages'] = {'object': 'page', 'id': 'p'}
+
+  result = call(clients.notion, 'add_paper', 'T\nitle', 'url', 'abs')
+
+  assert result['id'] == 'p'
+  page = json.loads(server.requests[0][3])
+  assert page['parent'] == {'database_id': 'db'}
+  assert page['properties']['Name']['title'][0]['text']['content'] == 'T itle'
+
+
+def test_htmlPage_get_returnsText(clients, server):
+  server.routes['/abs/1234.12345'] = '<html><head></head></html>'
+
+  assert call(clients.html, 'get', server.url + '/abs/1234.12345') == (
+    '<html><head></head></html>')
+
+
+def test_rateLimitedOnce_save_url_retries(clients, server):
+  responses = [
+    (429, {'error_summary': 'too_many_requests/'}, {'Retry-After': '0'}),
+    (200, {'async_job_id': 'job'}, {}),
+  ]
+  server.routes['/2/files/save_url'] = lambda *_: responses.pop(0)
+
+  result = call(clients.dropbox, 'save_url', 'https://x.org/a.pdf', '/a.pdf')
+
+  assert result.content == {'async_job_id': 'job'}
+  assert clients.dropbox.stats[-1].attempts == 2
+
+
+def test_cursor_ls_resumesFromContinue(clients, server):
+  server.routes['/2/files/list_folder/continue'] = {
+    'entries': [_file('c.pdf')], 'has_more': False, 'cursor': 'c3'}
+
+  result = call(clients.dropbox, 'ls', '/books', exhaust=True, cursor='c2')
+
+  assert [f.name for f in result.content] == ['c.pdf']
+  assert [r[1] for r in server.requests] == ['/2/files/list_folder/continue']
+
+
+def test_largeLocalFile_up_streamsChunksOverTheWire(server, tmp_path):
+  server.routes.clear()
+  server.requests.clear()
+  server.routes['/content/2/files/upload_session/start'] = {'session_id': 's'}
+  server.routes['/content/2/files/upload_session/append_v2'] = (
+    lambda *_: (200, None, {}))
+  server.routes['/content/2/files/upload_session/finish'] = _file('big.pdf')
+  (local := tmp_path / 'big.pdf').write_bytes(bytes(range(256)) * 40)
+  content = api.DropboxContent('token')
+  content.base = server.url + '/content/2/{}'
+  content.limiter = ratelimit.RateLimiter({})
+  content.SESSION_THRESHOLD = content.CHUNK_SIZE = 4096
+
+  with local.open('rb') as fp:
+    result = content.up(fp, 'big.pdf')
+
+  assert result.content['name'] == 'big.pdf'
+  assert b''.join(body for *_, body in server.requests) == local.read_bytes()
+  assert [len(body) for *_, body in server.requests] == [4096, 4096, 2048]
+
+
+def test_partialDownload_down_resumesWithRange(server, tmp_path):
+  server.routes.clear()
+  server.requests.clear()
+  data = bytes(range(256)) * 8
+  meta = {'name': 'a.pdf', 'size': len(data)}
+
+  def download(body, headers):
+    start = int((headers.get('Range') or 'bytes=0-')[6:-1])
+    return (206 if start else 200), data[start:], {
+      'Dropbox-API-Result': json.dumps(meta)}
+  server.routes['/content/2/files/download'] = download
+  (tmp_path / 'a.pdf.r1.part').write_bytes(data[:1000])
+  content = api.DropboxContent('token')
+  content.base = server.url + '/content/2/{}'
+  content.limiter = ratelimit.RateLimiter({})
+
+  result = content.down('/a.pdf', tmp_path / 'a.pdf', rev='r1', chunk_size=256)
+
+  assert result == meta
+  assert (tmp_path / 'a.pdf').read_bytes() == data
+  assert not (tmp_path / 'a.pdf.r1.part').exists()
+  _, _, headers, _ = server.requests[0]
+  assert headers['Range'] == 'bytes=1000-'
+  assert json.loads(headers['Dropbox-API-Arg']) == {'path': 'rev:r1'}
+
+
+def _slow(first: bytes, rest: bytes, go: threading.Event):
+  """Body that sends `rest` only once `go` is set (or after 5s)."""
+  yield first
+  go.wait(5)
+  yield rest
+
+
+def test_slowPage_htmlStream_yieldsBeforeTheRestIsSent(server):
+  server.routes.clear()
+  head_read = threading.Event()
+  server.routes['/abs/1234.12345'] = lambda *_: (200, _slow(
+    b'<html><head></head>', b'<body>' + b'x' * 2**20 + b'</body></html>',
+    head_read), {'Content-Type': 'text/html'})
+  html = api.GenericHtml()
+  html.limiter = ratelimit.RateLimiter({})
+
+  start = time.monotonic()
+  stream = html.stream(server.url + '/abs/1234.12345')
+  first = next(stream)
+  took = time.monotonic() - start
+  head_read.set()
+  stream.close()
+
+  assert first == b'<html><head></head>'
+  assert took < 2.5
+
+
+def test_cacheableSlowPage_htmlStreamClosedEarly_doesntWaitForTheRest(
+    server, tmp_path):
+  server.routes.clear()
+  go = threading.Event()
+  server.routes['/abs/1234.12345'] = lambda *_: (200, _slow(
+    b'<html><head></head>', b'<body>' + b'x' * 2**20 + b'</body></html>', go), {
+      'Content-Type': 'text/html', 'ETag': '"v1"'})
+  html = api.GenericHtml(http_cache=httpcache.HttpCache(tmp_path / 'http.sqlite'))
+  html.limiter = ratelimit.RateLimiter({})
+
+  start = time.monotonic()
+  stream = html.stream(server.url + '/abs/1234.12345')
+  next(stream)
+  stream.close()
+  took = time.monotonic() - start
+  go.set()
+
+  assert took < 2.5
+  assert html.http_cache.get(server.url + '/abs/1234.12345').partial
+
+
+def test_slowDownload_down_writesChunksAsTheyArrive(server, tmp_path):
+  server.routes.clear()
+  meta = {'name': 'a.pdf', 'size': 2**16 + 2**20}
+  first_written = threading.Event()
+  server.routes['/content/2/files/download'] = lambda *_: (200, _slow(
+    b'a' * 2**16, b'b' * 2**20, first_written), {
+      'Dropbox-API-Result': json.dumps(meta)})
+  content = api.DropboxContent('token')
+  content.base = server.url + '/content/2/{}'
+  content.limiter = ratelimit.RateLimiter({})
+  start, progress = time.monotonic(), []
+
+  def on_progress(done, total):
+    progress.append((done, time.monotonic() - start))
+    first_written.set()
+
+  content.down('/a.pdf', tmp_path / 'a.pdf', progress=on_progress, chunk_size=2**16)
+
+  assert (tmp_path / 'a.pdf').read_bytes() == b'a' * 2**16 + b'b' * 2**20
+  (done, took), *_ = progress
+  assert done == 2**16 and took < 2.5
+  assert progress[-1][0] == meta['size']
@@ -0,0 +1,111 @@
+import io
+import logging
+import os
+import stat
+import threading
+from unittest import mock
+
+import pytest
+
+from tk.dbox import client
+from tk.dbox import daemon
+from tk.dbox import main
+from tk.dbox.utils import cli
+
+
+@pytest.fixture
+def serve(tmp_path):
+  servers = []
+
+  def _serve(run):
+    server = daemon.Server(tmp_path / 's.sock', run)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    servers.append(server)
+    return server
+  yield _serve
+  for server in servers:
+    server.shutdown()
+    server.server_close()
+
+
+def test_permissiveUmask_server_createsOwnerOnlySocket(tmp_path):
+  umask = os.umask(0o000)
+  try:
+    server = daemon.Server(tmp_path / 's.sock', lambda argv: None)
+    restored = os.umask(umask)
+  finally:
+    os.umask(umask)
+  try:
+    assert stat.S_IMODE(os.stat(tmp_path / 's.sock').st_mode) == 0o600
+    assert restored == 0o000
+  finally:
+    server.server_close()
+
+
+def test_commandPrintsLogsAndPrompts_request_forwardsAll(serve):
+  def run(argv):
+    print('args:', *argv)
+    logging.getLogger('tk.dbox.test').warning('careful')
+    print('answer:', cli.prompt('Continue?', 'yn'))
+  server = serve(run)
+  out, err = io.StringIO(), io.StringIO()
+
+  code = client.request(
+    ['ls', '/books'], server.path, out, err, read=lambda prompt: 'y')
+
+  assert code == 0
+  assert out.getvalue() == 'args: ls /books\nanswer: y\n'
+  assert 'careful' in err.getvalue()
+
+
+def test_failingCommand_request_returnsExitCodeAndTraceback(serve):
+  def run(argv):
+    if argv == ['bad']:
+      raise SystemExit(2)
+    raise ValueError('boom')
+  server = serve(run)
+  err = io.StringIO()
+
+  assert client.request(['bad'], server.path, io.StringIO(), err) == 2
+  assert client.request(['ls'], server.path, io.StringIO(), err) == 1
+  assert 'ValueError: boom' in err.getvalue()
+
+
+def test_noDaemon_main_runsInProcess(tmp_path):
+  with (mock.patch.object(client, 'SOCKET', tmp_path / 'missing.sock'),
+        mock.patch('tk.dbox.main.Cli.run') as run):
+    client.main(['ls', '/books'])
+
+  run.assert_called_once_with(['ls', '/books'])
+
+
+def test_itemsOnClientStdin_putManyViaDaemon_readsThem(serve, monkeypatch):
+  def run(argv):
+    print(*main._read_items(argv[-1]))
+  server = serve(run)
+  out = io.StringIO()
+  monkeypatch.setattr('sys.stdin', io.StringIO('2101.00001\n# skip\nhttps://x.org/a.pdf\n'))
+
+  code = client.request(['put_many', '-'], server.path, out, io.StringIO())
+
+  assert code == 0
+  assert out.getvalue() == '2101.00001 https://x.org/a.pdf\n'
+
+
+@pytest.mark.parametrize('argv', [
+  ['watch'], ['-v', 'watch'], ['--deadline', '30', 'outbox', 'drain'],
+  ['--cfg=a.json', '-vv', 'serve']])
+def test_leadingOptions_main_runsLocalCommandsInProcess(argv):
+  with (mock.patch.object(client, 'request') as request,
+        mock.patch('tk.dbox.main.Cli.run') as run):
+    client.main(argv)
+
+  request.assert_not_called()
+  run.assert_called_once_with(argv)
+
+
+@pytest.mark.parametrize('argv,cmd', [
+  (['--hedge', '2s', 'put', 'x'], 'put'), (['put-many', '-'], 'put_many'),
+  (['-v'], None)])
+def test_options_command_skipsThem(argv, cmd):
+  assert client.command(argv) == cmd
@@ -0,0 +1,128 @@
+import concurrent.futures as cf
+import threading
+import time
+
+from types import SimpleNamespace as SN
+
+import pytest
+
+from tk.dbox import api
+from tk.dbox import deadline as dl
+from tk.dbox import ratelimit
+from tests.fakes import FakeTransport, response
+
+
+@pytest.mark.parametrize('s,seconds', [
+  ('20s', 20.), ('20', 20.), ('1.5m', 90.), ('500ms', .5), ('1h', 3600.)])
+def test_duration_parse_returnsSeconds(s, seconds):
+  assert dl.parse(s) == seconds
+
+
+def test_nestedScopes_current_tightestWins():
+  with dl.scope(10) as outer:
+    with dl.scope(100) as inner:
+      assert inner is outer
+    with dl.scope(1) as inner:
+      assert inner.at < outer.at
+  assert dl.current() is None
+
+
+def test_tupleTimeout_clamp_boundedByRemaining():
+  deadline = dl.Deadline.after(2)
+  connect, read = deadline.clamp((10., 1.))
+  assert connect <= 2 and read == 1.
+
+
+def test_deadlinePassed_apiCall_raisesWithoutRetrying():
+  fake = FakeTransport(response(status=503), response(json={}))
+  html = api.GenericHtml(transport=fake)
+  html.limiter = ratelimit.RateLimiter({})
+  html.retry.sleep = lambda _: None
+  html.retry.backoff = lambda attempt: 10.
+
+  with dl.scope(0.5):
+    with pytest.raises(Exception):
+      html.get('https://example.org')
+
+  assert len(fake.calls) == 1
+
+
+def test_slowFirstRequest_hedge_returnsFasterOne():
+  calls = []
+  release = threading.Event()
+
+  def call():
+    calls.append(1)
+    if len(calls) == 1:
+      release.wait(5)
+      return 'slow'
+    return 'fast'
+
+  try:
+    assert dl.hedge(call, after=0.01) == 'fast'
+  finally:
+    release.set()
+
+
+def test_slowFirstRequest_hedge_closesTheLoserOnceDone():
+  calls, closed = [], threading.Event()
+  release = threading.Event()
+
+  def call():
+    calls.append(1)
+    if len(calls) == 1:
+      release.wait(5)
+      return SN(close=closed.set)
+    return 'fast'
+
+  assert dl.hedge(call, after=0.01) == 'fast'
+  assert not closed.is_set()
+  release.set()
+  assert closed.wait(5)
+
+
+def test_moreHedgedCallsThanWorkers_hedge_backupsDontQueueBehindThem():
+  release = threading.Event()
+
+  def slow_then_fast():
+    calls = []
+
+    def call():
+      calls.append(1)
+      return 'slow' if len(calls) == 1 and release.wait(5) else 'fast'
+    return call
+
+  with cf.ThreadPoolExecutor(12) as pool:
+    futures = [pool.submit(dl.hedge, slow_then_fast(), .01) for _ in range(12)]
+    done, _ = cf.wait(futures, timeout=2)
+    release.set()
+
+  assert [f.result() for f in done] == ['fast'] * 12
+
+
+def test_fastFirstRequest_hedge_sendsOnlyOne():
+  calls = []
+  assert dl.hedge(lambda: calls.append(1) or 'ok', after=1.) == 'ok'
+  assert len(calls) == 1
+
+
+def test_deadline_propagate_visibleInWorkerThread():
+  seen = []
+  with dl.scope(5) as deadline:
+    t = threading.Thread(target=dl.propagate(lambda: seen.append(dl.current())))
+    t.start(); t.join()
+  assert seen == [deadline]
+
+
+def test_slowDripBody_bounded_raisesOncePastDeadline():
+  def drip():
+    while True:
+      time.sleep(.02)
+      yield b'x'
+
+  with dl.scope(.1):
+    chunks = dl.bounded(drip(), 'reading')
+    next(chunks)
+    with pytest.raises(dl.DeadlineExceeded):
+      for _ in chunks:
+        pass
@@ -1,13 +1,21 @@
 """E2e tests with a bit too much knowledge of the internal impl.
 """
+import io
+import threading
+
 import pytest
 from unittest import mock
 from types import SimpleNamespace as SN
 
 from tk.dbox import api
+from tk.dbox import cache
+from tk.dbox import deadline as dl
 from tk.dbox import main
+from tk.dbox import outbox as ob
+from tk.dbox import retry
 from tk.dbox.provider import auto
 from tk.dbox.utils import cli
+from tk.dbox.utils import hashing
 
 
 @pytest.fixture
@@ -21,14 +29,15 @@ def cli_with_fakes() -> main.Cli:
 
 
 def test_dropboxLsMockedReturnsOneItem_cliLs_e2e(cli_with_fakes: main.Cli):
-  cli_with_fakes.dropbox.ls.return_value = SN(content=[
+  cli_with_fakes.dropbox.ls.return_value = iter([
     # just ensure the "necessary" fields are present to pass e2e tests
     SN(path='123', meta={'.tag': 'not_file'}),
   ])
 
   cli_with_fakes.ls('/mydir')
 
-  cli_with_fakes.dropbox.ls.assert_called_once_with('/mydir')
+  cli_with_fakes.dropbox.ls.assert_called_once_with(
+    '/mydir', recursive=False, exhaust=True)
 
 
 def test_noExistingFiles_cliPut_e2e(cli_with_fakes: main.Cli):
@@ -39,3 +48,192 @@ def test_noExistingFiles_cliPut_e2e(cli_with_fakes: main.Cli):
 
   cli_with_fakes.dropbox.save_url.assert_called_once()
 
+
+
+def test_planOnly_cliSync_listsOnceAndMovesNothing(cli_with_fakes: main.Cli, capsys):
+  f = lambda p, h: api.FileResponse.fromdict({
+    'id': p, 'name': p.rsplit('/', 1)[1], 'path_display': p,
+    'server_modified': '2023-01-01T00:00:00Z', 'content_hash': h})
+  cli_with_fakes.dropbox.ls.side_effect = [
+    [f('/a.pdf', 'new')], [f('/books/x/a.pdf', 'old')]]
+
+  cli_with_fakes.sync('/books', '/books/archive', plan_only=True)
+
+  assert cli_with_fakes.dropbox.ls.call_count == 2
+  cli_with_fakes.dropbox.search.assert_not_called()
+  cli_with_fakes.dropbox.mv.assert_not_called()
+  assert '/books/x/a.pdf' in capsys.readouterr().out
+
+
+def test_localDir_cliPut_uploadsAllAndCommitsOnce(
+    cli_with_fakes: main.Cli, tmp_path, capsys):
+  for rel in ('a.pdf', 'sub/b.pdf', '.hidden/c.pdf'):
+    (tmp_path / rel).parent.mkdir(exist_ok=True)
+    (tmp_path / rel).write_bytes(b'%PDF')
+  cli_with_fakes.dropbox.ls.return_value = []
+  cli_with_fakes.dropbox_content.up_session.side_effect = lambda fp: {
+    'session_id': fp.name, 'offset': 4}
+  cli_with_fakes.dropbox.finish_upload_batch.side_effect = lambda uploads: SN(
+    content=[api.FileResponse.fromdict({
+      'id': p, 'name': p, 'path_display': p, 'server_modified': None,
+      'content_hash': None}) for _, p in uploads])
+
+  cli_with_fakes.put(str(tmp_path), '/mydir', workers=2)
+
+  uploads, = cli_with_fakes.dropbox.finish_upload_batch.call_args.args
+  assert sorted(p for _, p in uploads) == ['/mydir/a.pdf', '/mydir/sub/b.pdf']
+  cli_with_fakes.content_dispatcher.assert_not_called()
+  assert capsys.readouterr().out.count('ok') == 2
+
+
+def test_unchangedLocalDir_cliPut_uploadsNothing(cli_with_fakes: main.Cli, tmp_path):
+  (tmp_path / 'a.pdf').write_bytes(b'%PDF')
+  cli_with_fakes.dropbox.ls.return_value = [api.FileResponse.fromdict({
+    'id': 'a', 'name': 'a.pdf', 'path_display': '/mydir/a.pdf',
+    'server_modified': None,
+    'content_hash': hashing.content_hash(tmp_path / 'a.pdf')})]
+
+  cli_with_fakes.put(str(tmp_path), '/mydir')
+
+  cli_with_fakes.dropbox_content.up_session.assert_not_called()
+  cli_with_fakes.dropbox.finish_upload_batch.assert_not_called()
+
+
+def test_oneFileChanged_cliMirror_downloadsOnlyThatOne(
+    cli_with_fakes: main.Cli, tmp_path):
+  (tmp_path / 'same.pdf').write_bytes(b'same')
+  (tmp_path / 'sub').mkdir()
+  (tmp_path / 'sub' / 'changed.pdf').write_bytes(b'old!')
+  f = lambda p, data: api.FileResponse.fromdict({
+    'id': p, 'name': p.rsplit('/', 1)[1], 'path_display': p,
+    'server_modified': None, 'size': len(data), 'rev': 'r',
+    'content_hash': hashing.content_hash(io.BytesIO(data))})
+  cli_with_fakes.dropbox.ls.return_value = [
+    f('/books/same.pdf', b'same'), f('/books/sub/changed.pdf', b'new!')]
+
+  cli_with_fakes.mirror('/books', str(tmp_path))
+
+  cli_with_fakes.dropbox_content.down.assert_called_once_with(
+    '/books/sub/changed.pdf', tmp_path / 'sub' / 'changed.pdf', rev='r')
+
+
+def test_listWithDupes_cliPutMany_transfersEachNewNameOnce(
+    cli_with_fakes: main.Cli, tmp_path, capsys):
+  (src := tmp_path / 'list.txt').write_text(
+    '# reading list\nhttps://x.org/a.pdf\nhttps://y.org/a.pdf\n\nb\nc  # old\n')
+  names = {'https://x.org/a.pdf': 'a.pdf', 'https://y.org/a.pdf': 'a.pdf',
+           'b': 'b.pdf', 'c': 'c.pdf'}
+  cli_with_fakes.content_dispatcher.side_effect = lambda item: iter(
+    [lambda i: (names[i], f'https://pdf/{i}')])
+  cli_with_fakes.dropbox.ls.return_value = [SN(name='C.pdf', path='/mydir/C.pdf')]
+  cli_with_fakes.notion = mock.Mock(spec_set=api.Notion)
+
+  cli_with_fakes.put_many(str(src), '/mydir', workers=3)
+
+  saved = sorted(c.args[1] for c in cli_with_fakes.dropbox.save_url.call_args_list)
+  assert saved == ['/mydir/a.pdf', '/mydir/b.pdf']
+  assert cli_with_fakes.notion.add_page.call_count == 2
+  cli_with_fakes.dropbox.ls.assert_called_once()
+  cli_with_fakes.dropbox.search.assert_not_called()
+  out = capsys.readouterr().out.splitlines()
+  assert [line.split()[0] for line in out] == ['ok', 'skipped', 'ok', 'skipped']
+
+
+def test_deferredPut_cliOutboxDrain_resumesAfterLastStep(
+    cli_with_fakes: main.Cli, tmp_path):
+  cli_with_fakes._journal = outbox = ob.Outbox(tmp_path / 'db.sqlite')
+  outbox.BACKOFF = retry.RetryPolicy(base=0.)
+  cli_with_fakes.content_dispatcher.return_value = iter([lambda *_: ('f.pdf', 'url')])
+  cli_with_fakes.dropbox.save_url.return_value = SN(content={'async_job_id': 'j'})
+  cli_with_fakes.dropbox.save_url_status.return_value = {'.tag': 'complete'}
+  cli_with_fakes.notion = mock.Mock(spec_set=api.Notion)
+  cli_with_fakes.notion.add_page.side_effect = [Exception('down'), {'id': 'pg'}]
+
+  cli_with_fakes.put('item', '/mydir', defer=True)
+  cli_with_fakes.dropbox.save_url.assert_not_called()
+  cli_with_fakes.outbox('drain', workers=1)
+  cli_with_fakes.outbox('drain', workers=1)
+
+  cli_with_fakes.dropbox.save_url.assert_called_once_with('url', '/mydir/f.pdf')
+  cli_with_fakes.content_dispatcher.assert_called_once()
+  assert cli_with_fakes.notion.add_page.call_count == 2
+  entry, = outbox.entries(ob.DONE)
+  assert (entry.transfer, entry.notion, entry.attempts) == ('done', 'pg', 1)
+
+
+def test_deadlinePassed_cliOutboxDrain_leavesEntriesQueued(
+    cli_with_fakes: main.Cli, tmp_path):
+  cli_with_fakes._journal = outbox = ob.Outbox(tmp_path / 'db.sqlite')
+  cli_with_fakes.put('item', '/mydir', defer=True)
+
+  with dl.scope(0.):
+    cli_with_fakes.outbox('drain', workers=2)
+
+  cli_with_fakes.content_dispatcher.assert_not_called()
+  assert len(outbox.entries(ob.PENDING)) == 1
+
+
+def test_datedDirCreatedOnce_cliPut_skipsMkdirNextTime(
+    cli_with_fakes: main.Cli, tmp_path):
+  cli_with_fakes.folders = cache.Folders(tmp_path / 'db.sqlite')
+  cli_with_fakes.content_dispatcher.side_effect = lambda _: iter(
+    [lambda *_: ('fname', 'url')])
+  cli_with_fakes.dropbox.search.return_value = SN(content=[])
+
+  cli_with_fakes.put('item')
+  cli_with_fakes.put('item')
+  cli_with_fakes.folders = cache.Folders(tmp_path / 'db.sqlite')
+  cli_with_fakes.put('item')
+
+  cli_with_fakes.dropbox.mkdir.assert_called_once()
+  assert cli_with_fakes.dropbox.save_url.call_count == 3
+
+
+def test_knownName_cliPut_searchesWhileResolvingAndPreparesNotion(
+    cli_with_fakes: main.Cli):
+  searching = threading.Event()
+  meta = main.CME.Response(meta={}, title='T', pdf_url='https://arxiv.org/pdf/1.pdf')
+
+  def resolve(_):
+    assert searching.wait(5)  # the metadata fetch is still going on
+    return ('1_T.pdf', meta), meta.pdf_url
+  cli_with_fakes.content_dispatcher.return_value = iter([resolve])
+  cli_with_fakes.dropbox.search.side_effect = lambda *_, **__: (
+    searching.set() or SN(content=[SN(name='mine.pdf')]))
+  cli_with_fakes.notion = notion = mock.Mock(spec_set=api.Notion)
+  prepared = []
+
+  with mock.patch.object(cli, 'prompt', side_effect=lambda *_: (
+      prepared.append(notion.paper_page.called) or 'y')):
+    cli_with_fakes.put('1', '/mydir', name='mine.pdf')
+
+  cli_with_fakes.dropbox.search.assert_called_once_with(
+    'mine.pdf', file_extensions=['pdf'])
+  assert prepared == [True]
+  notion.add_page.assert_called_once_with(notion.paper_page.return_value)
+  cli_with_fakes.dropbox.save_url.assert_called_once_with(
+    meta.pdf_url, '/mydir/mine.pdf')
+
+
+def test_secondRun_cliMetafix_onlyLooksAtNewFiles(
+    cli_with_fakes: main.Cli, tmp_path, capsys):
+  f = lambda p, h: api.FileResponse.fromdict({
+    'id': p, 'name': p.rsplit('/', 1)[1], 'path_display': p,
+    'server_modified': None, 'content_hash': h})
+  old, new = f('/p/2011.14522.pdf', 'h1'), f('/p/2101.00001.pdf', 'h2')
+  cli_with_fakes.examined = cache.Examined(tmp_path / 'db.sqlite', 'metafix')
+  cli_with_fakes.content_dispatcher.side_effect = lambda name: iter(
+    [lambda n: (('Title' + n, {}), 'url')])
+  cli_with_fakes.dropbox.mv_batch.side_effect = lambda moves: SN(
+    content=[f(dst, 'h') for _, dst in moves])
+
+  cli_with_fakes.dropbox.search.return_value = [old]
+  cli_with_fakes.metafix(workers=2)
+  cli_with_fakes.dropbox.search.return_value = [old, new]
+  cli_with_fakes.metafix(workers=2, dry_run=True)
+  cli_with_fakes.metafix(workers=2)
+
+  first, second = cli_with_fakes.dropbox.mv_batch.call_args_list
+  assert first.args[0] == [('/p/2011.14522.pdf', '/p/Title2011.14522.pdf')]
+  assert second.args[0] == [('/p/2101.00001.pdf', '/p/Title2101.00001.pdf')]
+  assert '/p/Title2101.00001.pdf' in capsys.readouterr().out
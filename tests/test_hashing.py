@@ -0,0 +1,33 @@
+import hashlib
+import io
+
+import pytest
+
+from tk.dbox.utils import hashing
+
+
+def _reference(data: bytes, block: int) -> str:
+  digests = b''.join(
+    hashlib.sha256(data[i:i + block]).digest() for i in range(0, len(data), block))
+  return hashlib.sha256(digests).hexdigest()
+
+
+@pytest.mark.parametrize('size', [0, 5, 16, 17, 40])
+def test_sizesAroundBlocks_contentHash_matchesDropboxAlgorithm(
+    size, tmp_path, monkeypatch):
+  monkeypatch.setattr(hashing, 'BLOCK_SIZE', 4)
+  monkeypatch.setattr(hashing, 'PARALLEL_BLOCKS', 2)  # >8 bytes: threads+mmap
+  data = bytes(range(size))
+  (path := tmp_path / 'f.pdf').write_bytes(data)
+
+  assert hashing.content_hash(path) == _reference(data, 4)
+  assert hashing.content_hash(io.BytesIO(data)) == _reference(data, 4)
+
+
+def test_openFile_contentHash_keepsPosition(tmp_path):
+  (path := tmp_path / 'f.pdf').write_bytes(b'%PDF-1.4')
+
+  with path.open('rb') as fp:
+    fp.read(2)
+    hashing.content_hash(fp)
+    assert fp.read() == b'DF-1.4'
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from tk.dbox import api
+from tk.dbox import httpcache
+from tk.dbox import ratelimit
+from tk.dbox.provider import auto
+
+from tests.fakes import FakeTransport, response
+
+URL = 'https://openreview.net/forum?id=abc'
+
+
+@pytest.fixture
+def cache(tmp_path) -> httpcache.HttpCache:
+  return httpcache.HttpCache(tmp_path / 'http.sqlite')
+
+
+def _html(transport, cache) -> api.GenericHtml:
+  html = api.GenericHtml(transport, http_cache=cache)
+  html.limiter = ratelimit.RateLimiter({})
+  return html
+
+
+def test_freshResponse_get_servedWithoutRequest(cache):
+  transport = FakeTransport(response(body=b'<html>v1</html>', headers={
+    'Cache-Control': 'max-age=600', 'Content-Type': 'text/html'}))
+
+  first = _html(transport, cache).get(URL)
+  second = _html(transport, cache).get(URL)
+
+  assert first == second == '<html>v1</html>'
+  assert len(transport.calls) == 1
+
+
+def test_staleWithEtag_get_revalidatesAndServes304FromCache(cache):
+  transport = FakeTransport(
+    response(body=b'<html>v1</html>', headers={
+      'ETag': '"v1"', 'Cache-Control': 'no-cache'}),
+    response(304, headers={'ETag': '"v1"', 'Cache-Control': 'max-age=600'}))
+  html = _html(transport, cache)
+
+  html.get(URL)
+  assert html.get(URL) == '<html>v1</html>'
+  assert html.get(URL) == '<html>v1</html>'  # fresh after the 304
+
+  assert len(transport.calls) == 2
+  _, _, kwargs = transport.calls[1]
+  assert kwargs['headers']['If-None-Match'] == '"v1"'
+
+
+def test_noStoreOrNoValidators_put_notCached(cache):
+  assert cache.put(URL, response(body=b'x', headers={
+    'Cache-Control': 'no-store', 'ETag': '"x"'})) is None
+  assert cache.put(URL, response(body=b'x')) is None
+  assert cache.get(URL) is None
+
+
+def test_overMaxBytes_evict_dropsLeastRecentlyUsed(cache):
+  cache.max_bytes = 10
+  fresh = {'Cache-Control': 'max-age=60'}
+  cache.put('a', response(body=b'aaaa', headers=fresh))
+  cache.put('b', response(body=b'bbbb', headers=fresh))
+  cache.get('a')
+  cache.put('c', response(body=b'cccc', headers=fresh))
+
+  assert [cache.get(u) is not None for u in 'abc'] == [True, False, True]
+
+
+def test_streamedPages_dispatcher_storesAndRevalidates(cache):
+  with open(os.path.join(os.path.dirname(__file__), 'data', 'arxiv.html'), 'rb') as f:
+    page = f.read()
+  transport = FakeTransport(
+    response(body=page, headers={'ETag': '"v1"', 'Cache-Control': 'no-cache'}),
+    response(304, headers={'ETag': '"v1"', 'Cache-Control': 'max-age=600'}))
+  dispatcher = auto.Dispatcher(_html(transport, cache))
+
+  results = [dispatcher._review(URL) for _ in range(3)]
+
+  assert results[0] == results[1] == results[2]
+  entry = cache.get(URL)  # just as far as parsing went
+  assert entry.partial and page.startswith(entry.body) and b'</head>' in entry.body
+  assert len(entry.body) < len(page)
+  assert len(transport.calls) == 2
+  _, _, kwargs = transport.calls[1]
+  assert kwargs['headers']['If-None-Match'] == '"v1"'
+
+
+def test_partiallyCachedPage_getAndFullStream_fetchTheRest(cache):
+  page = b'<html><head></head><body>' + b'x' * 2**16 + b'</body></html>'
+  headers = {'ETag': '"v1"', 'Cache-Control': 'max-age=600'}
+  transport = FakeTransport(*(response(body=page, headers=headers) for _ in range(3)))
+  html = _html(transport, cache)
+  stream = html.stream(URL, chunk_size=10)
+  next(stream)
+  stream.close()
+
+  assert cache.get(URL).body == page[:10]
+  assert html.get(URL) == page.decode()
+  assert cache.get(URL).body == page and not cache.get(URL).partial
+  cache.put(URL, response(body=page, headers=headers), page[:10], partial=True)
+  assert b''.join(html.stream(URL, chunk_size=10)) == page
+  assert len(transport.calls) == 3
+  assert all('If-None-Match' not in kw['headers'] for _, _, kw in transport.calls)
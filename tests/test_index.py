@@ -0,0 +1,77 @@
+from unittest import mock
+
+import pytest
+
+from tk.dbox import api
+from tk.dbox import index as idx
+
+
+def _file(path: str, **kw) -> api.FileResponse:
+  return api.FileResponse.fromdict({
+    '.tag': 'file', 'id': f'id:{path}', 'name': path.rsplit('/', 1)[1],
+    'path_display': path, 'path_lower': path.lower(),
+    'server_modified': '2023-01-02T03:04:05Z', 'content_hash': 'h', 'size': 3,
+    **kw})
+
+
+def _pages(entries, cursor):
+  pages = mock.MagicMock()
+  pages.__iter__.return_value = iter(entries)
+  pages.cursor = cursor
+  return pages
+
+
+@pytest.fixture
+def dropbox():
+  dropbox = mock.Mock(spec_set=api.Dropbox)
+  dropbox.latest_cursor.return_value = 'c0'
+  dropbox.ls.return_value = _pages([
+    _file('/books/A.pdf'),
+    _file('/books/nlp/B.pdf'),
+    api.FileResponse.fromdict({
+      '.tag': 'folder', 'id': 'id:nlp', 'name': 'nlp',
+      'path_display': '/books/nlp', 'server_modified': None,
+      'content_hash': None}),
+    _file('/Root Paper.pdf'),
+  ], 'c-full')
+  return dropbox
+
+
+def test_firstRefresh_refresh_listsAllAndKeepsLatestCursor(dropbox):
+  index = idx.Index(':memory:')
+
+  assert index.refresh(dropbox) == 4
+
+  dropbox.latest_cursor.assert_called_once_with('', recursive=True, include_deleted=True)
+  assert index.cursor('') == 'c0'
+  assert [f.path for f in index.ls('/books')] == ['/books/A.pdf', '/books/nlp']
+  assert [f.path for f in index.ls('/books', recursive=True)] == [
+    '/books/A.pdf', '/books/nlp', '/books/nlp/B.pdf']
+  assert index.ls('/')[-1].name == 'Root Paper.pdf'
+
+
+def test_savedCursor_refresh_appliesOnlyDelta(dropbox):
+  index = idx.Index(':memory:')
+  index.refresh(dropbox)
+  dropbox.ls.return_value = _pages([
+    {'.tag': 'deleted', 'name': 'nlp', 'path_lower': '/books/nlp',
+     'path_display': '/books/nlp'},
+    _file('/books/C.pdf', content_hash='new'),
+  ], 'c1')
+
+  assert index.refresh(dropbox, '/books') == 2
+
+  dropbox.ls.assert_called_with('', recursive=True, exhaust=True, cursor='c0')
+  assert index.cursor('') == 'c1'
+  assert [f.name for f in index.ls('/books', recursive=True)] == ['A.pdf', 'C.pdf']
+  assert index.search('c', file_extensions=['pdf'])[0].hash == 'new'
+
+
+def test_words_search_matchesAllWordsCaseInsensitive(dropbox):
+  index = idx.Index(':memory:')
+  index.refresh(dropbox)
+
+  assert [f.path for f in index.search('root PAPER')] == ['/Root Paper.pdf']
+  assert [f.path for f in index.search('pdf', path='/books/nlp')] == [
+    '/books/nlp/B.pdf']
+  assert index.search('b', file_extensions=['epub']) == []
@@ -0,0 +1,41 @@
+import os
+
+from tk.dbox.provider import meta
+
+with open(os.path.join(os.path.dirname(__file__), 'data', 'arxiv.html'), 'rb') as f:
+  PAGE = f.read()
+
+
+def _fetcher(**kw) -> meta.WithHtmlFetcher:
+  return meta.WithHtmlFetcher(
+    lambda _: PAGE.decode('utf8'), pdfurl='https://arxiv.org/pdf/{id}.pdf',
+    absurl='https://arxiv.org/abs/{id}', **kw)
+
+
+def test_streamedPage_withHtmlFetcher_stopsReadingAfterHead():
+  read, closed = [], []
+
+  def stream(url):
+    try:
+      for i in range(0, len(PAGE), 1024):
+        read.append(PAGE[i:i + 1024])
+        yield read[-1]
+    finally:
+      closed.append(url)
+
+  (_, streamed), _ = _fetcher(html_stream=stream)('2106.09608')
+  (_, whole), _ = _fetcher()('2106.09608')
+
+  assert streamed == whole
+  assert streamed.paper_id == '2106.09608' and streamed.author
+  assert sum(map(len, read)) < PAGE.index(b'</head>') + 1024 < len(PAGE)
+  assert closed == ['https://arxiv.org/abs/2106.09608']
+
+
+def test_pastHead_citationMetaExtractor_ignoresTheRest():
+  extractor = meta.CitationMetaExtractor()
+
+  assert extractor.feed(
+    '<head><meta name="citation_title" content="A"><meta name="x"></head>')
+  assert extractor.feed('<meta name="citation_title" content="B">')
+  assert extractor.description == {'title': 'A'}
@@ -0,0 +1,52 @@
+from tk.dbox import outbox as ob
+from tk.dbox import retry
+
+
+def test_sameArgsTwice_add_queuesOnce(tmp_path):
+  outbox = ob.Outbox(tmp_path / 'db.sqlite')
+
+  first, new1 = outbox.add({'item': 'x', 'dir': '/papers'})
+  second, new2 = outbox.add({'dir': '/papers', 'item': 'x'})
+
+  assert (new1, new2) == (True, False)
+  assert first.id == second.id
+  assert len(outbox.entries()) == 1
+
+
+def test_twoDrainers_claim_eachEntryOnce(tmp_path):
+  outbox = ob.Outbox(tmp_path / 'db.sqlite')
+  other = ob.Outbox(tmp_path / 'db.sqlite')
+  outbox.add({'item': 'a'})
+  outbox.add({'item': 'b'})
+
+  claimed = [outbox.claim(), other.claim(), outbox.claim()]
+
+  assert [e and e.args['item'] for e in claimed] == ['a', 'b', None]
+  assert {e.state for e in outbox.entries()} == {ob.RUNNING}
+
+
+def test_checkpointThenFailures_fail_keepsStepsAndGivesUpEventually(tmp_path):
+  outbox = ob.Outbox(tmp_path / 'db.sqlite')
+  outbox.BACKOFF = retry.RetryPolicy(max_attempts=2, base=0.)
+  outbox.add({'item': 'a'})
+  entry = outbox.claim()
+  outbox.checkpoint(entry, resolved={'fname': 'a.pdf'}, path='/p/a.pdf')
+
+  assert outbox.fail(entry, Exception('boom'))
+  entry = outbox.claim()
+  assert entry.resolved == {'fname': 'a.pdf'} and entry.path == '/p/a.pdf'
+  assert not outbox.fail(entry, Exception('boom again'))
+
+  assert outbox.claim() is None
+  failed, = outbox.entries(ob.FAILED)
+  assert (failed.attempts, failed.error) == (2, 'boom again')
+  assert outbox.retry() == 1 and outbox.claim().id == failed.id
+
+
+def test_staleClaim_claim_takesOver(tmp_path):
+  outbox = ob.Outbox(tmp_path / 'db.sqlite')
+  outbox.add({'item': 'a'})
+  outbox.claim()
+  outbox.STALE = -1.
+
+  assert outbox.claim().args == {'item': 'a'}
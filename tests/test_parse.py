@@ -3,11 +3,17 @@ import os
 from tk.dbox.provider import arxiv
 
 
+def _fetcher() -> arxiv.ExportApiFetcher:
+  return arxiv.ExportApiFetcher(
+    None, pdfurl='https://arxiv.com/pdf/{id}.pdf',
+    absurl='https://arxiv.com/abs/{id}')
+
+
 def test_arxivPage_parse_extractsMetadata():
   with open(os.path.join(os.path.dirname(__file__), 'data/arxiv.html')) as f:
-    description = arxiv.meta_from_arxiv(f.read())
+    description = _fetcher()._get_meta(f.read())
 
-  assert description.arxiv_id == '2106.09608'
+  assert description.paper_id == '2106.09608'
   assert description.title == 'Learning Knowledge Graph-based World Models of Textual Environments'
 
 
@@ -17,6 +23,7 @@ def test_arxivPage_parse_extractsMetadata():
   'https://arxiv.com/abs/123.123.pdf',
 ])
 def test_validArxivInputs_geturl_returnsArxivUrl(valid_input):
-  assert arxiv.absurl(valid_input) == 'https://arxiv.com/abs/123.123'
-  assert arxiv.pdfurl(valid_input) == 'https://arxiv.com/pdf/123.123.pdf'
-
+  fetcher = _fetcher()
+  id = fetcher._get_id(valid_input)
+  assert fetcher.mk_absurl(id) == 'https://arxiv.com/abs/123.123'
+  assert fetcher.mk_pdfurl(id) == 'https://arxiv.com/pdf/123.123.pdf'
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from tk.dbox import ratelimit
+
+
+class Clock:
+  def __init__(self):
+    self.now = 0.
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, s: float):
+    self.now += s
+
+
+def test_burstExhausted_reserve_spacesRequestsAtRate():
+  clock = Clock()
+  bucket = ratelimit.TokenBucket(2., 2, clock=clock, sleep=clock.sleep)
+
+  waits = [bucket.reserve() for _ in range(4)]
+
+  assert waits == [0., 0., 0.5, 1.]
+
+
+def test_retryAfter_throttle_blocksAndHalvesRate():
+  clock = Clock()
+  bucket = ratelimit.TokenBucket(4., 4, clock=clock, sleep=clock.sleep)
+
+  bucket.throttle(retry_after=3.)
+
+  assert bucket.rate == 2.
+  assert bucket.reserve() == pytest.approx(3.5)
+  for _ in range(100):
+    bucket.relax()
+  assert bucket.rate == bucket.nominal
+
+
+def test_waitLongerThanTimeout_acquire_raisesWithoutTakingToken():
+  clock = Clock()
+  bucket = ratelimit.TokenBucket(1., 1, clock=clock, sleep=clock.sleep)
+  bucket.acquire()
+
+  with pytest.raises(ratelimit.RateLimitTimeout):
+    bucket.acquire(timeout=0.5)
+  assert bucket.acquire() == 1.
+
+
+@pytest.mark.parametrize('url,host', [
+  ('https://api.notion.com/v1/pages', 'api.notion.com'),
+  ('https://www.arxiv.org/abs/1234.12345', 'arxiv.org'),
+  ('https://example.org/x', None),
+])
+def test_url_limiter_picksHostBucket(url, host):
+  limiter = ratelimit.RateLimiter()
+  assert limiter._host(url) == host
+
+
+def test_manyThreads_acquire_allReservationsDistinct():
+  clock = Clock()
+  bucket = ratelimit.TokenBucket(10., 1, clock=clock, sleep=lambda _: None)
+  waits = []
+  threads = [
+    threading.Thread(target=lambda: waits.append(bucket.reserve()))
+    for _ in range(50)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+
+  assert sorted(waits) == pytest.approx([i / 10 for i in range(50)])
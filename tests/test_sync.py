@@ -0,0 +1,40 @@
+from tk.dbox import api
+from tk.dbox import sync
+
+
+def _file(path: str, hash: str = 'h', modified: str = '2023-01-02T00:00:00Z'):
+  return api.FileResponse.fromdict({
+    '.tag': 'file', 'id': f'id:{path}', 'name': path.rsplit('/', 1)[1],
+    'path_display': path, 'server_modified': modified, 'content_hash': hash})
+
+
+def test_annotatedRootFile_plan_archivesAndReplaces():
+  root = [_file('/Attention.pdf', hash='new', modified='2023-02-01T00:00:00Z'),
+          _file('/notes.txt')]
+  synced = [_file('/books/nlp/Attention.pdf', hash='old'),
+            _file('/books/archive/Attention.pdf', hash='older')]
+
+  plan = sync.plan(root, synced, '/books', '/books/archive')
+
+  step, = plan.steps
+  assert step.archive == sync.Move(
+    '/books/nlp/Attention.pdf', '/books/archive/Attention.pdf')
+  assert step.replace == sync.Move('/Attention.pdf', '/books/nlp/Attention.pdf')
+
+
+def test_sameHashOrNewerCopy_plan_skips():
+  root = [_file('/Same.pdf', hash='x'),
+          _file('/Older.pdf', hash='a', modified='2023-01-01T00:00:00Z'),
+          _file('/Unknown.pdf')]
+  synced = [_file('/books/Same.pdf', hash='x'),
+            _file('/books/b/Older.pdf', hash='b', modified='2023-03-01T00:00:00Z')]
+
+  plan = sync.plan(root, synced, '/books', '/books/archive')
+
+  assert plan.steps == []
+  assert plan.skipped == {
+    'hash': [('/Same.pdf', '/books/Same.pdf')],
+    'modtime': [('/Older.pdf', '/books/b/Older.pdf')],
+  }
+  assert plan.unmatched == ['/Unknown.pdf']
+  assert '0 file(s) to sync' in str(plan)
@@ -1,6 +1,17 @@
+import argparse
+import os
+import random
+import re
+import time
+
 import pytest
+from tk.dbox.utils import cli
 from tk.dbox.utils import text
 
+# what `is_url` used to be, minus the `Ja` TLD typo; cf. `tests/bench.py`
+with open(os.path.join(os.path.dirname(__file__), 'data', 'url_regex.txt')) as f:
+  OLD_RE_URL = re.compile(f.read().strip().replace('|Ja|', '|'))
+
 @pytest.mark.parametrize('input_str', [
   'Ok Computer CAMEL-CASE.pdf',
   'ok%2ccomputer---camel//case.pdf',
@@ -29,3 +40,88 @@ def test_inputUrlMultiplePdf_potentialNames_extractsAllPdfNamesByLikelihood():
     'X.pdf'
   ]
 
+
+
+def test_bibEntries_bibItems_prefersEprintThenUrlThenDoi():
+  bib = '''
+@article{a, title={A}, eprint = {2011.14522}, url={https://x.org/a}}
+@inproceedings{b,
+  title = "B",
+  url = "https://aclanthology.org/2020.acl-main.1.pdf",
+}
+@book{c, doi={10.1000/xyz}}
+@misc{d, title={Nothing}}
+'''
+  assert list(text.bib_items(bib)) == [
+    '2011.14522',
+    'https://aclanthology.org/2020.acl-main.1.pdf',
+    'https://doi.org/10.1000/xyz',
+  ]
+
+
+@pytest.mark.parametrize('s,expected', [
+  ('https://arxiv.org/pdf/2011.14522.pdf', True),
+  ('http://openreview.net/forum?id=abc', True),
+  ('HTTPS://aclanthology.org/2020.acl-main.1.pdf', True),
+  ('https://en.wikipedia.org/wiki/Foo_(bar)', True),
+  ('arxiv.org/abs/2011.14522', True),
+  ('x.ai', True),
+  ('script.py', True),  # `.py` is a TLD after all
+  ('2011.14522', False),
+  ('2011.14522.pdf', False),
+  ('/home/me/paper.pdf', False),
+  ('file:///home/me/paper.pdf', False),
+  ('user@x.com', False),
+  ('x.com@', False),
+  ('http://', False),
+  ('http://...', False),
+  ('', False),
+])
+def test_inputs_isUrl_classifiesAsBefore(s: str, expected: bool):
+  assert text.is_url(s) == expected
+  assert bool(OLD_RE_URL.match(s)) == expected
+
+
+def test_randomShortInputs_isUrl_agreesWithOldRegex():
+  rng = random.Random(0)
+  pieces = [
+    'http://', 'https:', 'HTTP:', 'arxiv', '.org', '.ai', '.co', 'x.com', '.pdf',
+    '/', '(', ')', '[', '.', '-', '@', '_', ',', '%', ' ', 'a', '1', 'é', '«']
+  for _ in range(20_000):
+    s = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+    assert text.is_url(s) == bool(OLD_RE_URL.match(s)), s
+
+
+@pytest.mark.parametrize('make', [
+  lambda n: 'http://' + '.' * n,  # exponential for the old regex
+  lambda n: 'http://' + '(' * n,
+  lambda n: 'http://x' + '(a' * n,
+  lambda n: 'a.' * n + '@',
+  lambda n: 'a-' * n + '.com',
+  lambda n: 'a' * n + '.com/' + ',' * n,
+  lambda n: 'x.com/(' + 'a' * n,
+])
+def test_pathologicalInputs_isUrl_runsInLinearTime(make):
+  def took(n):
+    s = make(n)
+    start = time.perf_counter()
+    text.is_url(s)
+    return time.perf_counter() - start
+  small, large = took(10_000), took(100_000)
+  assert large < 1.
+  # 10x the input, well under 100x the time (with some slack for noise)
+  assert large < 50 * small + .05
+
+
+class _Cmds:
+  def put_many(self, source: str, dry_run: bool = False):
+    pass
+
+
+@pytest.mark.parametrize('cmd', ['put_many', 'put-many'])
+def test_underscoredMethod_cliFromInstancemethods_acceptsDashedCommand(cmd: str):
+  method, args = cli.cli_from_instancemethods(
+    _Cmds, argparse.ArgumentParser(add_help=False), argv=[cmd, 'a.txt', '--dry-run'])
+
+  assert method is _Cmds.put_many
+  assert args == {'source': 'a.txt', 'dry_run': True}
@@ -0,0 +1,100 @@
+import os
+import signal
+from unittest import mock
+
+import pytest
+
+from tk.dbox import api
+from tk.dbox import index as idx
+from tk.dbox import main
+from tk.dbox import watch
+from tk.dbox.provider import auto
+
+
+def _file(path: str, **kw) -> api.FileResponse:
+  return api.FileResponse.fromdict({
+    '.tag': 'file', 'id': f'id:{path}', 'name': path.rsplit('/', 1)[1],
+    'path_display': path, 'path_lower': path.lower(),
+    'server_modified': '2023-01-02T03:04:05Z', 'content_hash': 'h', **kw})
+
+
+def _pages(entries, cursor):
+  pages = mock.MagicMock()
+  pages.__iter__.return_value = iter(entries)
+  pages.cursor = cursor
+  return pages
+
+
+@pytest.fixture
+def dropbox():
+  dropbox = mock.Mock(spec_set=api.Dropbox)
+  dropbox.latest_cursor.return_value = 'c0'
+  dropbox.ls.return_value = _pages([_file('/books/nlp/Paper.pdf')], 'c-full')
+  return dropbox
+
+
+@pytest.fixture
+def index(dropbox):
+  index = idx.Index(':memory:')
+  index.refresh(dropbox)
+  return index
+
+
+def test_changesReported_step_handsOverLatestDelta(dropbox, index):
+  dropbox.longpoll.return_value = {'changes': True}
+  dropbox.ls.return_value = _pages([
+    _file('/Paper.pdf'),
+    _file('/Gone.pdf'),
+    {'.tag': 'deleted', 'path_lower': '/gone.pdf', 'path_display': '/Gone.pdf'},
+  ], 'c1')
+  on_change = mock.Mock()
+
+  watch.Watcher(dropbox, index, on_change, debounce=0).step()
+
+  dropbox.longpoll.assert_called_once_with('c0', 30)
+  dropbox.ls.assert_called_with('', recursive=True, exhaust=True, cursor='c0')
+  (changes, reset), _ = on_change.call_args
+  assert not reset
+  assert [c.name if isinstance(c, api.FileResponse) else c['.tag']
+          for c in changes] == ['Paper.pdf', 'deleted']
+  assert index.cursor('') == 'c1'
+
+
+def test_noChangesWithBackoff_step_waitsWithoutListing(dropbox, index):
+  dropbox.longpoll.return_value = {'changes': False, 'backoff': 5}
+  w = watch.Watcher(dropbox, index, on_change := mock.Mock())
+  w.stop = mock.Mock(**{'is_set.return_value': False, 'wait.return_value': False})
+
+  w.step()
+
+  w.stop.wait.assert_called_once_with(5)
+  assert dropbox.ls.call_count == 1  # just the initial listing
+  on_change.assert_not_called()
+
+
+def test_newRootPdfThenSigint_cliWatch_syncsAndStops(dropbox, index):
+  polls = []
+
+  def longpoll(cursor, timeout):
+    polls.append(cursor)
+    if len(polls) > 1:  # NB, the handler runs in the main thread
+      os.kill(os.getpid(), signal.SIGINT)
+      return {'changes': False}
+    return {'changes': True}
+  dropbox.longpoll.side_effect = longpoll
+  dropbox.ls.return_value = _pages([_file('/Paper.pdf', content_hash='new')], 'c1')
+  dropbox.mv_batch.side_effect = lambda moves: mock.Mock(
+    content=[_file(dst) for _, dst in moves])
+  cli = main.Cli(
+    dropbox, mock.Mock(spec_set=api.DropboxContent),
+    mock.Mock(spec_set=auto.Dispatcher), index=index)
+
+  cli.watch(debounce=0)
+
+  assert polls == ['c0', 'c1']
+  archive, replace = [c.args[0] for c in dropbox.mv_batch.call_args_list]
+  assert [(s.path, d) for s, d in archive] == [
+    ('/books/nlp/Paper.pdf', '/books/archive/Paper.pdf')]
+  assert [(s.path, d) for s, d in replace] == [
+    ('/Paper.pdf', '/books/nlp/Paper.pdf')]
+  assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
@@ -0,0 +1,356 @@
+"""asyncio counterparts of the `tk.dbox.api` clients.
+
+Same method surface, same `wrap`/`_remap_out` response mapping, same retry,
+rate limiting and deadline handling; many calls can be in flight on one event
+loop. Needs `aiohttp` (`pip install tkdbox[async]`).
+
+  async with AsyncDropbox(token) as dropbox:
+    files = await asyncio.gather(*(dropbox.search(n) for n in names))
+"""
+import asyncio
+import collections
+import functools
+import io
+import logging
+import typing as ty
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+  import aiohttp
+except ImportError as e:  # pragma: no cover
+  raise ImportError('tk.dbox.aio needs aiohttp: pip install tkdbox[async]') from e
+
+from tk.dbox import api
+from tk.dbox import auth as oauth
+from tk.dbox import deadline as dl
+from tk.dbox import ratelimit
+from tk.dbox import retry
+
+L = logging.getLogger(__name__)
+
+TRANSPORT_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+def awrap(extract_key: ty.Optional[str] = None):
+  '''Async `api.wrap`: awaits the endpoint, then remaps inputs/outputs.'''
+  extract = (lambda d: d.pop(extract_key)) if extract_key else (lambda d: d)
+  def _wrap(f: ty.Callable):
+    @functools.wraps(f)
+    async def _inner(*args, **kwargs):
+      res = await f(*map(api._remap_in, args), **kwargs)
+      content = api._remap_out(extract(res))
+      return api.GenericResponse(meta=res, content=content)
+    return _inner
+  return _wrap
+
+
+def same_as(method: ty.Callable) -> ty.Callable:
+  '''Reuse the body of a single-request `@wrap`ped blocking method.
+
+  With an async `post` the body returns a coroutine, which `awrap` awaits.
+  '''
+  return awrap(method.extract_key)(method.__wrapped__)
+
+
+def _to_response(r: aiohttp.ClientResponse, body: bytes) -> requests.Response:
+  """Convert so that `retry` & `Api._response_matcher` work unchanged."""
+  response = requests.Response()
+  response.status_code = r.status
+  response.headers = CaseInsensitiveDict(r.headers)
+  response.url = str(r.url)
+  response._content = body
+  response._content_consumed = True  # read already; e.g. `close` is a no-op
+  return response
+
+
+class AsyncPages(ty.AsyncIterable[api.T]):
+  """Async `api.Pages`: prefetches the next page as a task.
+
+  `async for` streams; `await pages` collects everything into `.content`.
+  """
+
+  def __init__(
+      self,
+      first: ty.Callable[[], ty.Awaitable[api.GenericResponse]],
+      more: ty.Optional[ty.Callable[[str], ty.Awaitable[api.GenericResponse]]] = None):
+    self._first = first
+    self._more = more
+    self._content: ty.Optional[list[api.T]] = None
+    self.meta: dict = {}
+    self.cursor: ty.Optional[str] = None
+
+  def __aiter__(self) -> ty.AsyncIterator[api.T]:
+    return self._iter()
+
+  async def _iter(self) -> ty.AsyncIterator[api.T]:
+    if self._content is not None:
+      for item in self._content:
+        yield item
+      return
+    upcoming = None
+    try:
+      page = await self._first()
+      while True:
+        upcoming = None
+        if cursor := self._next_cursor(page):
+          upcoming = asyncio.ensure_future(self._more(cursor))
+        for item in page.content:
+          yield item
+        self.cursor = page.meta.get('cursor', self.cursor)
+        if upcoming is None:
+          return
+        page = await upcoming
+    finally:
+      if upcoming is not None and not upcoming.done():
+        upcoming.cancel()
+
+  _next_cursor = api.Pages._next_cursor
+
+  async def _collect(self) -> 'AsyncPages[api.T]':
+    if self._content is None:
+      self._content = [item async for item in self]
+    return self
+
+  def __await__(self):
+    return self._collect().__await__()
+
+  @property
+  def content(self) -> list[api.T]:
+    if self._content is None:
+      raise RuntimeError('`await` the pages first')
+    return self._content
+
+
+class AsyncApi:
+
+  def __init__(
+      self,
+      base: str,
+      auth: dict,
+      session: ty.Optional[aiohttp.ClientSession] = None,
+      pool_size: int = 100):
+    """Cf. `api.Api`. Pass `session` to share one connection pool."""
+    self.base = base
+    self.auth_headers = {}
+    self.auth = None
+    self.credentials: ty.Optional[oauth.Credentials] = None
+    if (u := auth.get('username')) and (p := auth.get('password')):
+        self.auth = aiohttp.BasicAuth(u, p)
+    else:
+        self.auth_headers = auth
+    self._session = session
+    self._owns_session = session is None
+    self.pool_size = pool_size
+    self._limiter: ty.Optional[ratelimit.RateLimiter] = None
+    self.retry = retry.RetryPolicy()
+    self.hedge_after: ty.Optional[float] = None
+    self.stats: ty.Deque[retry.CallStats] = collections.deque(maxlen=1024)
+
+  url = api.Api.url
+  limiter = api.Api.limiter
+  _prepare = api.Api._prepare
+  _slot = api.Api._slot
+  _observe = api.Api._observe
+  _stats = api.Api._stats
+  _unauthorized = api.Api._unauthorized
+  _checked = staticmethod(api.Api._checked)
+
+  @property
+  def session(self) -> aiohttp.ClientSession:
+    if self._session is None:  # needs a running loop, hence lazy
+      self._session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit_per_host=self.pool_size))
+    return self._session
+
+  async def close(self):
+    if self._session is not None and self._owns_session:
+      await self._session.close()
+      self._session = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  async def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+    if wait := self._slot(url, self.limiter.reserve):
+      await asyncio.sleep(wait)
+    if deadline := dl.current():
+      deadline.check(f'before {method} {url}')
+      kwargs['timeout'] = aiohttp.ClientTimeout(total=deadline.remaining())
+    try:
+      async with self.session.request(method, url, **kwargs) as r:
+        response = _to_response(r, await r.read())
+    except asyncio.TimeoutError as e:
+      if deadline and deadline.expired():
+        raise dl.DeadlineExceeded(f'Deadline exceeded during {method} {url}') from e
+      raise
+    return self._observe(url, response)
+
+  async def _hedged(self, attempt: ty.Callable[[], ty.Awaitable]):
+    first = asyncio.ensure_future(attempt())
+    done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+    if done:
+      return first.result()
+    pending = {first, asyncio.ensure_future(attempt())}
+    error = None
+    try:
+      while pending:
+        done, pending = await asyncio.wait(
+          pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+          if task.exception() is None:
+            return task.result()
+          error = task.exception()
+      raise error
+    finally:
+      for task in pending:
+        task.cancel()
+
+  async def request(
+      self,
+      method: str,
+      *path: str,
+      headers: ty.Optional[dict] = None,
+      T: api.Api.ResponseType = dict,
+      idempotent: ty.Optional[bool] = None,
+      **kwargs) -> api.T:
+    """Cf. `api.Api.request`."""
+    url, headers, idempotent = self._prepare(method, path, headers, idempotent)
+    token = None
+
+    async def send():
+      nonlocal token
+      sent = headers
+      if self.credentials is not None:  # renewing blocks, keep it off the loop
+        token = self.credentials.cached() or await asyncio.to_thread(
+          self.credentials.access_token)
+        sent = {'Authorization': f'Bearer {token}', **headers}
+      return await self._send(method, url, headers=sent, auth=self.auth, **kwargs)
+
+    async def attempt():
+      return await self.retry.acall(
+        send, idempotent, self._stats(method, url), TRANSPORT_ERRORS)
+
+    if idempotent and self.hedge_after is not None:
+      response = await self._hedged(attempt)
+    else:
+      response = await attempt()
+    if self._unauthorized(response) and (
+        await asyncio.to_thread(self.credentials.refresh, token)):
+      L.info('Unauthorized, retrying with a renewed token')
+      response.close()
+      response = await attempt()
+    return api.Api._response_matcher(T)(self._checked(response))
+
+  async def get(self, *path: str, T: api.Api.ResponseType = dict) -> api.T:
+    return await self.request('GET', *path, T=T)
+
+  async def post(
+      self, *path: str, json=None, headers=None, T: api.Api.ResponseType = dict,
+      idempotent: bool = False) -> api.T:
+    return await self.request(
+      'POST', *path, json=json, headers=headers, T=T, idempotent=idempotent)
+
+
+class AsyncDropboxContent(AsyncApi):
+
+  def __init__(self, auth: ty.Union[str, dict, oauth.Credentials], **kwargs):
+    """Cf. `api.DropboxContent`."""
+    super().__init__('https://content.dropboxapi.com/2/{}', {}, **kwargs)
+    self.credentials = oauth.Credentials.of(auth)
+
+  async def up(self, fp: io.BytesIO, path: str):
+    response = await self.request(
+      'POST', 'files', 'upload', data=fp.read(),
+      headers=api.DropboxContent._up_headers(path))
+    return api.GenericResponse(meta={}, content=response)
+
+
+class AsyncNotion(AsyncApi):
+
+  def __init__(self, secret: str, pageid: str, **kwargs):
+    self.secret = secret
+    self.pageid = pageid
+    super().__init__(api.Notion.BASE, api.Notion.auth_header(secret), **kwargs)
+
+  paper_page = api.Notion.paper_page
+
+  async def add_paper(self, title: str, url: str, abstract: str, content: str = ""):
+    return await self.add_page(self.paper_page(title, url, abstract, content))
+
+  async def add_page(self, page: dict):
+    return await self.post("pages", json=page)
+
+
+class AsyncDropbox(AsyncApi):
+
+  def __init__(self, auth: ty.Union[str, dict, oauth.Credentials], **kwargs):
+    """Cf. `api.Dropbox`."""
+    super().__init__('https://api.dropboxapi.com/2/{}', {}, **kwargs)
+    self.credentials = oauth.Credentials.of(auth)
+
+  def _pages(
+      self,
+      wrapper: ty.Callable,
+      first: ty.Callable[[], ty.Awaitable[api.GenericResponse]],
+      continue_path: tuple[str, ...],
+      exhaust: bool,
+      cursor: ty.Optional[str] = None) -> 'AsyncPages[api.FileResponse]':
+    more = lambda c: wrapper(self.post)(
+      *continue_path, json={"cursor": c}, idempotent=True)
+    if cursor is not None:
+      first = functools.partial(more, cursor)
+    return AsyncPages(first, more if exhaust else None)
+
+  def ls(
+      self,
+      path: str,
+      recursive: bool = False,
+      exhaust: bool = False,
+      cursor: ty.Optional[str] = None) -> 'AsyncPages[api.FileResponse]':
+    """Cf. `api.Dropbox.ls`; `async for` it or `await` it for `.content`."""
+    wrapper = awrap('entries')
+    basepath = 'files', 'list_folder'
+    first = lambda: wrapper(self.post)(
+      *basepath, json=api.Dropbox._ls_json(path, recursive), idempotent=True)
+    return self._pages(wrapper, first, (*basepath, 'continue'), exhaust, cursor)
+
+  def search(self, query: str, path: ty.Optional[str] = None,
+      filename_only: bool = True,
+      file_extensions: ty.Optional[list] = None,
+      exhaust: bool = False,
+      cursor: ty.Optional[str] = None) -> 'AsyncPages[api.FileResponse]':
+    wrapper = awrap('matches')
+    first = lambda: wrapper(self.post)('files', 'search_v2', json=api.Dropbox._search_json(
+      query, path, filename_only, file_extensions), idempotent=True)
+    return self._pages(
+      wrapper, first, ('files', 'search', 'continue_v2'), exhaust, cursor)
+
+  mv = same_as(api.Dropbox.mv)
+  mkdir = same_as(api.Dropbox.mkdir)
+  rm = same_as(api.Dropbox.rm)
+  save_url = same_as(api.Dropbox.save_url)
+
+  @awrap('metadata')
+  async def ln(self, src: str, dst: str):
+    '''Create symlink on Dropbox.'''
+    ref = await self.post(
+      'files', 'copy_reference', 'get', json={'path': api._pathnorm(src)},
+      idempotent=True)
+    return await self.post('files', 'copy_reference', 'save', json={
+      'copy_reference': ref['copy_reference'],
+      'path': api._pathnorm(dst)
+    })
+
+
+class AsyncGenericHtml(AsyncApi):
+  def __init__(self, hedge_after: ty.Optional[float] = None, **kwargs):
+    super().__init__('{}', {}, **kwargs)
+    self.hedge_after = hedge_after
+
+  async def get(self, *path: str):
+    return await super().get(*path, T=str)
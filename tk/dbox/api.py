@@ -4,15 +4,26 @@ Dumb idea since Dropbox has a Python API but I wanted to roll out sth simple
 since the project needs only a small subset of its features.
 """
 import dataclasses as dcls
-import io
 import json
 import logging
 import requests
 import typing as ty
 
 import base64
+import collections
+import concurrent.futures as cf
+import contextlib
+import functools
+import mmap
+import os
 
 from datetime import datetime as dt
+from tk.dbox import auth as oauth
+from tk.dbox import deadline as dl
+from tk.dbox import httpcache
+from tk.dbox import ratelimit
+from tk.dbox import retry
+from tk.dbox import transport as xport
 from tk.dbox.utils.type import WithMetaResponse
 
 L = logging.getLogger(__name__)
@@ -50,35 +61,121 @@ class FileResponse(WithMetaResponse):
   def last_modified(self):
     return self.server_modified
 
+  @property
+  def path_lower(self) -> ty.Optional[str]:
+    return self.meta.get('path_lower') or (self.path or '').lower() or None
+
+  @property
+  def size(self) -> ty.Optional[int]:
+    return self.meta.get('size')
+
+  @property
+  def is_dir(self) -> bool:
+    return self.meta.get('.tag') == 'folder'
+
   def __post_init__(self):
     if lm := self.server_modified:
       setattr(self, 'server_modified', dt.strptime(lm, '%Y-%m-%dT%H:%M:%SZ'))
 
 
 
+class Pages(ty.Iterable[T]):
+  """Lazily iterates paginated results (`has_more` + `cursor` responses).
+
+  The next page is requested in the background while the caller handles the
+  current one. `cursor` is that of the last fully consumed page and can be
+  passed back (e.g. `Dropbox.ls(..., cursor=)`) to resume later on.
+  `content` materializes everything, for callers that want a list.
+  """
+
+  def __init__(
+      self,
+      first: ty.Callable[[], GenericResponse],
+      more: ty.Optional[ty.Callable[[str], GenericResponse]] = None):
+    """`more` fetches the page after a cursor; `None` means one page only."""
+    self._first = first
+    self._more = more
+    self._content: ty.Optional[list[T]] = None
+    self.meta: dict = {}
+    self.cursor: ty.Optional[str] = None
+
+  def __iter__(self) -> ty.Iterator[T]:
+    if self._content is not None:
+      yield from self._content
+      return
+    executor = cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix='pages')
+    try:
+      page = self._first()
+      while True:
+        upcoming = None
+        if cursor := self._next_cursor(page):
+          upcoming = executor.submit(dl.propagate(self._more), cursor)
+        yield from page.content
+        self.cursor = page.meta.get('cursor', self.cursor)
+        if upcoming is None:
+          return
+        page = upcoming.result()
+    finally:
+      executor.shutdown(wait=False, cancel_futures=True)
 
-import http.server
-import socketserver
-import webbrowser
-import urllib.parse as urlparse
-from urllib.parse import parse_qs
-import threading
+  def _next_cursor(self, page: GenericResponse) -> ty.Optional[str]:
+    """Takes in `page`; where to continue from, if there's more to fetch."""
+    self.meta = page.meta
+    if self._more and page.meta.get('has_more'):
+      return page.meta.get('cursor')
+    return None
+
+  @property
+  def content(self) -> list[T]:
+    if self._content is None:
+      self._content = list(self)
+    return self._content
 
 
 class Api:
 
   ResponseType = ty.Type[requests.Response | dict | str]
 
-  def __init__(self, base: str, auth: dict):
-    """Format `base` s.t. `{}` is where the modifiable part of the API comes."""
+  def __init__(
+      self,
+      base: str,
+      auth: dict,
+      transport: ty.Optional[xport.TransportLike] = None):
+    """Format `base` s.t. `{}` is where the modifiable part of the API comes.
+
+    Requests go through `transport` (default: shared pooled `xport.default()`).
+    """
     self.base = base
     self.auth_headers = {}
     self.auth = None
+    # bearer token source, if it can change (cf. `oauth.Credentials`)
+    self.credentials: ty.Optional[oauth.Credentials] = None
+    self._transport = transport
+    self._limiter: ty.Optional[ratelimit.RateLimiter] = None
+    self.retry = retry.RetryPolicy()
+    # if set, idempotent calls slower than this get a second, hedged request
+    self.hedge_after: ty.Optional[float] = None
+    # per-call retry stats, most recent last
+    self.stats: ty.Deque[retry.CallStats] = collections.deque(maxlen=1024)
+    # if set, GETs are cached & revalidated (don't use with per-user auth)
+    self.http_cache: ty.Optional[httpcache.HttpCache] = None
     if (u := auth.get('username')) and (p := auth.get('password')):
         self.auth = requests.auth.HTTPBasicAuth(u, p)
     else:
         self.auth_headers = auth
 
+  @property
+  def transport(self) -> xport.TransportLike:
+    return self._transport or xport.default()
+
+  @property
+  def limiter(self) -> ratelimit.RateLimiter:
+    return self._limiter or ratelimit.default()
+
+  @limiter.setter
+  def limiter(self, limiter: ratelimit.RateLimiter):
+    self._limiter = limiter
+
   def url(self, *path: str):
     return self.base.format('/'.join(path))
 
@@ -90,22 +187,120 @@ class Api:
       requests.Response: lambda r: r
     })[T]
 
-  def get(self, *path: str, T: ResponseType = dict) -> T:
-    url = self.url(*path)
-    response = requests.get(url, headers=self.auth_headers, auth=self.auth)
-    if not response.ok:
-      L.error('Failed: %s', response.status_code)
-      raise Exception(response.text)
+  def request(
+      self,
+      method: str,
+      *path: str,
+      headers: ty.Optional[dict] = None,
+      T: ResponseType = dict,
+      idempotent: ty.Optional[bool] = None,
+      **kwargs) -> T:
+    """Send a request, rate limited per host and retried per `self.retry`.
+
+    Only `idempotent` calls (default: GET/HEAD) are retried on server errors
+    or hedged; rate-limited calls are always retried. Everything respects the
+    current command deadline (cf. `deadline.scope`).
+    """
+    url, headers, idempotent = self._prepare(method, path, headers, idempotent)
+    token = None
+    cached = None
+    if self.http_cache is not None and method == 'GET':
+      if (cached := self.http_cache.get(url)) is not None and (
+          cached.partial and not kwargs.get('stream')):
+        cached = None  # just the start of the page, cf. `GenericHtml.stream`
+      if cached is not None:
+        if cached.fresh():
+          L.debug('Cached: %s', url)
+          return self._response_matcher(T)(cached.response())
+        headers = {**cached.validators(), **headers}
+
+    def send():
+      nonlocal token
+      self._slot(url, self.limiter.acquire)
+      sent = headers
+      if self.credentials is not None:
+        token = self.credentials.access_token()
+        sent = {'Authorization': f'Bearer {token}', **headers}
+      return self._observe(url, self.transport.request(
+        method, url, headers=sent, auth=self.auth, **kwargs))
+
+    def attempt():
+      return self.retry.call(send, idempotent, self._stats(method, url))
+
+    if idempotent and self.hedge_after is not None:
+      response = dl.hedge(attempt, self.hedge_after)
+    else:
+      response = attempt()
+    if self._unauthorized(response) and self.credentials.refresh(token):
+      L.info('Unauthorized, retrying with a renewed token')
+      response.close()
+      response = attempt()
+    if cached is not None and response.status_code == 304:
+      L.debug('Not modified: %s', url)
+      response.close()
+      response = self.http_cache.revalidated(cached, response).response()
+    else:
+      self._checked(response)
+      if self.http_cache is not None and method == 'GET' and not kwargs.get('stream'):
+        self.http_cache.put(url, response)  # streamed: once read, by the caller
     return self._response_matcher(T)(response)
 
-  def post(self, *path: str, json=None, headers=None, T: ResponseType = dict) -> T:
-    url = self.url(*path)
+  # The bookkeeping around a request, shared with `aio.AsyncApi`.
+
+  def _prepare(
+      self,
+      method: str,
+      path: tuple[str, ...],
+      headers: ty.Optional[dict],
+      idempotent: ty.Optional[bool]) -> tuple[str, dict, bool]:
+    """URL, headers and whether it's idempotent (default: GET/HEAD)."""
     headers = {**self.auth_headers, **(headers or {})}
-    response = requests.post(url, json=json, headers=headers, auth=self.auth)
+    if idempotent is None:
+      idempotent = method in ('GET', 'HEAD')
+    return self.url(*path), headers, idempotent
+
+  def _slot(
+      self,
+      url: str,
+      take: ty.Callable[[str, ty.Optional[float]], float]) -> float:
+    """Rate limiter slot via `take` (`acquire`/`reserve`), within the deadline."""
+    deadline = dl.current()
+    try:
+      return take(url, deadline.remaining() if deadline else None)
+    except ratelimit.RateLimitTimeout as e:
+      raise dl.DeadlineExceeded(f'Deadline exceeded waiting for {url}') from e
+
+  def _observe(self, url: str, response: requests.Response) -> requests.Response:
+    """Slow down for this host if the server pushed back, else speed up."""
+    if retry.is_rate_limited(response):
+      self.limiter.throttle(url, retry.retry_after(response))
+    else:
+      self.limiter.relax(url)
+    return response
+
+  def _stats(self, method: str, url: str) -> retry.CallStats:
+    self.stats.append(stats := retry.CallStats(method, url))
+    return stats
+
+  def _unauthorized(self, response: requests.Response) -> bool:
+    """Worth renewing the token and trying once more."""
+    return response.status_code == 401 and self.credentials is not None
+
+  @staticmethod
+  def _checked(response: requests.Response) -> requests.Response:
     if not response.ok:
       L.error('Failed: %s', response.status_code)
-      raise Exception(response.text)
-    return self._response_matcher(T)(response)
+      raise retry.ApiError(response)
+    return response
+
+  def get(self, *path: str, T: ResponseType = dict) -> T:
+    return self.request('GET', *path, T=T)
+
+  def post(
+      self, *path: str, json=None, headers=None, T: ResponseType = dict,
+      idempotent: bool = False) -> T:
+    return self.request(
+      'POST', *path, json=json, headers=headers, T=T, idempotent=idempotent)
 
 
 def _remap_out(content: ty.Any):
@@ -140,60 +335,267 @@ def wrap(extract_key: ty.Optional[str] = None):
   '''Dumb method which remaps inputs/outputs to an API endpoint.'''
   extract = (lambda d: d.pop(extract_key)) if extract_key else (lambda d: d)
   def _wrap(f: ty.Callable):
+    @functools.wraps(f)
     def _inner(*args, **kwargs):
       res = f(*map(_remap_in, args), **kwargs)
       content = _remap_out(extract(res))
       return GenericResponse(meta=res, content=content)
+    _inner.extract_key = extract_key  # cf. `aio.same_as`
     return _inner
   return _wrap
 
 
 class DropboxContent(Api):
 
-  def __init__(self, auth_headers: ty.Union[str, dict]):
-    if isinstance(auth_headers, str):
-      auth_headers = {'Authorization': f'Bearer {auth_headers}'}
-    super().__init__('https://content.dropboxapi.com/2/{}', auth_headers)
-
-  def up(self, fp: io.BytesIO, path: str):
-    url = self.url('files', 'upload')
-    response = requests.post(
-      url, data=fp.read(), headers={
-        **self.auth_headers,
-        'Content-Type': 'application/octet-stream',
-        'Dropbox-API-Arg': json.dumps({
-          'path': _pathnorm(path),
-          'mode': 'add',
-          'autorename': True,
-          'mute': False,
-          'strict_conflict': False
-        })
-      })
-    if not response.ok:
-      L.error('Failed: %s', response.status_code)
-      raise Exception(response.text)
-    return GenericResponse(meta={}, content=response.json())
+  def __init__(
+      self,
+      auth: ty.Union[str, dict, oauth.Credentials],
+      transport: ty.Optional[xport.TransportLike] = None):
+    """`auth`: access token, `dropbox` config or credentials shared with `Dropbox`."""
+    super().__init__('https://content.dropboxapi.com/2/{}', {}, transport)
+    self.credentials = oauth.Credentials.of(auth, transport)
+
+  # Above this size, upload in a session of `CHUNK_SIZE` pieces instead of
+  # one request (`files/upload` caps at 150MB and restarts from 0 on failure).
+  SESSION_THRESHOLD = 16 * 2**20
+  CHUNK_SIZE = 8 * 2**20  # Dropbox wants multiples of 4MB
+
+  @staticmethod
+  def _commit(path: str) -> dict:
+    return {
+      'path': _pathnorm(path),
+      'mode': 'add',
+      'autorename': True,
+      'mute': False,
+      'strict_conflict': False
+    }
+
+  @staticmethod
+  def _arg_headers(arg: dict) -> dict:
+    return {
+      'Content-Type': 'application/octet-stream',
+      'Dropbox-API-Arg': json.dumps(arg),
+    }
+
+  @staticmethod
+  def _up_headers(path: str) -> dict:
+    return DropboxContent._arg_headers(DropboxContent._commit(path))
+
+  def up(
+      self,
+      fp: ty.BinaryIO,
+      path: str,
+      progress: ty.Optional[ty.Callable[[int, int], ty.Any]] = None):
+    """Upload `fp` to `path`, reporting `progress(bytes_done, bytes_total)`.
+
+    Real files are mmapped and sent in slices, so nothing is copied and large
+    files go up in bounded memory; cf. `SESSION_THRESHOLD`.
+    """
+    with _buffer(fp) as view:
+      if len(view) <= self.SESSION_THRESHOLD:
+        response = self.request(
+          'POST', 'files', 'upload', data=_body(view),
+          headers=self._up_headers(path))
+      else:
+        response = self._up_session(view, path, progress)
+      if progress:
+        progress(len(view), len(view))
+    return GenericResponse(meta={}, content=response)
+
+  def up_session(
+      self,
+      fp: ty.BinaryIO,
+      progress: ty.Optional[ty.Callable[[int, int], ty.Any]] = None) -> dict:
+    """Upload `fp` into a closed session, to commit later in a batch.
+
+    Returns the session's cursor, cf. `Dropbox.finish_upload_batch`.
+    """
+    with _buffer(fp) as view:
+      return self._up_session(view, None, progress)
+
+  def _up_session(
+      self,
+      view: memoryview,
+      path: ty.Optional[str],
+      progress: ty.Optional[ty.Callable[[int, int], ty.Any]] = None) -> dict:
+    """`upload_session/start`, `append_v2`s, `finish`; resumes after failures.
+
+    After a failed chunk, continues from the offset Dropbox says it has.
+    Without a `path`, closes the session instead of finishing it and returns
+    its cursor.
+    """
+    total, size = len(view), self.CHUNK_SIZE
+    close = path is None and total <= size
+    with view[:size] as chunk:
+      session_id = self.request(
+        'POST', 'files', 'upload_session', 'start', data=_body(chunk),
+        headers=self._arg_headers({'close': close}))['session_id']
+    offset, failures = min(size, total), 0
+    while not close:
+      if progress:
+        progress(offset, total)
+      end = min(offset + size, total)
+      cursor = {'session_id': session_id, 'offset': offset}
+      try:
+        with view[offset:end] as chunk:
+          if end == total and path is not None:
+            return self.request(
+              'POST', 'files', 'upload_session', 'finish', data=_body(chunk),
+              headers=self._arg_headers({
+                'cursor': cursor, 'commit': self._commit(path)}))
+          self.request(
+            'POST', 'files', 'upload_session', 'append_v2', data=_body(chunk),
+            headers=self._arg_headers({'cursor': cursor, 'close': end == total}))
+        offset, failures = end, 0
+        close = end == total
+      except (retry.ApiError, *retry.TRANSPORT_ERRORS) as e:
+        failures += 1
+        correct = _correct_offset(e)
+        if failures >= self.retry.max_attempts or (
+            correct is None and isinstance(e, retry.ApiError)):
+          raise
+        L.warning('Upload to %s failed at %s/%s bytes (%s), resuming from %s',
+                  path or session_id, offset, total, e,
+                  offset if correct is None else correct)
+        if correct is None:  # unknown if it arrived; if so, we'll be told
+          self.retry.sleep(self.retry.backoff(failures))
+        else:
+          offset = correct
+    return {'session_id': session_id, 'offset': total}
+
+
+  def down(
+      self,
+      path: str,
+      dst: ty.Union[str, os.PathLike],
+      rev: ty.Optional[str] = None,
+      progress: ty.Optional[ty.Callable[[int, int], ty.Any]] = None,
+      chunk_size: int = 2**20) -> dict:
+    """Stream `path` (at `rev`, if given) to the local file `dst`.
+
+    Goes to `dst.part` first and picks up from there (with a `Range`
+    request) if interrupted, also across runs. Returns the file metadata.
+    """
+    dst = os.fspath(dst)
+    part = f'{dst}.{rev}.part' if rev else f'{dst}.part'
+    arg = json.dumps({'path': f'rev:{rev}' if rev else _pathnorm(path)})
+    failures = 0
+    while True:
+      offset = os.path.getsize(part) if os.path.exists(part) else 0
+      headers = {'Dropbox-API-Arg': arg}
+      if offset:
+        headers['Range'] = f'bytes={offset}-'
+      try:
+        response = self.request(
+          'POST', 'files', 'download', headers=headers, T=requests.Response,
+          idempotent=True, stream=True)
+      except retry.ApiError as e:
+        if e.status != 416 or not offset:
+          raise
+        os.remove(part)  # we have more than there is, start over
+        continue
+      meta = json.loads(response.headers['Dropbox-API-Result'])
+      if response.status_code != 206:  # server sent it all, not the range
+        offset = 0
+      try:
+        with response, open(part, 'ab' if offset else 'wb') as f:
+          for chunk in dl.bounded(
+              response.iter_content(chunk_size), f'downloading {path}'):
+            f.write(chunk)
+            offset += len(chunk)
+            if progress:
+              progress(offset, meta.get('size') or offset)
+        break
+      except (*retry.TRANSPORT_ERRORS, requests.exceptions.ChunkedEncodingError) as e:
+        if (failures := failures + 1) >= self.retry.max_attempts:
+          raise
+        L.warning('Download of %s broke off at %s bytes (%s), resuming',
+                  path, offset, e)
+    os.replace(part, dst)
+    return meta
+
+
+@contextlib.contextmanager
+def _buffer(fp: ty.BinaryIO) -> ty.Iterator[memoryview]:
+  """Zero-copy view of what's left in `fp`: mmap for real files."""
+  try:
+    fileno, start = fp.fileno(), fp.tell()
+  except (AttributeError, OSError):
+    fileno = None
+  if fileno is not None and os.fstat(fileno).st_size > start:
+    mm = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+      with memoryview(mm) as whole, whole[start:] as view:
+        yield view
+    finally:
+      try:
+        mm.close()
+      except BufferError:  # views still held, e.g. by a failed send's traceback
+        L.debug('mmap still in use, leaving it to be collected')
+  elif hasattr(fp, 'getbuffer'):  # io.BytesIO
+    with fp.getbuffer() as whole, whole[fp.tell():] as view:
+      yield view
+  else:  # e.g. pipes, there's no way around reading it all
+    with memoryview(fp.read()) as view:
+      yield view
+
+
+def _body(chunk: memoryview) -> ty.Union[memoryview, bytes]:
+  # NB, requests would send an empty (non-bytes) body chunked
+  return chunk if len(chunk) else b''
+
+
+def _correct_offset(error: Exception) -> ty.Optional[int]:
+  """From `incorrect_offset` upload session errors (possibly nested)."""
+  if not isinstance(error, retry.ApiError):
+    return None
+  try:
+    found = error.response.json().get('error')
+  except ValueError:
+    return None
+  while isinstance(found, dict):
+    if 'correct_offset' in found:
+      return found['correct_offset']
+    found = found.get(found.get('.tag'))
+  return None
 
 
 class Notion(Api):
   # https://developers.notion.com/docs/working-with-page-content
 
-  def __init__(self, secret: str, pageid: str):
+  def __init__(
+      self,
+      secret: str,
+      pageid: str,
+      transport: ty.Optional[xport.TransportLike] = None):
     self.secret = secret
     # NB, actually we should expect it to be a DB id.
     self.pageid = pageid
-    super().__init__("https://api.notion.com/v1/{}", {
+    super().__init__(self.BASE, self.auth_header(secret), transport)
+
+  BASE = "https://api.notion.com/v1/{}"
+
+  @staticmethod
+  def auth_header(secret: str) -> dict:
+    return {
       "Authorization": f"Bearer {secret}",
       # Not sure whether ok to hardcode this ...
       "Notion-Version": "2022-06-28",
-    })
+    }
 
   def add_paper(self, title: str, url: str, abstract: str, content: str = ""):
+    return self.add_page(self.paper_page(title, url, abstract, content))
+
+  def add_page(self, page: dict):
+    """Add a page as built by `paper_page`."""
+    return self.post("pages", json=page)
+
+  def paper_page(
+      self, title: str, url: str, abstract: str, content: str = "") -> dict:
     title = title.replace('\n', ' ').strip()
     abstract = abstract.replace('\n', ' ').strip()
     content = content.replace('\n', ' ').strip()
-    response = self.post("pages", json={
-    #response = self.post("pages", json={
+    return {
       "parent": { "database_id": self.pageid },
       # https://developers.notion.com/reference/block
       "children": [
@@ -253,8 +655,7 @@ class Notion(Api):
           'url': url,
         },
       }
-    })
-    return response
+    }
 
   def get_page(self, is_db: bool = True):
     prefix = "databases" if is_db else "pages"
@@ -273,116 +674,45 @@ class Dropbox(Api):
     key = base64.b64encode(f'{key}:{secret}'.encode('utf8'))
     return dict(Authorization=f'Bearer {key}')
 
-  def auth(self, client_id: str, client_secret: str, **kwargs) -> str:
-    """Some hacky way to get authorization via local oauth2 flow.
-
-    TODO integrate refresh tokens et al.
-    """
-    if kwargs:
-      L.warning("Unexpected: %s", kwargs)
-    authorization_endpoint = "https://www.dropbox.com/oauth2/authorize"
-    redirect_uri = 'http://localhost:8000'
-    code = None
-
-    class Handler(http.server.SimpleHTTPRequestHandler):
-
-      def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-
-        query_components = parse_qs(urlparse.urlparse(self.path).query)
-        if local_code := query_components.get('code'):
-          nonlocal code
-          code = local_code[0]
-          self.wfile.write(bytes(f'Access Token: {code}', 'utf-8'))
-          return
-
-        # NB, if you don't set redirect_uri the user can manually c/p the token.
-        # Set redirect_uri in https://www.dropbox.com/developers/apps/
-        # "{authorization_endpoint}?client_id={client_id}&response_type=token&redirect_uri={redirect_uri}";
-        # response_type can be token or code
-        self.wfile.write(bytes(f'''
-        <html>
-          <script>
-            window.location.href =
-            "{authorization_endpoint}?token_access_type=offline&client_id={client_id}&response_type=code&redirect_uri={redirect_uri}";
-          </script>
-        </html>
-        ''', 'utf-8'))
-
-    webbrowser.open('http://localhost:8000')
-    httpd = socketserver.TCPServer(('localhost', 8000), Handler)
-    while code is None:  # note the ugly hack, not even sure it'll always work
-      httpd.handle_request()
-
-    token_url = 'https://api.dropbox.com/oauth2/token'
-    response = requests.post(token_url, data={
-        'code': code,
-        'grant_type': 'authorization_code',
-        'redirect_uri': redirect_uri,
-        'client_id': client_id,
-        'client_secret': client_secret,
-    })
-    json = response.json()
-
-    # other outputs:
-    # access_token String The access token to be used to call the Dropbox API.
-    # expires_in Integer The length of time in seconds that the access token will be valid for.
-    # token_type String Will always be bearer.
-    # scope String The permission set applied to the token.
-    # account_id String An API v2 account ID if this OAuth 2 flow is user-linked.
-    # team_id String An API v2 team ID if this OAuth 2 flow is team-linked.
-    # refresh_token String If the token_access_type was set to offline when
-    # calling /oauth2/authorize, then response will include a refresh token.
-    # This refresh token is long-lived and won't expire automatically. It can be
-    # stored and re-used multiple times.
-    # id_token String If the request includes OIDC scopes and is completed in
-    # the response_type=code flow, then the payload will include an id_token
-    # which is a JWT token.
-    # uid String The API v1 identifier value. It is deprecated and should no
-    # longer be used.
-    return json["access_token"]
-
-  def __init__(self, auth_headers: ty.Union[str, dict, tuple]):
-    if isinstance(auth_headers, str):
-      auth_headers = {'Authorization': f'Bearer {auth_headers}'}
-    else:
-      tok = self.auth(**auth_headers)
-      auth_headers = {'Authorization': f'Bearer {tok}'}
-    super().__init__('https://api.dropboxapi.com/2/{}', auth_headers)
+  def __init__(
+      self,
+      auth: ty.Union[str, dict, oauth.Credentials],
+      transport: ty.Optional[xport.TransportLike] = None):
+    """`auth`: access token, `dropbox` config (cf. `oauth.Credentials.of`)."""
+    super().__init__('https://api.dropboxapi.com/2/{}', {}, transport)
+    self.credentials = oauth.Credentials.of(auth, transport)
 
-  def _exhaust(
+  def _pages(
       self,
-      data: GenericResponse,
       wrapper: ty.Callable,
-      *path: str) -> GenericResponse:
-    """Calls the continue endpoint until done. TODO make this not hacky."""
-    while data.meta.get('has_more') and (cursor := data.meta.get('cursor')):
-      data_next = wrapper(self.post)(*path, json={"cursor": cursor})
-      data.content.extend(data_next.content)
-      data = GenericResponse(content=data.content, meta=data_next.meta)
-    return data
-
-  def ls(self, path: str, recursive: bool = False, exhaust: bool = False):
-    wrapper = wrap('entries')
-    basepath = 'files', 'list_folder'
-    data = wrapper(self.post)(*basepath, json={
+      first: ty.Callable[[], GenericResponse],
+      continue_path: tuple[str, ...],
+      exhaust: bool,
+      cursor: ty.Optional[str] = None) -> Pages[FileResponse]:
+    more = lambda c: wrapper(self.post)(
+      *continue_path, json={"cursor": c}, idempotent=True)
+    if cursor is not None:  # resume instead of starting over
+      first = functools.partial(more, cursor)
+    return Pages(first, more if exhaust else None)
+
+  @staticmethod
+  def _ls_json(
+      path: str, recursive: bool = False, include_deleted: bool = False) -> dict:
+    return {
       'path': _pathnorm(path),
       'recursive': recursive,
       'include_media_info': False,
-      'include_deleted': False,
+      'include_deleted': include_deleted,
       'include_has_explicit_shared_members': False,
       'include_mounted_folders': True,
       'include_non_downloadable_files': True
-    })
-    return self._exhaust(data, wrapper, *basepath, 'continue') if exhaust else data
+    }
 
-  def search(self, query: str, path: ty.Optional[str] = None,
+  @staticmethod
+  def _search_json(query: str, path: ty.Optional[str] = None,
       filename_only: bool = True,
-      file_extensions: ty.Optional[list] = None,
-      exhaust: bool = False):
-    wrapper = wrap('matches')
-    data = wrapper(self.post)('files', 'search_v2', json={
+      file_extensions: ty.Optional[list] = None) -> dict:
+    return {
       'query': query,
       'options': {
           'path': _pathnorm(path),
@@ -392,8 +722,69 @@ class Dropbox(Api):
           'file_extensions': file_extensions,
       },
       'match_field_options': {'include_highlights': False}
-    })
-    return self._exhaust(data, wrapper, 'files', 'search', 'continue_v2') if exhaust else data
+    }
+
+  def ls(
+      self,
+      path: str,
+      recursive: bool = False,
+      exhaust: bool = False,
+      cursor: ty.Optional[str] = None,
+      include_deleted: bool = False) -> Pages[FileResponse]:
+    """Lazily list `path`; only the first page unless `exhaust`.
+
+    Pass a `cursor` from an earlier listing to continue from there instead.
+    Deleted entries (with `include_deleted`) come back as plain dicts.
+    """
+    wrapper = wrap('entries')
+    basepath = 'files', 'list_folder'
+    first = lambda: wrapper(self.post)(
+      *basepath, json=self._ls_json(path, recursive, include_deleted),
+      idempotent=True)
+    return self._pages(wrapper, first, (*basepath, 'continue'), exhaust, cursor)
+
+  def latest_cursor(
+      self,
+      path: str,
+      recursive: bool = False,
+      include_deleted: bool = False) -> str:
+    """Cursor for "now" without listing anything, to `ls(cursor=)` later."""
+    return self.post(
+      'files', 'list_folder', 'get_latest_cursor',
+      json=self._ls_json(path, recursive, include_deleted),
+      idempotent=True)['cursor']
+
+  @functools.cached_property
+  def notify(self) -> Api:
+    """Client for the long-poll host, which must *not* get the auth header."""
+    notify = Api('https://notify.dropboxapi.com/2/{}', {}, self._transport)
+    notify._limiter = self._limiter
+    notify.retry = self.retry
+    notify.stats = self.stats
+    return notify
+
+  def longpoll(self, cursor: str, timeout: int = 30) -> dict:
+    """Block until something changes after `cursor`, or `timeout` (30-480s).
+
+    Returns e.g. `{'changes': True}`; honor `backoff` (seconds) if present.
+    """
+    return self.notify.request(
+      'POST', 'files', 'list_folder', 'longpoll',
+      json={'cursor': cursor, 'timeout': timeout}, idempotent=True,
+      # Dropbox adds up to 90s of jitter on top of `timeout`
+      timeout=(10., timeout + 100.))
+
+  def search(self, query: str, path: ty.Optional[str] = None,
+      filename_only: bool = True,
+      file_extensions: ty.Optional[list] = None,
+      exhaust: bool = False,
+      cursor: ty.Optional[str] = None) -> Pages[FileResponse]:
+    """Lazily search, cf. `ls`."""
+    wrapper = wrap('matches')
+    first = lambda: wrapper(self.post)('files', 'search_v2', json=self._search_json(
+      query, path, filename_only, file_extensions), idempotent=True)
+    return self._pages(
+      wrapper, first, ('files', 'search', 'continue_v2'), exhaust, cursor)
 
   @wrap('metadata')
   def mv(self, src: str, dst: str, rename: bool = True):
@@ -406,10 +797,11 @@ class Dropbox(Api):
 
   @wrap('metadata')
   def mkdir(self, dirpath: str):
+    # Repeating is harmless: worst case the retry fails with `path/conflict`.
     return self.post('files', 'create_folder_v2', json={
       'path': _pathnorm(dirpath),
       'autorename': False,  # don't let the server try to resolve naming conflicts
-    })
+    }, idempotent=True)
 
   @wrap('metadata')
   def rm(self, path: str):
@@ -419,7 +811,8 @@ class Dropbox(Api):
   def ln(self, src: str, dst: str):
     '''Create symlink on Dropbox.'''
     ref = self.post(
-      'files', 'copy_reference', 'get', json={'path': _pathnorm(src)})
+      'files', 'copy_reference', 'get', json={'path': _pathnorm(src)},
+      idempotent=True)
     return self.post('files', 'copy_reference', 'save', json={
       'copy_reference': ref['copy_reference'],
       'path': _pathnorm(dst)
@@ -433,11 +826,159 @@ class Dropbox(Api):
       'path': _pathnorm(path)
     })
 
+  def save_url_status(self, job_id: str) -> dict:
+    """`in_progress`, `complete` (with the metadata) or `failed`."""
+    return self.post(
+      'files', 'save_url', 'check_job_status', json={'async_job_id': job_id},
+      idempotent=True)
+
+
+  # Dropbox limits batch jobs to 1000 entries.
+  BATCH_SIZE = 1000
+
+  def poll(
+      self,
+      check: tuple[str, ...],
+      job: dict,
+      interval: float = .25,
+      max_interval: float = 5.,
+      backoff: float = 1.5) -> dict:
+    """Wait for an async job (e.g. `*_batch` launches) to finish.
+
+    `job` is the launch response, `check` the `.../check` endpoint. Polls at
+    geometrically growing intervals; returns the `complete` result.
+    """
+    job_id = job.get('async_job_id')
+    while job.get('.tag') in ('async_job_id', 'in_progress'):
+      if (deadline := dl.current()) and interval >= deadline.remaining():
+        raise dl.DeadlineExceeded(f'Deadline exceeded polling {job_id}')
+      self.retry.sleep(interval)
+      interval = min(max_interval, interval * backoff)
+      job = self.post(*check, json={'async_job_id': job_id}, idempotent=True)
+      L.debug('Job %s: %s', job_id, job.get('.tag'))
+    if job.get('.tag', 'complete') != 'complete':  # untagged: was synchronous
+      raise Exception(f'Job failed: {job}')
+    return job
+
+  def _batch(
+      self,
+      launch: tuple[str, ...],
+      check: tuple[str, ...],
+      entries: list[dict],
+      result_key: ty.Optional[str],
+      **args) -> GenericResponse:
+    """Run entries through a batch endpoint, `BATCH_SIZE` at a time.
+
+    `content` lines up with `entries`: a `FileResponse` per success, the
+    failure (a dict) otherwise. Successes carry their metadata under
+    `result_key`, or inline if it's None.
+    """
+    content, metas = [], []
+    for i in range(0, len(entries), self.BATCH_SIZE):
+      chunk = entries[i:i + self.BATCH_SIZE]
+      job = self.post(*launch, json={'entries': chunk, **args})
+      # first check after roughly how long Dropbox takes for this many entries
+      job = self.poll(check, job, interval=min(2., .1 + len(chunk) / 500))
+      metas.append(job)
+      for entry in job['entries']:
+        if entry.get('.tag') == 'success':
+          entry = _remap_out(entry[result_key] if result_key else entry)
+        content.append(entry)
+    failed = sum(not isinstance(c, FileResponse) for c in content)
+    if failed:
+      L.warning('%s/%s batch entries failed', failed, len(content))
+    return GenericResponse(meta={'jobs': metas}, content=content)
+
+  def mv_batch(
+      self,
+      moves: ty.Iterable[tuple[str, str]],
+      rename: bool = True) -> GenericResponse:
+    """Move many `(src, dst)` at once, cf. `mv`."""
+    entries = [
+      {'from_path': _pathnorm(_remap_in(src)), 'to_path': _pathnorm(_remap_in(dst))}
+      for src, dst in moves]
+    return self._batch(
+      ('files', 'move_batch_v2'), ('files', 'move_batch', 'check_v2'),
+      entries, 'success', autorename=rename, allow_ownership_transfer=False)
+
+  def cp_batch(
+      self,
+      copies: ty.Iterable[tuple[str, str]],
+      rename: bool = True) -> GenericResponse:
+    """Copy many `(src, dst)` at once."""
+    entries = [
+      {'from_path': _pathnorm(_remap_in(src)), 'to_path': _pathnorm(_remap_in(dst))}
+      for src, dst in copies]
+    return self._batch(
+      ('files', 'copy_batch_v2'), ('files', 'copy_batch', 'check_v2'),
+      entries, 'success', autorename=rename)
+
+  def finish_upload_batch(
+      self, uploads: ty.Iterable[tuple[dict, str]]) -> GenericResponse:
+    """Commit closed upload sessions, `(cursor, path)`, all at once.
+
+    Cf. `DropboxContent.up_session`; one commit instead of one per file.
+    """
+    entries = [
+      {'cursor': cursor, 'commit': DropboxContent._commit(path)}
+      for cursor, path in uploads]
+    return self._batch(
+      ('files', 'upload_session', 'finish_batch_v2'),
+      ('files', 'upload_session', 'finish_batch', 'check'),
+      entries, None)
+
+  def rm_batch(self, paths: ty.Iterable[str]) -> GenericResponse:
+    entries = [{'path': _pathnorm(_remap_in(p))} for p in paths]
+    return self._batch(
+      ('files', 'delete_batch'), ('files', 'delete_batch', 'check'),
+      entries, 'metadata')
+
 
 class GenericHtml(Api):
-  def __init__(self):
-    super().__init__('{}', {})
+  def __init__(
+      self,
+      transport: ty.Optional[xport.TransportLike] = None,
+      hedge_after: ty.Optional[float] = None,
+      http_cache: ty.Optional[httpcache.HttpCache] = None):
+    super().__init__('{}', {}, transport)
+    self.hedge_after = hedge_after
+    self.http_cache = http_cache
 
   def get(self, *path: str):
     return super().get(*path, T=str)
 
+  def stream(self, *path: str, chunk_size: int = 2**14) -> ty.Iterator[bytes]:
+    """Body in chunks as they arrive, e.g. for incremental parsing.
+
+    Closing it early drops the connection so the rest isn't downloaded. With
+    an `http_cache`, cached pages are served or revalidated as for `get`, and
+    new storable ones are stored as far as they were read (`partial`ly if
+    closed early), so that next time an unchanged page costs a 304.
+    """
+    url = self.url(*path)  # the cache key, even if redirected
+    response = self.request('GET', *path, T=requests.Response, stream=True)
+    skip = 0
+    if getattr(response, 'partial', False):
+      yield from response.iter_content(chunk_size)
+      # read past what's cached: get all of it, sending on from there
+      skip = len(response.content)
+      self.http_cache.drop(url)
+      response = self.request('GET', *path, T=requests.Response, stream=True)
+    with response:
+      chunks = dl.bounded(response.iter_content(chunk_size), f'reading {url}')
+      store = self.http_cache is not None and not getattr(
+        response, 'from_cache', False) and self.http_cache.storable(response)
+      body = []
+      try:
+        for chunk in chunks:
+          if store:
+            body.append(chunk)
+          chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+          if chunk:
+            yield chunk
+      except GeneratorExit:
+        if store and body:
+          self.http_cache.put(url, response, b''.join(body), partial=True)
+        raise
+      if store:
+        self.http_cache.put(url, response, b''.join(body))
@@ -0,0 +1,246 @@
+"""Dropbox OAuth tokens, kept in a local token store between runs.
+
+The browser flow (`authorize`) only runs when there's no stored token at all.
+Its short-lived access token is renewed with the refresh token (we ask for
+`token_access_type=offline`) shortly before it expires, or on a 401.
+"""
+import dataclasses as dcls
+import http.server
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+import typing as ty
+import urllib.parse as urlparse
+import webbrowser
+
+from pathlib import Path
+
+from tk.dbox import retry
+from tk.dbox import transport as xport
+
+L = logging.getLogger(__name__)
+
+AUTHORIZE_URL = 'https://www.dropbox.com/oauth2/authorize'
+TOKEN_URL = 'https://api.dropbox.com/oauth2/token'
+STORE = Path('~/.notes/tokens.json').expanduser()  # cf. `main.Defaults`
+
+
+@dcls.dataclass
+class Token:
+  access_token: ty.Optional[str] = None
+  # epoch seconds, None if it doesn't expire (e.g. from the app console)
+  expires_at: ty.Optional[float] = None
+  refresh_token: ty.Optional[str] = None
+
+  @classmethod
+  def from_response(
+      cls, json: dict, refresh_token: ty.Optional[str] = None) -> 'Token':
+    """From the `oauth2/token` response; refreshes don't repeat `refresh_token`."""
+    expires_in = json.get('expires_in')
+    return cls(
+      access_token=json['access_token'],
+      expires_at=time.time() + expires_in if expires_in else None,
+      refresh_token=json.get('refresh_token', refresh_token))
+
+  def expired(self, margin: float = 0.) -> bool:
+    return self.access_token is None or (
+      self.expires_at is not None and time.time() + margin >= self.expires_at)
+
+
+class TokenStore:
+  """Tokens per app (`client_id`) in a JSON file only the user can read."""
+
+  def __init__(self, path: ty.Union[str, Path] = STORE):
+    self.path = Path(path).expanduser()
+    self._lock = threading.Lock()
+
+  def _read(self) -> dict:
+    try:
+      return json.loads(self.path.read_text())
+    except FileNotFoundError:
+      return {}
+
+  def load(self, client_id: str) -> ty.Optional[Token]:
+    with self._lock:
+      if (token := self._read().get(client_id)) is None:
+        return None
+    return Token(**token)
+
+  def save(self, client_id: str, token: Token):
+    """Atomically, and never readable by others, not even briefly."""
+    with self._lock:
+      tokens = {**self._read(), client_id: dcls.asdict(token)}
+      self.path.parent.mkdir(parents=True, exist_ok=True)
+      tmp = self.path.with_suffix('.tmp')
+      fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+      with os.fdopen(fd, 'w') as f:
+        json.dump(tokens, f)
+      os.replace(tmp, self.path)
+
+
+def authorize(
+    client_id: str,
+    client_secret: str,
+    transport: xport.TransportLike,
+    port: int = 8000) -> dict:
+  """Some hacky way to get authorization via local oauth2 flow.
+
+  Returns the `oauth2/token` response (incl. a refresh token).
+  """
+  redirect_uri = f'http://localhost:{port}'
+  code = None
+
+  class Handler(http.server.SimpleHTTPRequestHandler):
+
+    def do_GET(self):
+      self.send_response(200)
+      self.end_headers()
+
+      query_components = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+      if local_code := query_components.get('code'):
+        nonlocal code
+        code = local_code[0]
+        self.wfile.write(bytes(f'Access Token: {code}', 'utf-8'))
+        return
+
+      # NB, if you don't set redirect_uri the user can manually c/p the token.
+      # Set redirect_uri in https://www.dropbox.com/developers/apps/
+      # "{AUTHORIZE_URL}?client_id={client_id}&response_type=token&redirect_uri={redirect_uri}";
+      # response_type can be token or code
+      self.wfile.write(bytes(f'''
+      <html>
+        <script>
+          window.location.href =
+          "{AUTHORIZE_URL}?token_access_type=offline&client_id={client_id}&response_type=code&redirect_uri={redirect_uri}";
+        </script>
+      </html>
+      ''', 'utf-8'))
+
+  webbrowser.open(redirect_uri)
+  with socketserver.TCPServer(('localhost', port), Handler) as httpd:
+    while code is None:  # note the ugly hack, not even sure it'll always work
+      httpd.handle_request()
+
+  response = transport.request('POST', TOKEN_URL, data={
+      'code': code,
+      'grant_type': 'authorization_code',
+      'redirect_uri': redirect_uri,
+      'client_id': client_id,
+      'client_secret': client_secret,
+  })
+  if not response.ok:
+    raise retry.ApiError(response)
+  # other outputs:
+  # token_type String Will always be bearer.
+  # scope String The permission set applied to the token.
+  # account_id String An API v2 account ID if this OAuth 2 flow is user-linked.
+  # team_id String An API v2 team ID if this OAuth 2 flow is team-linked.
+  # id_token String If the request includes OIDC scopes and is completed in
+  # the response_type=code flow, then the payload will include an id_token
+  # which is a JWT token.
+  return response.json()
+
+
+class Credentials:
+  """Current bearer token, renewed as needed. Thread-safe.
+
+  Share one instance between `Dropbox` and `DropboxContent`.
+  """
+  # renew this long before the token would expire
+  MARGIN = 300.
+
+  def __init__(
+      self,
+      client_id: ty.Optional[str] = None,
+      client_secret: ty.Optional[str] = None,
+      token: ty.Optional[Token] = None,
+      store: ty.Optional[TokenStore] = None,
+      transport: ty.Optional[xport.TransportLike] = None,
+      authorize: ty.Callable[..., dict] = authorize):
+    """Without a `token`, it's loaded from `store`, else `authorize` runs."""
+    self.client_id = client_id
+    self.client_secret = client_secret
+    self.token = token
+    self.store = store
+    self._transport = transport
+    self._authorize = authorize
+    self._lock = threading.Lock()
+
+  @classmethod
+  def of(
+      cls,
+      auth: ty.Union[str, dict, 'Credentials'],
+      transport: ty.Optional[xport.TransportLike] = None,
+      store: ty.Optional[TokenStore] = None) -> 'Credentials':
+    """From an access token, the `dropbox` config (app key/secret), or as is.
+
+    The config may also carry a `refresh_token` so no browser is ever needed.
+    """
+    if isinstance(auth, Credentials):
+      return auth
+    if isinstance(auth, str):
+      return cls(token=Token(auth))
+    if access_token := auth.get('access_token'):
+      return cls(token=Token(access_token))
+    credentials = cls(
+      auth['client_id'], auth['client_secret'],
+      store=store or TokenStore(), transport=transport)
+    if (refresh_token := auth.get('refresh_token')) and (
+        credentials._load() is None):
+      credentials.token = Token(refresh_token=refresh_token)
+    return credentials
+
+  @property
+  def transport(self) -> xport.TransportLike:
+    return self._transport or xport.default()
+
+  def cached(self) -> ty.Optional[str]:
+    """The access token if it's good for a while longer, without blocking."""
+    token = self.token
+    return None if token is None or token.expired(self.MARGIN) else token.access_token
+
+  def access_token(self) -> str:
+    """Valid access token; may refresh it (or, the first time ever, log in)."""
+    with self._lock:
+      if self.token is None and self._load() is None:
+        L.info('No stored Dropbox token, starting the browser flow...')
+        self._save(Token.from_response(self._authorize(
+          self.client_id, self.client_secret, self.transport)))
+      elif self.token.expired(self.MARGIN) and self.token.refresh_token:
+        self._refresh()
+      return self.token.access_token
+
+  def refresh(self, stale: ty.Optional[str]) -> bool:
+    """Renew after `stale` got a 401. False if there's no way to renew."""
+    with self._lock:
+      if self.token is not None and self.token.access_token != stale:
+        return True  # renewed meanwhile, e.g. by another thread
+      if self.token is None or not self.token.refresh_token:
+        return False
+      self._refresh()
+      return True
+
+  def _load(self) -> ty.Optional[Token]:
+    if self.store is not None and self.client_id:
+      self.token = self.store.load(self.client_id) or self.token
+    return self.token
+
+  def _save(self, token: Token):
+    self.token = token
+    if self.store is not None and self.client_id:
+      self.store.save(self.client_id, token)
+
+  def _refresh(self):
+    L.debug('Refreshing Dropbox access token')
+    response = self.transport.request('POST', TOKEN_URL, data={
+      'grant_type': 'refresh_token',
+      'refresh_token': self.token.refresh_token,
+      'client_id': self.client_id,
+      'client_secret': self.client_secret,
+    })
+    if not response.ok:
+      raise retry.ApiError(response)
+    self._save(Token.from_response(response.json(), self.token.refresh_token))
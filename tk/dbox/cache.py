@@ -0,0 +1,165 @@
+"""Small local caches, in the shared sqlite file (`Defaults.Local.DB`)."""
+import dataclasses as dcls
+import json
+import logging
+import threading
+import time
+import typing as ty
+
+from pathlib import Path
+
+from tk.dbox import api
+from tk.dbox.provider import meta
+from tk.dbox.utils import db
+
+L = logging.getLogger(__name__)
+
+Response = meta.CitationMetaExtractor.Response
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+  path_lower TEXT PRIMARY KEY,
+  seen REAL
+);
+CREATE TABLE IF NOT EXISTS examined (
+  kind TEXT NOT NULL,
+  id TEXT NOT NULL,
+  content_hash TEXT NOT NULL,
+  seen REAL,
+  PRIMARY KEY (kind, id, content_hash)
+);
+CREATE TABLE IF NOT EXISTS meta (
+  provider TEXT NOT NULL,
+  id TEXT NOT NULL,
+  response TEXT,
+  fetched REAL NOT NULL,
+  PRIMARY KEY (provider, id)
+);
+CREATE INDEX IF NOT EXISTS meta_fetched ON meta(fetched);
+'''
+
+
+class _Store:
+  """Opens the sqlite file only once there's something to ask."""
+
+  def __init__(self, path: ty.Union[str, Path]):
+    self._path = path
+    self._db: ty.Optional[db.Db] = None
+    self._lock = threading.Lock()
+
+  @property
+  def db(self) -> db.Db:
+    with self._lock:
+      if self._db is None:
+        self._db = db.Db(self._path, SCHEMA)
+      return self._db
+
+
+class Folders(_Store):
+  """Dropbox folders known to exist, so we don't `mkdir` them every time.
+
+  Forgetting a deleted folder is harmless: uploads and `save_url` create
+  missing parents anyway, `mkdir` is just there to have the dir early.
+  """
+
+  def __init__(self, path: ty.Union[str, Path]):
+    super().__init__(path)
+    self._known: set[str] = set()
+
+  def __contains__(self, path: str) -> bool:
+    if (path := path.lower()) in self._known:
+      return True
+    if self.db.execute('SELECT 1 FROM folders WHERE path_lower = ?', (path,)):
+      self._known.add(path)
+      return True
+    return False
+
+  def add(self, path: str):
+    self._known.add(path := path.lower())
+    self.db.execute(
+      'INSERT OR REPLACE INTO folders (path_lower, seen) VALUES (?, ?)',
+      (path, time.time()))
+
+
+class Examined(_Store):
+  """Files some `kind` of pass has looked at, by id and `content_hash`.
+
+  So that e.g. `metafix` only looks at what's new or changed since last time.
+  """
+
+  def __init__(self, path: ty.Union[str, Path], kind: str):
+    super().__init__(path)
+    self.kind = kind
+
+  def new(self, files: ty.Iterable[api.FileResponse]) -> list[api.FileResponse]:
+    """Those of `files` not examined yet (in their current version)."""
+    seen = {(r['id'], r['content_hash']) for r in self.db.execute(
+      'SELECT id, content_hash FROM examined WHERE kind = ?', (self.kind,))}
+    return [f for f in files if (f.id, f.hash or '') not in seen]
+
+  def add(self, files: ty.Iterable[api.FileResponse]):
+    now = time.time()
+    self.db.executemany(
+      'INSERT OR REPLACE INTO examined (kind, id, content_hash, seen) '
+      'VALUES (?, ?, ?, ?)', [(self.kind, f.id, f.hash or '', now) for f in files])
+
+
+class MetaCache(_Store):
+  """Paper metadata by (provider, paper id), e.g. `('arxiv.org', '2106.09608')`.
+
+  `response` None caches that there's no such paper (404) for a shorter while.
+  Oldest entries go first once there's more than `max_entries`.
+  """
+
+  def __init__(
+      self,
+      path: ty.Union[str, Path],
+      ttl: float = 30 * 86400.,
+      negative_ttl: float = 86400.,
+      max_entries: int = 20_000):
+    super().__init__(path)
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.max_entries = max_entries
+    self._puts = 0
+
+  def get(self, provider: str, id: str) -> tuple[bool, ty.Optional[Response]]:
+    """(hit, response); a hit with None response is a cached 404."""
+    now = time.time()
+    rows = self.db.execute(
+      'SELECT response FROM meta WHERE provider = ? AND id = ? AND fetched > '
+      'CASE WHEN response IS NULL THEN ? ELSE ? END',
+      (provider, id, now - self.negative_ttl, now - self.ttl))
+    if not rows:
+      return False, None
+    if (response := rows[0]['response']) is None:
+      return True, None
+    return True, Response(**json.loads(response))
+
+  def put(
+      self,
+      provider: str,
+      id: str,
+      response: ty.Optional[Response]):
+    if response is not None:
+      response = json.dumps(dcls.asdict(response), default=str)
+    self.db.execute(
+      'INSERT OR REPLACE INTO meta (provider, id, response, fetched) '
+      'VALUES (?, ?, ?, ?)', (provider, id, response, time.time()))
+    if self._puts % 100 == 0:
+      self.prune()
+    self._puts += 1
+
+  def prune(self) -> int:
+    """Drop expired entries, then the oldest ones over `max_entries`."""
+    now = time.time()
+    expired = self.db.execute(
+      'DELETE FROM meta WHERE fetched <= '
+      'CASE WHEN response IS NULL THEN ? ELSE ? END RETURNING 1',
+      (now - self.negative_ttl, now - self.ttl))
+    excess = self.db.execute(
+      'DELETE FROM meta WHERE rowid IN (SELECT rowid FROM meta '
+      'ORDER BY fetched DESC LIMIT -1 OFFSET ?) RETURNING 1', (self.max_entries,))
+    if n := len(expired) + len(excess):
+      L.debug('Pruned %s cached metadata entries', n)
+    return n
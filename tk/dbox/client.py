@@ -0,0 +1,86 @@
+"""Thin `tkdbox` entry point: hand the command line to a running daemon.
+
+Stdlib only, so starting it costs next to nothing. Without a daemon
+(`tkdbox serve`) it just runs the command in-process like before.
+
+Protocol (cf. `daemon`): one JSON line per message. The client sends
+`{"argv": [...], "cwd": ...}`, then gets `{"out": ...}`/`{"err": ...}` to
+print, `{"prompt": ...}` to answer with `{"input": ...}`, `{"stdin": true}`
+to answer with all of its stdin (also as `{"input": ...}`), and finally
+`{"exit": code}`.
+"""
+import json
+import os
+import socket
+import sys
+import typing as ty
+
+from pathlib import Path
+
+SOCKET = Path(os.environ.get(
+  'TKDBOX_SOCKET', Path('~/.notes/tkdbox.sock').expanduser()))
+
+# long-running commands the daemon shouldn't be tied up with
+LOCAL_COMMANDS = ('serve', 'watch', 'outbox')
+# common options taking a value (cf. `main.Cli._parser`), to find the command
+# without importing it
+VALUE_OPTIONS = ('--cfg', '--deadline', '--hedge')
+
+
+def request(
+    argv: ty.Sequence[str],
+    path: ty.Union[str, Path] = SOCKET,
+    stdout: ty.TextIO = sys.stdout,
+    stderr: ty.TextIO = sys.stderr,
+    read: ty.Callable[[str], str] = input) -> int:
+  """Run `argv` in the daemon at `path`, returns the exit code.
+
+  Raises `OSError` if there's no daemon listening.
+  """
+  stdin = sys.stdin  # as when sent, not as swapped by an in-process daemon
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.connect(str(path))
+    f = sock.makefile('rw', encoding='utf8', newline='\n')
+    send = lambda msg: (f.write(json.dumps(msg) + '\n'), f.flush())
+    send({'argv': list(argv), 'cwd': os.getcwd()})
+    for line in f:
+      msg = json.loads(line)
+      if 'out' in msg:
+        stdout.write(msg['out'])
+        stdout.flush()
+      elif 'err' in msg:
+        stderr.write(msg['err'])
+        stderr.flush()
+      elif 'prompt' in msg:
+        try:
+          answer = read(msg['prompt'])
+        except EOFError:
+          answer = ''
+        send({'input': answer})
+      elif 'stdin' in msg:
+        send({'input': stdin.read()})
+      elif 'exit' in msg:
+        return msg['exit']
+  return 1  # daemon went away mid-command
+
+
+def command(argv: ty.Sequence[str]) -> ty.Optional[str]:
+  """The subcommand in `argv`, past any options before it."""
+  args = iter(argv)
+  for arg in args:
+    if arg in VALUE_OPTIONS:
+      next(args, None)
+    elif not arg.startswith('-'):
+      return arg.replace('-', '_')
+  return None
+
+
+def main(argv: ty.Optional[ty.Sequence[str]] = None):
+  argv = sys.argv[1:] if argv is None else argv
+  if command(argv) not in LOCAL_COMMANDS:
+    try:
+      sys.exit(request(argv, SOCKET))
+    except (FileNotFoundError, ConnectionRefusedError):
+      pass  # no daemon, run in-process
+  from tk.dbox import main as app
+  app.Cli.run(argv)
@@ -0,0 +1,186 @@
+"""Resident `tkdbox serve` process, answering `client` over a unix socket.
+
+Keeps clients warm between commands (connection pools, caches, parsed
+config), so repeated commands skip imports, config and TLS handshakes.
+Commands run one at a time, with stdin/stdout/stderr, logs and prompts
+forwarded to (or from) the client that sent them.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+import typing as ty
+
+from pathlib import Path
+
+from tk.dbox.utils import cli
+
+L = logging.getLogger(__name__)
+
+Send = ty.Callable[[dict], None]
+
+
+class _Stream(io.TextIOBase):
+  """Writes go to the client as `{key: text}` messages."""
+
+  def __init__(self, send: Send, key: str):
+    self._send = send
+    self._key = key
+
+  def writable(self) -> bool:
+    return True
+
+  def write(self, s: str) -> int:
+    if s:
+      self._send({self._key: s})
+    return len(s)
+
+
+class _Stdin(io.TextIOBase):
+  """Reads get the client's stdin, all of it on first use."""
+
+  def __init__(self, fetch: ty.Callable[[], str]):
+    self._fetch = fetch
+    self._text: ty.Optional[io.StringIO] = None
+
+  def readable(self) -> bool:
+    return True
+
+  def _buffer(self) -> io.StringIO:
+    if self._text is None:
+      self._text = io.StringIO(self._fetch())
+    return self._text
+
+  def read(self, size: ty.Optional[int] = -1) -> str:
+    return self._buffer().read(size)
+
+  def readline(self, size: ty.Optional[int] = -1) -> str:
+    return self._buffer().readline(size)
+
+
+@contextlib.contextmanager
+def _redirect_stdin(stream: ty.TextIO) -> ty.Iterator[None]:
+  # `contextlib` only has `redirect_stdout`/`redirect_stderr`
+  old, sys.stdin = sys.stdin, stream
+  try:
+    yield
+  finally:
+    sys.stdin = old
+
+
+@contextlib.contextmanager
+def _cwd(path: ty.Optional[str]) -> ty.Iterator[None]:
+  old = os.getcwd()
+  if path:
+    os.chdir(path)
+  try:
+    yield
+  finally:
+    os.chdir(old)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    f = self.request.makefile('rw', encoding='utf8', newline='\n')
+    lock = threading.Lock()  # logs may come from worker threads
+
+    def send(msg: dict):
+      with lock:
+        f.write(json.dumps(msg) + '\n')
+        f.flush()
+
+    def ask(msg: dict) -> str:
+      send(msg)
+      if not (line := f.readline()):
+        raise EOFError('Client went away')
+      return json.loads(line)['input']
+
+    try:
+      if not (line := f.readline()):
+        return
+      msg = json.loads(line)
+      send({'exit': self.server.execute(
+        msg['argv'], msg.get('cwd'), send,
+        read=lambda prompt: ask({'prompt': prompt}),
+        stdin=lambda: ask({'stdin': True}))})
+    except OSError as e:  # e.g. client hit Ctrl-C
+      L.info('Client disconnected: %s', e)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def __init__(
+      self,
+      path: ty.Union[str, Path],
+      run: ty.Callable[[list[str]], ty.Any]):
+    """`run(argv)` executes one command line, cf. `main.Cli.serve`."""
+    self.path = Path(path).expanduser()
+    self.run = run
+    self.lock = threading.Lock()
+    if self.path.exists():
+      if _listening(self.path):
+        raise OSError(f'Already serving on {self.path}')
+      self.path.unlink()  # stale, from a daemon that died
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    super().__init__(str(self.path), _Handler)
+
+  def server_bind(self):
+    # owner-only from the start; a chmod after `bind` leaves a window where
+    # other local users could connect
+    umask = os.umask(0o177)
+    try:
+      super().server_bind()
+    finally:
+      os.umask(umask)
+
+  def execute(
+      self,
+      argv: list[str],
+      cwd: ty.Optional[str],
+      send: Send,
+      read: ty.Callable[[str], str],
+      stdin: ty.Callable[[], str] = lambda: '') -> int:
+    """Run one command, forwarding its output and prompts. Returns exit code.
+
+    `stdin()` gets the client's stdin, only called if the command reads it.
+    """
+    out, err = _Stream(send, 'out'), _Stream(send, 'err')
+    handler = logging.StreamHandler(err)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    root = logging.getLogger()
+    with (self.lock, _cwd(cwd), contextlib.redirect_stdout(out),
+          contextlib.redirect_stderr(err), _redirect_stdin(_Stdin(stdin)),
+          cli.input_from(read)):
+      root.addHandler(handler)
+      L.debug('Running: %s', argv)
+      try:
+        self.run(argv)
+        return 0
+      except SystemExit as e:  # argparse errors, --help
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+      except Exception:
+        traceback.print_exc()
+        return 1
+      finally:
+        root.removeHandler(handler)
+
+  def server_close(self):
+    super().server_close()
+    self.path.unlink(missing_ok=True)
+
+
+def _listening(path: Path) -> bool:
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    try:
+      sock.connect(str(path))
+      return True
+    except OSError:
+      return False
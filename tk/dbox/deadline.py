@@ -0,0 +1,177 @@
+"""Deadlines spanning a whole command, plus hedged calls to cap tail latency.
+
+The current deadline lives in a context variable: `Transport` clamps socket
+timeouts to it, streamed bodies check it between chunks (`bounded`), `Api`
+won't start (or sleep before retrying) past it.
+Worker threads don't inherit context, so wrap their callables in `propagate`.
+"""
+import concurrent.futures as cf
+import contextlib
+import contextvars
+import dataclasses as dcls
+import functools
+import logging
+import re
+import threading
+import time
+import typing as ty
+
+L = logging.getLogger(__name__)
+T = ty.TypeVar('T')
+
+
+class DeadlineExceeded(TimeoutError):
+  pass
+
+
+@dcls.dataclass(frozen=True)
+class Deadline:
+  at: float  # in `time.monotonic()` terms
+
+  @classmethod
+  def after(cls, seconds: float) -> 'Deadline':
+    return cls(time.monotonic() + seconds)
+
+  def remaining(self) -> float:
+    return max(0., self.at - time.monotonic())
+
+  def expired(self) -> bool:
+    return self.remaining() <= 0
+
+  def check(self, what: str = ''):
+    if self.expired():
+      raise DeadlineExceeded(f'Deadline exceeded {what}'.strip())
+
+  def clamp(self, timeout: ty.Union[None, float, tuple]) -> ty.Union[float, tuple]:
+    """Clamp a `requests` timeout (float or (connect, read)) to what's left."""
+    left = self.remaining()
+    if isinstance(timeout, tuple):
+      return tuple(left if t is None else min(t, left) for t in timeout)
+    return left if timeout is None else min(timeout, left)
+
+
+_current: contextvars.ContextVar[ty.Optional[Deadline]] = contextvars.ContextVar(
+  'deadline', default=None)
+
+
+def current() -> ty.Optional[Deadline]:
+  return _current.get()
+
+
+@contextlib.contextmanager
+def scope(seconds: ty.Optional[float]) -> ty.Iterator[ty.Optional[Deadline]]:
+  """Run the block under a deadline `seconds` from now (nested: tightest wins).
+
+  `None` means no (additional) deadline.
+  """
+  outer = current()
+  if seconds is None:
+    yield outer
+    return
+  inner = Deadline.after(seconds)
+  if outer is not None and outer.at < inner.at:
+    inner = outer
+  token = _current.set(inner)
+  try:
+    yield inner
+  finally:
+    _current.reset(token)
+
+
+def propagate(fn: ty.Callable[..., T]) -> ty.Callable[..., T]:
+  """Bind `fn` to the caller's deadline, e.g. before handing it to a thread."""
+  deadline = current()
+
+  @functools.wraps(fn)
+  def _inner(*args, **kwargs):
+    token = _current.set(deadline)
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      _current.reset(token)
+  return _inner
+
+
+_UNITS = {'ms': 1e-3, 's': 1., 'm': 60., 'h': 3600.}
+_RE_DURATION = re.compile(r'^\s*(\d+(?:\.\d*)?)\s*(ms|s|m|h)?\s*$')
+
+
+def parse(duration: str) -> float:
+  """`20s`, `1.5m`, `500ms`, `20` (seconds) -> seconds."""
+  if not (m := _RE_DURATION.match(duration)):
+    raise ValueError(f'Bad duration: {duration} (try e.g. 20s, 2m, 500ms)')
+  value, unit = m.groups()
+  return float(value) * _UNITS[unit or 's']
+
+
+def bounded(chunks: ty.Iterable[T], what: str = '') -> ty.Iterator[T]:
+  """`chunks` (e.g. of a streamed body), checking the deadline before each.
+
+  Socket timeouts only bound each read, so a slow-drip body could otherwise
+  go on well past the deadline.
+  """
+  deadline = current()
+  for chunk in chunks:
+    if deadline:
+      deadline.check(what)
+    yield chunk
+
+
+def _start(call: ty.Callable[[], T]) -> cf.Future:
+  """Run `call` on a thread of its own.
+
+  Not a shared pool: with callers hedging from several workers at once, the
+  backups would queue behind the very calls they're meant to race.
+  """
+  future: cf.Future = cf.Future()
+
+  def _run():
+    if future.set_running_or_notify_cancel():
+      try:
+        future.set_result(call())
+      except Exception as e:
+        future.set_exception(e)
+  threading.Thread(target=_run, name='hedge', daemon=True).start()
+  return future
+
+
+def _discard(future: cf.Future):
+  """Close what a losing hedged call returned, e.g. a streamed response."""
+  if not future.cancelled() and future.exception() is None and (
+      close := getattr(future.result(), 'close', None)):
+    close()
+
+
+def hedge(call: ty.Callable[[], T], after: float) -> T:
+  """Run `call`; if it's still pending after `after`s, start a second one.
+
+  Returns whichever finishes first. The slower one is left to finish in the
+  background, then closed if it can be (so a streamed response gives its
+  connection back). Only use for idempotent calls.
+  """
+  call = propagate(call)
+  first = _start(call)
+  done, _ = cf.wait([first], timeout=after)
+  if done:
+    return first.result()
+  L.debug('Hedging after %.2fs', after)
+  pending = [first, _start(call)]
+  deadline = current()
+  error = None
+  try:
+    for future in cf.as_completed(
+        pending, timeout=deadline.remaining() if deadline else None):
+      try:
+        result = future.result()
+      except Exception as e:  # the other one may still succeed
+        error = e
+        continue
+      for other in pending:
+        if other is not future:
+          other.add_done_callback(_discard)
+      return result
+  except cf.TimeoutError as e:
+    for future in pending:
+      future.add_done_callback(_discard)
+    raise DeadlineExceeded('Deadline exceeded while hedging') from e
+  raise error
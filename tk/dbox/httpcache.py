@@ -0,0 +1,213 @@
+"""On-disk HTTP cache for GET requests, cf. `api.Api.http_cache`.
+
+Stores bodies with their validators (`ETag`, `Last-Modified`) and freshness
+(`Cache-Control`, `Expires`). Fresh entries are served without a request,
+stale ones are revalidated conditionally, so an unchanged page costs a 304.
+A streamed page may be stored `partial`ly, only as far as it was read.
+Total body size is kept under `max_bytes` by dropping least recently used.
+"""
+import dataclasses as dcls
+import email.utils
+import json
+import logging
+import threading
+import time
+import typing as ty
+
+from pathlib import Path
+
+import requests
+import requests.structures
+
+from tk.dbox.utils import db
+
+L = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+  url TEXT PRIMARY KEY,
+  headers TEXT NOT NULL,
+  body BLOB NOT NULL,
+  size INTEGER NOT NULL,
+  expires REAL NOT NULL,
+  used REAL NOT NULL,
+  partial INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses(used);
+'''
+
+# worth keeping; hop-by-hop & per-response ones (Date, Set-Cookie, ...) aren't
+KEEP_HEADERS = (
+  'Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Expires',
+  'Content-Language')
+# without explicit freshness, a fraction of the time since Last-Modified
+# (RFC 9111 4.2.2), at most this long
+MAX_HEURISTIC = 86400.
+
+
+def _directives(cache_control: str) -> dict[str, ty.Optional[str]]:
+  """`Cache-Control: max-age=60, no-cache` -> `{'max-age': '60', 'no-cache': None}`."""
+  directives = {}
+  for part in filter(None, map(str.strip, cache_control.split(','))):
+    k, _, v = part.partition('=')
+    directives[k.strip().lower()] = v.strip().strip('"') or None
+  return directives
+
+
+def _date(value: ty.Optional[str]) -> ty.Optional[float]:
+  try:
+    return email.utils.parsedate_to_datetime(value).timestamp() if value else None
+  except (TypeError, ValueError):
+    return None
+
+
+def expires(headers: ty.Mapping[str, str], now: float) -> ty.Optional[float]:
+  """Until when a response is fresh; None if it mustn't be stored at all."""
+  directives = _directives(headers.get('Cache-Control', ''))
+  if 'no-store' in directives or 'private' in directives:
+    return None
+  if 'no-cache' in directives:
+    return now
+  age = float(headers.get('Age') or 0)
+  if (max_age := directives.get('max-age')) is not None:
+    try:
+      return now + float(max_age) - age
+    except ValueError:
+      return now
+  if 'Expires' in headers:  # invalid ones (e.g. `0`) mean already expired
+    return _date(headers['Expires']) or now
+  if modified := _date(headers.get('Last-Modified')):
+    date = _date(headers.get('Date')) or now
+    return now + min(MAX_HEURISTIC, max(0., date - modified) / 10) - age
+  return now
+
+
+@dcls.dataclass
+class Entry:
+  url: str
+  headers: dict
+  body: bytes
+  expires: float
+  partial: bool = False  # just the start of the body, cf. `HttpCache.put`
+
+  def fresh(self, now: ty.Optional[float] = None) -> bool:
+    return (time.time() if now is None else now) < self.expires
+
+  def validators(self) -> dict[str, str]:
+    """Headers making a request conditional on the page having changed."""
+    validators = {}
+    if etag := self.headers.get('ETag'):
+      validators['If-None-Match'] = etag
+    if modified := self.headers.get('Last-Modified'):
+      validators['If-Modified-Since'] = modified
+    return validators
+
+  def response(self) -> requests.Response:
+    """As if it came from the server just now."""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = self.url
+    response.headers = requests.structures.CaseInsensitiveDict(self.headers)
+    response._content = self.body
+    response._content_consumed = True  # for `iter_content`
+    response.from_cache = True  # cf. `api.GenericHtml.stream`
+    response.partial = self.partial
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+class HttpCache:
+
+  def __init__(self, path: ty.Union[str, Path], max_bytes: int = 256 * 2**20):
+    self._path = path
+    self._db: ty.Optional[db.Db] = None
+    self._lock = threading.Lock()
+    self.max_bytes = max_bytes
+
+  @property
+  def db(self) -> db.Db:
+    with self._lock:  # not before it's needed
+      if self._db is None:
+        self._db = db.Db(self._path, SCHEMA)
+      return self._db
+
+  def get(self, url: str) -> ty.Optional[Entry]:
+    rows = self.db.execute(
+      'UPDATE responses SET used = ? WHERE url = ? '
+      'RETURNING url, headers, body, expires, partial', (time.time(), url))
+    if not rows:
+      return None
+    row = dict(rows[0])
+    row['headers'] = json.loads(row['headers'])
+    row['partial'] = bool(row['partial'])
+    return Entry(**row)
+
+  def drop(self, url: str):
+    self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+
+  def _until(self, response: requests.Response, now: float) -> ty.Optional[float]:
+    """When a `response` stored now expires; None if not worth storing."""
+    if response.status_code != 200 or (
+        until := expires(response.headers, now)) is None:
+      return None
+    if until <= now and not (
+        'ETag' in response.headers or 'Last-Modified' in response.headers):
+      return None  # can neither serve nor revalidate it
+    if int(response.headers.get('Content-Length') or 0) > self.max_bytes:
+      return None
+    return until
+
+  def storable(self, response: requests.Response) -> bool:
+    return self._until(response, time.time()) is not None
+
+  def put(
+      self,
+      url: str,
+      response: requests.Response,
+      body: ty.Optional[bytes] = None,
+      partial: bool = False) -> ty.Optional[Entry]:
+    """Store a 200 response if allowed and revalidatable or fresh at all.
+
+    `body`: for streamed responses, what was read of it; `partial` if that's
+    not all of it.
+    """
+    now = time.time()
+    if (until := self._until(response, now)) is None:
+      return None
+    headers = {k: v for k in KEEP_HEADERS if (v := response.headers.get(k))}
+    if body is None:
+      body = response.content
+    if len(body) > self.max_bytes:
+      return None
+    self.db.execute(
+      'INSERT OR REPLACE INTO responses '
+      '(url, headers, body, size, expires, used, partial) '
+      'VALUES (?, ?, ?, ?, ?, ?, ?)',
+      (url, json.dumps(headers), body, len(body), until, now, partial))
+    self.evict()
+    return Entry(url, headers, body, until, partial)
+
+  def revalidated(self, entry: Entry, response: requests.Response) -> Entry:
+    """Refresh `entry` after a 304 `response` (which may update headers)."""
+    headers = {**entry.headers, **{
+      k: v for k in KEEP_HEADERS if (v := response.headers.get(k))}}
+    now = time.time()
+    if (until := expires(headers, now)) is None:
+      self.drop(entry.url)
+      return dcls.replace(entry, headers=headers, expires=now)
+    self.db.execute(
+      'UPDATE responses SET headers = ?, expires = ?, used = ? WHERE url = ?',
+      (json.dumps(headers), until, now, entry.url))
+    return dcls.replace(entry, headers=headers, expires=until)
+
+  def evict(self) -> int:
+    """Drop least recently used entries beyond `max_bytes` in total."""
+    rows = self.db.execute(
+      'DELETE FROM responses WHERE url IN (SELECT url FROM ('
+      '  SELECT url, sum(size) OVER (ORDER BY used DESC, url) AS total'
+      '  FROM responses) WHERE total > ?) RETURNING size', (self.max_bytes,))
+    if rows:
+      L.debug('Evicted %s cached pages (%.1fMB)',
+              len(rows), sum(r['size'] for r in rows) / 2**20)
+    return len(rows)
@@ -0,0 +1,193 @@
+"""Local index of Dropbox metadata, kept fresh with `list_folder` cursors.
+
+The first refresh of a root lists it fully; later ones replay only what
+changed since the saved cursor, so they cost O(changes) instead of
+O(account size). Lives in the local sqlite file (`Defaults.Local.DB`).
+"""
+import logging
+import time
+import typing as ty
+
+from pathlib import Path
+
+from tk.dbox import api
+from tk.dbox import retry
+from tk.dbox.utils import db
+
+L = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+  path_lower TEXT PRIMARY KEY,
+  id TEXT,
+  name TEXT,
+  path_display TEXT,
+  content_hash TEXT,
+  server_modified TEXT,
+  size INTEGER,
+  is_dir INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_name ON files(name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS cursors (
+  root TEXT PRIMARY KEY,
+  cursor TEXT NOT NULL,
+  updated REAL
+);
+'''
+
+_TIME_FMT = '%Y-%m-%dT%H:%M:%SZ'
+_BATCH = 500
+
+
+def _norm(path: ty.Optional[str]) -> str:
+  """Lowercased, `''` for the account root, `/a/b` otherwise."""
+  return api._pathnorm((path or '').rstrip('/')).lower()
+
+
+def _like_prefix(path: str) -> str:
+  return path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+
+
+class Index:
+
+  def __init__(self, path: ty.Union[str, Path]):
+    self.db = db.Db(path, SCHEMA)
+
+  def roots(self) -> list[str]:
+    return [r['root'] for r in self.db.execute('SELECT root FROM cursors')]
+
+  def covering_root(self, path: str) -> ty.Optional[str]:
+    """Indexed root that `path` lives under, if any."""
+    path = _norm(path)
+    for root in sorted(self.roots(), key=len):
+      if path == root or path.startswith(root + '/') or not root:
+        return root
+    return None
+
+  def cursor(self, root: str) -> ty.Optional[str]:
+    rows = self.db.execute(
+      'SELECT cursor FROM cursors WHERE root = ?', (_norm(root),))
+    return rows[0]['cursor'] if rows else None
+
+  def save_cursor(self, root: str, cursor: str):
+    self.db.execute(
+      'INSERT OR REPLACE INTO cursors (root, cursor, updated) VALUES (?, ?, ?)',
+      (_norm(root), cursor, time.time()))
+
+  def root_of(self, path: str) -> str:
+    """The indexed root covering `path`, else `path` itself (normalized)."""
+    if (covering := self.covering_root(path)) is not None:
+      return covering
+    return _norm(path)
+
+  def refresh(self, dropbox: api.Dropbox, root: str = '') -> int:
+    """Bring `root` (or the indexed root covering it) up to date.
+
+    Returns the number of entries applied.
+    """
+    root = self.root_of(root)
+    if (changes := self.changes(dropbox, root)) is not None:
+      return len(changes)
+    # Take the cursor *before* listing so nothing that changes meanwhile is
+    # missed; replaying those changes later is harmless.
+    latest = dropbox.latest_cursor(root, recursive=True, include_deleted=True)
+    self._forget(root)
+    L.info('Indexing `%s` from scratch...', root or '/')
+    n = self.apply(dropbox.ls(root, recursive=True, exhaust=True))
+    self.save_cursor(root, latest)
+    return n
+
+  def changes(
+      self,
+      dropbox: api.Dropbox,
+      root: str = '') -> ty.Optional[list[ty.Union[api.FileResponse, dict]]]:
+    """Apply and return what changed since the saved cursor.
+
+    None if there's no (valid) cursor, i.e. `refresh` needs to re-list.
+    """
+    root = self.root_of(root)
+    if not (cursor := self.cursor(root)):
+      return None
+    try:
+      pages = dropbox.ls(root, recursive=True, exhaust=True, cursor=cursor)
+      entries = list(pages)
+    except retry.ApiError as e:
+      if 'reset' not in str(e):
+        raise
+      L.warning('Cursor for `%s` expired, re-listing', root or '/')
+      self.db.execute('DELETE FROM cursors WHERE root = ?', (root,))
+      return None
+    self.apply(entries)
+    self.save_cursor(root, pages.cursor or cursor)
+    L.debug('Index delta for `%s`: %s changes', root or '/', len(entries))
+    return entries
+
+  def apply(self, entries: ty.Iterable[ty.Union[api.FileResponse, dict]]) -> int:
+    """Upsert files/folders, drop deleted entries (which come as dicts)."""
+    n, upserts = 0, []
+    for n, entry in enumerate(entries, 1):
+      if isinstance(entry, api.FileResponse):
+        upserts.append(self._row(entry))
+      elif entry.get('.tag') == 'deleted':
+        self._flush(upserts)
+        self._forget(entry.get('path_lower') or entry['path_display'].lower())
+      if len(upserts) >= _BATCH:
+        self._flush(upserts)
+    self._flush(upserts)
+    return n
+
+  @staticmethod
+  def _row(f: api.FileResponse) -> tuple:
+    modified = f.server_modified.strftime(_TIME_FMT) if f.server_modified else None
+    return (
+      f.path_lower, f.id, f.name, f.path_display, f.content_hash, modified,
+      f.size, int(f.is_dir))
+
+  def _flush(self, upserts: list[tuple]):
+    if upserts:
+      self.db.executemany(
+        'INSERT OR REPLACE INTO files (path_lower, id, name, path_display, '
+        'content_hash, server_modified, size, is_dir) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', upserts)
+      upserts.clear()
+
+  def _forget(self, path: str):
+    """Drop `path` and everything below it."""
+    path = _norm(path)
+    if not path:
+      self.db.execute('DELETE FROM files')
+    else:
+      self.db.execute(
+        "DELETE FROM files WHERE path_lower = ? OR path_lower LIKE ? ESCAPE '\\'",
+        (path, _like_prefix(path)))
+
+  @staticmethod
+  def _file(row) -> api.FileResponse:
+    d = dict(row)
+    d['.tag'] = 'folder' if d.pop('is_dir') else 'file'
+    return api.FileResponse.fromdict(d)
+
+  def ls(self, path: str, recursive: bool = False) -> list[api.FileResponse]:
+    path = _norm(path)
+    sql = "SELECT * FROM files WHERE path_lower LIKE ? ESCAPE '\\'"
+    params: list = [_like_prefix(path)]
+    if not recursive:  # nothing but the name after the `path/` prefix
+      sql += " AND instr(substr(path_lower, ?), '/') = 0"
+      params.append(len(path) + 2)
+    return [self._file(r) for r in self.db.execute(sql + ' ORDER BY path_lower', params)]
+
+  def search(
+      self,
+      query: str,
+      path: ty.Optional[str] = None,
+      file_extensions: ty.Optional[list[str]] = None) -> list[api.FileResponse]:
+    """Files whose name contains every word of `query` (case-insensitive)."""
+    sql = "SELECT * FROM files WHERE is_dir = 0 AND path_lower LIKE ? ESCAPE '\\'"
+    params: list = [_like_prefix(_norm(path))]
+    for word in query.lower().split():
+      sql += " AND instr(lower(name), ?) > 0"
+      params.append(word)
+    if file_extensions:
+      sql += ' AND (' + ' OR '.join(['lower(name) LIKE ?'] * len(file_extensions)) + ')'
+      params.extend(f'%.{e.lower().lstrip(".")}' for e in file_extensions)
+    return [self._file(r) for r in self.db.execute(sql + ' ORDER BY path_lower', params)]
@@ -6,6 +6,8 @@ It will also sync / normalize papers names from various sources.
 IDK if the app does anything else that's useful.
 """
 import argparse
+import collections
+import concurrent.futures as cf
 import dataclasses as dcls
 import datetime as dt
 import functools
@@ -13,11 +15,28 @@ import itertools as it
 import json
 import logging
 import os
+import subprocess
+import sys
+import time
 import typing as ty
 
 from tk.dbox import api
+from tk.dbox import auth as oauth
+from tk.dbox import cache
+from tk.dbox import client
+from tk.dbox import daemon
+from tk.dbox import deadline as dl
+from tk.dbox import httpcache
+from tk.dbox import index as idx
+from tk.dbox import outbox as ob
+from tk.dbox import retry
+from tk.dbox import sync as syncplan
+from tk.dbox import transport as xport
+from tk.dbox import watch as watcher
 from tk.dbox.provider import auto
 from tk.dbox.utils import cli
+from tk.dbox.utils import hashing
+from tk.dbox.utils import text as txtutil
 
 from pathlib import Path
 from tk.dbox.provider.meta import CitationMetaExtractor as CME
@@ -38,6 +57,8 @@ class Defaults:
     NOTES_DIR = Path("~/.notes/").expanduser()
     PAPERS_DIR = NOTES_DIR / "papers"
     DB = NOTES_DIR / "tracker.sqlite"
+    TOKENS = NOTES_DIR / "tokens.json"
+    HTTP_CACHE = NOTES_DIR / "httpcache.sqlite"
 
 
 class Alias:
@@ -87,12 +108,47 @@ def _latest_dir(dir: str, prio: ty.Optional[int] = None) -> str:
   return new_name
 
 
+def _log_progress(what: str, every: float = .1) -> ty.Callable[[int, int], None]:
+  """Upload progress callback, logs each `every` (fraction) of the way."""
+  logged = 0.
+
+  def _progress(done: int, total: int):
+    nonlocal logged
+    if total and (frac := done / total) - logged >= every and done < total:
+      logged = frac
+      L.info('%s: %.0f%% of %.1fMB', what, 100 * frac, total / 2**20)
+  return _progress
+
+
+def _read_items(source: str) -> ty.Iterable[str]:
+  """Items for `put` from a file, `-` (stdin) or a `.bib` file."""
+  if source == '-':
+    text = sys.stdin.read()
+  else:
+    text = Path(source).expanduser().read_text()
+  if source.endswith('.bib'):
+    return txtutil.bib_items(text)
+  lines = (line.split('#', 1)[0].strip() for line in text.splitlines())
+  return filter(None, lines)
+
+
 @dcls.dataclass
 class Cli:
   dropbox: api.Dropbox
   dropbox_content: api.DropboxContent
   content_dispatcher: auto.Dispatcher
   notion: ty.Optional[api.Notion] = None
+  # if set, listings & searches are answered locally after a delta refresh
+  index: ty.Optional[idx.Index] = None
+  # Dropbox folders known to exist
+  folders: ty.Optional[cache.Folders] = None
+  # files `metafix` already looked at
+  examined: ty.Optional[cache.Examined] = None
+  # config this was built from, for background drains
+  cfg: ty.Optional[Path] = None
+  _index_refreshed: float = dcls.field(default=0., init=False, repr=False)
+  # deferred `put`s, cf. `outbox`
+  _journal: ty.Optional[ob.Outbox] = dcls.field(default=None, init=False, repr=False)
 
   alias: ty.ClassVar[Alias] = Alias({
     "papers": Defaults.PAPERS_DIR,
@@ -102,35 +158,149 @@ class Cli:
   })
 
   @classmethod
-  def run(cls: ty.Type) -> ty.Any:
+  @functools.cache
+  def _parser(cls) -> tuple[argparse.ArgumentParser, dict]:
     common_args = argparse.ArgumentParser(add_help=False)
     common_args.add_argument('-v', '--verbose', action='count', default=0)
     common_args.add_argument('--cfg', type=str, default=Defaults.CONFIG_JSON)
-    method, args = cli.cli_from_instancemethods(cls, common_args, log=L)
-    if verbose := args.pop('verbose'):
-      _log = L if verbose == 1 else logging.getLogger('')
-      _log.setLevel(logging.DEBUG)
+    common_args.add_argument(
+      '--deadline', type=dl.parse, default=None,
+      help='Give up on the whole command after this long, e.g. 20s, 2m')
+    common_args.add_argument(
+      '--hedge', type=dl.parse, default=None,
+      help='Re-send metadata fetches still pending after this long, e.g. 1.5s')
+    common_args.add_argument(
+      '--index', action='store_true',
+      help=f'Answer listings/searches from the local index ({Defaults.Local.DB})')
+    common_args.add_argument(
+      '--no-cache', dest='no_cache', action='store_true',
+      help='Fetch paper metadata & pages again instead of using local caches')
+    return cli.parser_from_instancemethods(cls, common_args)
+
+  @classmethod
+  def parse(cls, argv: ty.Optional[ty.Sequence[str]] = None) -> tuple[ty.Callable, dict]:
+    """Method to call and its args; `build` args still included."""
+    return cli.parse(*cls._parser(), argv, log=L)
+
+  @classmethod
+  def build(
+      cls,
+      cfg: ty.Union[str, Path] = Defaults.CONFIG_JSON,
+      hedge: ty.Optional[float] = None,
+      index: bool = False,
+      no_cache: bool = False) -> 'Cli':
+    """Instance with clients set up per the config file at `cfg`."""
     notion = None
-    with open(args.pop('cfg')) as f:
+    with open(cfg) as f:
       authdict = json.load(f)
 
-      dbox = authdict['dropbox']
-      if not (auth := dbox.get('access_token')):
-          import copy
-          auth = copy.deepcopy(dbox)
+      if http := authdict.get('http'):  # e.g. {"pool_size": 32}
+        xport.configure(**http)
+
+      # one token (store) for both, so renewals are shared
+      credentials = oauth.Credentials.of(
+        authdict['dropbox'], store=oauth.TokenStore(Defaults.Local.TOKENS))
 
       if auth_notion := authdict.get('notion'):
         notion_secret = auth_notion.get('internal_integration_secret')
         notion_pageid = auth_notion.get('pages', {}).get('remarkable')
         notion = api.Notion(notion_secret, notion_pageid)
-    self = cls(
-        dropbox=api.Dropbox(auth),
-        dropbox_content=api.DropboxContent(auth),
-        content_dispatcher=auto.Dispatcher(),
+    return cls(
+        dropbox=api.Dropbox(credentials),
+        dropbox_content=api.DropboxContent(credentials),
+        content_dispatcher=auto.Dispatcher(
+          api.GenericHtml(hedge_after=hedge, http_cache=None if no_cache else (
+            httpcache.HttpCache(Defaults.Local.HTTP_CACHE))),
+          cache=None if no_cache else cache.MetaCache(Defaults.Local.DB)),
         notion=notion,
+        index=idx.Index(Defaults.Local.DB) if index else None,
+        folders=cache.Folders(Defaults.Local.DB),
+        examined=cache.Examined(Defaults.Local.DB, 'metafix'),
+        cfg=Path(cfg).expanduser(),
     )
+
+  @staticmethod
+  def _build_args(args: dict) -> dict:
+    return {k: args.pop(k) for k in ('cfg', 'hedge', 'index', 'no_cache')}
+
+  @classmethod
+  def run(cls: ty.Type, argv: ty.Optional[ty.Sequence[str]] = None) -> ty.Any:
+    method, args = cls.parse(argv)
+    self = cls.build(**cls._build_args(args))
+    return self._invoke(method, args)
+
+  def _invoke(self, method: ty.Callable, args: dict) -> ty.Any:
+    """Call the parsed `method` (cf. `parse`) on this instance."""
+    logger, level = None, None
+    if verbose := args.pop('verbose'):
+      logger = L if verbose == 1 else logging.getLogger('')
+      level = logger.level
+      logger.setLevel(logging.DEBUG)
     method = self.alias.wrap(method)
-    return method(self, **args)
+    try:
+      with dl.scope(args.pop('deadline')):
+        return method(self, **args)
+    except dl.DeadlineExceeded as e:
+      return L.error('Giving up: %s', e)
+    finally:
+      self._log_retries()
+      if logger is not None:
+        logger.setLevel(level)
+
+  def serve(self, socket: str = str(client.SOCKET)):
+    """Keep running, serving `tkdbox` commands with warm clients.
+
+    While this runs, `tkdbox` sends commands here over the `socket` instead
+    of starting from scratch. Clients are kept per config (file and flags).
+    """
+    warm: dict[tuple, Cli] = {}
+
+    def run(argv: list[str]):
+      method, args = self.parse(argv)
+      kw = self._build_args(args)
+      kw['cfg'] = cfg = Path(kw['cfg']).expanduser().resolve()
+      key = (*kw.values(), cfg.stat().st_mtime)  # config edits take effect
+      if (instance := warm.get(key)) is None:
+        instance = warm[key] = self.build(**kw)
+      return instance._invoke(method, args)
+
+    with daemon.Server(socket, run) as server:
+      L.info('Serving on %s (Ctrl-C to stop)', socket)
+      try:
+        server.serve_forever()
+      except KeyboardInterrupt:
+        L.info('Stopped serving.')
+
+  def _log_retries(self):
+    clients = (self.dropbox, self.dropbox_content, self.notion)
+    stats = [s for c in clients if c is not None for s in c.stats]
+    if any(s.retried for s in stats):
+      L.info('Retries: %s', retry.summarize(stats))
+
+  def _refresh_index(self, max_age: float = 2.):
+    if time.monotonic() - self._index_refreshed > max_age:
+      self.index.refresh(self.dropbox)
+      self._index_refreshed = time.monotonic()
+
+  def _ls(self, path: str, recursive: bool = False) -> ty.Iterable[api.FileResponse]:
+    """All of `path`, from the local index if enabled, else streamed from API."""
+    if self.index is None:
+      return self.dropbox.ls(path, recursive=recursive, exhaust=True)
+    self._refresh_index()
+    return self.index.ls(path, recursive)
+
+  def _search(
+      self,
+      query: str,
+      path: ty.Optional[str] = None,
+      file_extensions: ty.Optional[list] = None,
+      exhaust: bool = False) -> ty.Iterable[api.FileResponse]:
+    """Cf. `_ls`; the index always returns every match."""
+    if self.index is None:
+      return self.dropbox.search(
+        query, path=path, file_extensions=file_extensions, exhaust=exhaust)
+    self._refresh_index()
+    return self.index.search(query, path, file_extensions)
 
   def aliases(self):
     """List of all aliases available."""
@@ -139,11 +309,8 @@ class Cli:
 
   def ls(self, dir: str = Defaults.BOOKS_DIR):
     """List immediate contents of `dir`"""
-    print('\n'.join(
-      x.path for x in
-      self.dropbox.ls(dir).content
-      # if x.meta['.tag'] != 'file'
-    ))
+    for x in self._ls(dir):  # streamed page by page (or from the index)
+      print(x.path)
 
   def mv(self, src: str, dst: str):
     if (response := cli.prompt(f'Moving: {src}->{dst}. Continue?', 'yn')) == 'n':
@@ -159,20 +326,106 @@ class Cli:
       name: ty.Optional[str] = None,
       dispatcher: ty.Optional[str] = None,
       meta: ty.List[str] = None,
+      workers: int = 8,
+      defer: bool = False,
   ):
     """Send given file to dropbox `dir`.
 
     The `item` parameter can be a local directory, pdf, or ArXiv ID.
     If `dispatcher` is set, the dispatcher will explicitly be chosen by name.
     If `name` is set, it will overwrite the default file name.
+    Directories are uploaded by `workers` in parallel, subdirs preserved.
+    With `defer`, just queue it in the outbox and return; a background
+    `outbox drain` does the rest (without prompting about duplicates).
     """
+    if (local := Path(item).expanduser()).is_dir():
+      target = _latest_dir(dir, prio) if dir in (Defaults.PAPERS_DIR,) else dir
+      return self._put_dir(local, target, workers)
+
+    if defer:
+      if (path := Path(item).expanduser()).exists():
+        item = str(path.resolve())  # the drain may run elsewhere
+      entry, new = self._outbox().add(dict(
+        item=item, dir=dir, prio=prio, name=name, dispatcher=dispatcher,
+        meta=meta))
+      print('queued' if new else 'already queued', entry.id, item)
+      return self._spawn_drain()
+
+    # mkdir (unless cached) goes on while metadata is fetched, and so does
+    # the duplicate search if the file name is known up front (`name`).
+    # Otherwise the search waits for the name, the local hash doesn't.
+    with cf.ThreadPoolExecutor(4, thread_name_prefix='put') as pool:
+      submit = lambda f, *args: pool.submit(dl.propagate(f), *args)
+      target = submit(self._target_dir, dir, prio)
+      early = name if name and os.path.splitext(name)[1] else None
+      search = early and submit(self._duplicates, early)
+      resolved = self._resolve(item, dispatcher, meta)
+      if resolved is None:
+        return L.error('Failed to find dispatcher for: %s', item)
+      fname, pdfurl, meta = resolved
+      if (local := Path(pdfurl).expanduser()).is_file():
+        local_hash = submit(hashing.content_hash, local)
+
+      if name:
+        L.debug('Overwriting %s with %s', fname, name)
+        _, suf1 = os.path.splitext(fname)
+        _, suf2 = os.path.splitext(name)
+        if not suf2:
+          name = name + (suf1 if suf1 else '.pdf')
+          L.info("Renamed (suffix): %s to %s", suf2, name)
+        elif suf1 != suf2:
+          if cli.prompt(f"Suffix diff: {suf1} != {suf2}. Ok?", 'yn') == 'n':
+            return L.info("Cancelling")
+        fname = name
+      if fname != early:
+        search = submit(self._duplicates, fname)
+      # ready to go as soon as the prompt below is answered
+      page = self._notion_page(meta)
+
+      # check for existing files, allow user to bail
+      existing = search.result()
+      new_name = target.result()
+      path = os.path.join(new_name, fname)
+      if existing:
+        if local.is_file() and (same := [
+            x for x in existing if x.hash == local_hash.result()]):
+          return L.info('Identical file already at %s, not uploading', same[0].path)
+        names = [x.name for x in existing]
+        fmt = "\n- ".join(names[:10]) + ("\n- ..." if len(existing) > 10 else "")
+        if (response := cli.prompt(f'Found:\n- {fmt}. Continue?', 'ymn')) == 'n':
+          return L.info('Cancelling due to duplicate files:\n- %s', fmt)
+        elif response == 'm':  # move
+          if len(existing) != 1: return L.error("Needs to have 1 match")
+          src = existing[0].path_display
+          dst = os.path.join(new_name, existing[0].name)
+          if (response := cli.prompt(f'Moving: {src}->{dst}. Continue?', 'yn')) == 'n':
+            return L.info('Cancelling...')
+          response = self.dropbox.mv(src, dst)
+          return L.info("Server response: %s", response)
+
+      # neither needs the other
+      transfer = submit(self._transfer, pdfurl, path)
+      notion = submit(self._add_to_notion, meta, page)
+      if response_notion := notion.result():
+        L.info("Added to Notion! %s", response_notion)
+      return L.info('Server response: %s', transfer.result())
+
+  def _duplicates(self, fname: str) -> list[api.FileResponse]:
+    return self.dropbox.search(fname, file_extensions=['pdf']).content
+
+  def _resolve(
+      self,
+      item: str,
+      dispatcher: ty.Optional[str] = None,
+      meta: ty.Optional[ty.List[str]] = None,
+  ) -> ty.Optional[tuple[str, str, CME.Response]]:
+    """(file name, source URL or local path, metadata) for `item`, if any."""
     # https://www.dropbox.com/developers/documentation/http/documentation#files-save_url
     dispatcher = next(
       self.content_dispatcher(item) if dispatcher is None else
       self.content_dispatcher.by_name(dispatcher), None)
-
     if dispatcher is None:
-      return L.error('Failed to find dispatcher for: %s', item)
+      return None
 
     fname, pdfurl = dispatcher(item)
     if meta is not None:  # TODO ugly hack
@@ -182,88 +435,416 @@ class Cli:
     elif isinstance(fname, tuple):
       fname, meta = fname
 
-    if name:
-      L.debug('Overwriting %s with %s', fname, name)
-      _, suf1 = os.path.splitext(fname)
-      _, suf2 = os.path.splitext(name)
-      if not suf2:
-        name = name + (suf1 if suf1 else '.pdf')
-        L.info("Renamed (suffix): %s to %s", suf2, name)
-      elif suf1 != suf2:
-        if cli.prompt(f"Suffix diff: {suf1} != {suf2}. Ok?", 'yn') == 'n':
-          return L.info("Cancelling")
-      fname = name
-    path = os.path.join(dir, fname)
-
-    if dir in (Defaults.PAPERS_DIR,):
-      new_name = _latest_dir(dir, prio)
-      path = os.path.join(new_name, fname)
-      try:
-        L.info("Trying to create %s...", new_name)
-        result = self.dropbox.mkdir(new_name)
-      except:
-        L.info("Creating folder %s failed, probably exists", new_name)
-
-    # check for existing files, allow user to bail
-    if existing := self.dropbox.search(fname, file_extensions=['pdf']).content:
-      names = [x.name for x in existing]
-      fmt = "\n- ".join(names[:10]) + ("\n- ..." if len(existing) > 10 else "")
-      if (response := cli.prompt(f'Found:\n- {fmt}. Continue?', 'ymn')) == 'n':
-        return L.info('Cancelling due to duplicate files:\n- %s', fmt)
-      elif response == 'm':  # move
-        if len(existing) != 1: return L.error("Needs to have 1 match")
-        src = existing[0].path_display
-        dst = os.path.join(new_name, existing[0].name)
-        if (response := cli.prompt(f'Moving: {src}->{dst}. Continue?', 'yn')) == 'n':
-          return L.info('Cancelling...')
-        response = self.dropbox.mv(src, dst)
-        return L.info("Server response: %s", response)
-
     if meta is None:  # TODO
       L.warning("Meta is none!")
       meta = CME.Response(meta={}, title=fname, pdf_url=pdfurl)
-
+    return fname, pdfurl, meta
+
+  def _target_dir(self, dir: str, prio: ty.Optional[int] = None) -> str:
+    """Papers go to a dated subdir, created here unless known to exist."""
+    if dir not in (Defaults.PAPERS_DIR,):
+      return dir
+    new_name = _latest_dir(dir, prio)
+    if self.folders is not None and new_name in self.folders:
+      return new_name
+    try:
+      L.info("Trying to create %s...", new_name)
+      self.dropbox.mkdir(new_name)
+    except Exception as e:
+      if 'conflict' not in str(e):  # else it's there already
+        L.info("Creating folder %s failed: %s", new_name, e)
+        return new_name
+    if self.folders is not None:
+      self.folders.add(new_name)
+    return new_name
+
+  def _transfer(self, pdfurl: str, path: str) -> ty.Any:
+    """Upload if `pdfurl` is a local file, else have Dropbox fetch it."""
     L.info('Transfering PDF: %s -> %s', pdfurl, path)
     # NB this is some code smell, make dispatch handle this transparently?
     # Maybe by returning a function reference
     if (local := Path(pdfurl).expanduser()).exists():
       L.info('Uploading local `%s` to Dropbox `%s`', local, path)
       with local.open('rb') as fp:
-        response = self.dropbox_content.up(fp, str(path))
-    else:
-      response = self.dropbox.save_url(pdfurl, path)
-      L.info('Job ID: %s', response.content.get('async_job_id'))
-
-    response_notion = self.notion.add_paper(
+        return self.dropbox_content.up(fp, str(path), _log_progress(path))
+    response = self.dropbox.save_url(pdfurl, path)
+    L.info('Job ID: %s', response.content.get('async_job_id'))
+    return response
+
+  def _notion_page(self, meta: CME.Response) -> ty.Optional[dict]:
+    if self.notion is None:
+      return None
+    return self.notion.paper_page(
       title=f"[Pub/RM] {meta.title}",
       url=meta.pdf_url.replace("/pdf/", "/abs/"),
       abstract=meta.abstract,
       content=f"Paper by {', '.join(meta.author)} on {meta.date}",
     )
-    L.info("Added to Notion! %s", response_notion)
-    return L.info('Server response: %s', response)
 
-  def metafix(self):
+  def _add_to_notion(
+      self, meta: CME.Response, page: ty.Optional[dict] = None) -> ty.Any:
+    """`page`: if already built, cf. `_notion_page`."""
+    if self.notion is None:
+      return None
+    return self.notion.add_page(page or self._notion_page(meta))
+
+  def put_many(
+      self,
+      source: str = '-',
+      dir: str = Defaults.PAPERS_DIR,
+      prio: ty.Optional[int] = None,
+      workers: int = 8,
+  ):
+    """Like `put` for each item listed in `source` (`-` for stdin).
+
+    One item (URL, ArXiv ID or path) per line, `#` starts a comment. A `.bib`
+    file is read per entry instead (its `eprint`, `url` or `doi`).
+    Metadata is fetched by `workers` in parallel, names already in `dir` (or
+    the batch) are skipped, then transfers & Notion rows go out in parallel.
+    Never prompts; prints one `ok`/`skipped`/`failed` line per item.
+    """
+    items = list(dict.fromkeys(_read_items(source)))
+    if not items:
+      return L.warning('Nothing to put from %s', source)
+    started = time.monotonic()
+    status: dict[str, tuple[str, str]] = {}
+
+    with cf.ThreadPoolExecutor(workers, thread_name_prefix='put') as pool:
+      target = pool.submit(dl.propagate(self._target_dir), dir, prio)
+      self.content_dispatcher.prefetch(items)  # ArXiv: few requests for all
+      futures = {pool.submit(dl.propagate(self._resolve), i): i for i in items}
+      resolved = {}
+      for future in cf.as_completed(futures):
+        item = futures[future]
+        try:
+          if (result := future.result()) is None:
+            status[item] = ('failed', 'no dispatcher')
+          else:
+            resolved[item] = result
+        except Exception as e:
+          status[item] = ('failed', e)
+      L.info('Resolved %s/%s items in %.1fs',
+             len(resolved), len(items), time.monotonic() - started)
+
+      target = target.result()
+      try:  # one listing instead of a search per item
+        existing = {
+          f.name.lower(): f.path for f in self._ls(target, recursive=True)}
+      except retry.ApiError:
+        existing = {}
+      todo = {}
+      for item in items:  # in input order, so the first of any dupes wins
+        if item not in resolved:
+          continue
+        fname, pdfurl, meta = resolved[item]
+        if (other := existing.get(fname.lower())) is not None:
+          status[item] = ('skipped', other)
+          continue
+        path = os.path.join(target, fname)
+        existing[fname.lower()] = path
+        todo[item] = (pdfurl, path, meta)
+
+      def ingest(pdfurl: str, path: str, meta: CME.Response):
+        self._transfer(pdfurl, path)
+        self._add_to_notion(meta)
+        return path
+
+      futures = {
+        pool.submit(dl.propagate(ingest), *args): item
+        for item, args in todo.items()}
+      for future in cf.as_completed(futures):
+        item = futures[future]
+        try:
+          status[item] = ('ok', future.result())
+        except Exception as e:
+          status[item] = ('failed', e)
+
+    for item in items:
+      state, detail = status[item]
+      print(state, item, detail)
+    counts = collections.Counter(s for s, _ in status.values())
+    L.info('%s ok, %s skipped, %s failed, in %.1fs', counts['ok'],
+           counts['skipped'], counts['failed'], time.monotonic() - started)
+
+  def _outbox(self) -> ob.Outbox:
+    if self._journal is None:
+      self._journal = ob.Outbox(Defaults.Local.DB)
+    return self._journal
+
+  def _spawn_drain(self):
+    """Drain the outbox in a detached process that outlives this one."""
+    if self.cfg is None:
+      return L.info('Run `tkdbox outbox drain` to send it.')
+    log = Defaults.Local.NOTES_DIR / 'outbox.log'
+    with open(log, 'ab') as f:
+      subprocess.Popen(
+        [sys.executable, '-m', 'tk.dbox.main', 'outbox', 'drain',
+         '--wait', '--cfg', str(self.cfg)],
+        stdin=subprocess.DEVNULL, stdout=f, stderr=f, start_new_session=True)
+    L.debug('Draining in the background, log: %s', log)
+
+  # how long `outbox drain --wait` keeps waiting for the next retry
+  DRAIN_WAIT = 300.
+
+  def outbox(self, action: str, id: ty.Optional[int] = None, workers: int = 4,
+             wait: bool = False):
+    """Deferred `put`s (cf. `put --defer`): `status`, `drain` or `retry`.
+
+    `drain` sends whatever is due with `workers` in parallel; with `wait` it
+    also sits out retry backoffs (up to `DRAIN_WAIT`) until nothing's left.
+    `retry` puts failed items (all, or just `id`) back in the queue.
+    """
+    outbox = self._outbox()
+    if action == 'status':
+      entries = outbox.entries(ob.PENDING, ob.RUNNING, ob.FAILED)
+      for e in entries:
+        steps = ','.join(s for s in ('resolved', 'transfer', 'notion') if (
+          getattr(e, s) not in (None, 'job')))
+        print(e.id, e.state, e.args['item'], e.path or '-', steps or '-',
+              f'attempts={e.attempts}', e.error or '', sep='\t')
+      done = len(outbox.entries(ob.DONE))
+      return L.info('%s queued, %s done', len(entries), done)
+    if action == 'retry':
+      return L.info('Re-queued %s items', outbox.retry(id))
+    if action != 'drain':
+      return L.error('Unknown action: %s', action)
+
+    def drain() -> collections.Counter:
+      counts = collections.Counter()
+      deadline = dl.current()
+      while not (deadline and deadline.expired()):  # the rest stays queued
+        if (entry := outbox.claim()) is None:
+          if not wait or (due := outbox.next_due()) is None or (
+              (delay := due - time.time()) > self.DRAIN_WAIT):
+            break
+          time.sleep(max(0., min(delay, 5.)))
+          continue
+        counts[self._deliver(outbox, entry)] += 1
+      return counts
+
+    with cf.ThreadPoolExecutor(workers, thread_name_prefix='drain') as pool:
+      counts = sum(pool.map(dl.propagate(lambda _: drain()), range(workers)),
+                   collections.Counter())
+    L.info('Outbox: %s sent, %s to retry, %s failed, %s not ready',
+           counts[ob.DONE], counts['retry'], counts[ob.FAILED], counts[ob.PENDING])
+
+  def _deliver(self, outbox: ob.Outbox, entry: ob.Entry) -> str:
+    """Run the remaining steps of `entry`, checkpointing each one."""
+    args = entry.args
+    try:
+      if entry.resolved is None:
+        if (resolved := self._resolve(
+            args['item'], args['dispatcher'], args['meta'])) is None:
+          raise ValueError(f"No dispatcher for: {args['item']}")
+        fname, pdfurl, meta = resolved
+        if name := args['name']:  # unlike `put`, doesn't ask about the suffix
+          fname = name if os.path.splitext(name)[1] else (
+            name + (os.path.splitext(fname)[1] or '.pdf'))
+        outbox.checkpoint(entry, resolved=dict(
+          fname=fname, pdfurl=pdfurl, meta=dcls.asdict(meta)))
+      fname, pdfurl = entry.resolved['fname'], entry.resolved['pdfurl']
+
+      if entry.path is None:
+        outbox.checkpoint(entry, path=os.path.join(
+          self._target_dir(args['dir'], args['prio']), fname))
+
+      if entry.transfer is None:
+        try:
+          response = self._transfer(pdfurl, entry.path)
+        except retry.ApiError as e:
+          if 'conflict' not in str(e):
+            raise
+          L.info('%s exists already, from an earlier attempt?', entry.path)
+          response = None
+        if job_id := response and response.content.get('async_job_id'):
+          outbox.checkpoint(entry, transfer='job', job_id=job_id)
+        else:
+          outbox.checkpoint(entry, transfer='done')
+
+      if entry.transfer == 'job':
+        status = self.dropbox.save_url_status(entry.job_id)
+        if (tag := status.get('.tag')) == 'in_progress':
+          outbox.later(entry, 5.)
+          return ob.PENDING
+        if tag == 'failed':
+          outbox.checkpoint(entry, transfer=None, job_id=None)  # launch again
+          raise Exception(f'save_url failed: {status.get("failed")}')
+        outbox.checkpoint(entry, transfer='done')
+
+      if entry.notion is None:
+        page = self._add_to_notion(CME.Response(**entry.resolved['meta']))
+        outbox.checkpoint(entry, notion=page['id'] if page else '-')
+    except Exception as e:
+      if outbox.fail(entry, e):
+        L.warning('Outbox #%s failed, will retry: %s', entry.id, e)
+        return 'retry'
+      L.error('Outbox #%s failed for good: %s', entry.id, e)
+      return ob.FAILED
+    outbox.done(entry)
+    L.info('Outbox #%s sent to %s', entry.id, entry.path)
+    return ob.DONE
+
+  def _put_dir(self, local: Path, dir: str, workers: int = 8):
+    """Upload sessions for all files in parallel, then one batch commit."""
+    files = sorted(
+      p for p in local.rglob('*') if p.is_file() and not any(
+        part.startswith('.') for part in p.relative_to(local).parts))
+    if not files:
+      return L.warning('Nothing to upload in %s', local)
+    total = sum(p.stat().st_size for p in files)
+    L.info('Uploading %s files (%.1fMB) from %s to %s',
+           len(files), total / 2**20, local, dir)
+    try:  # what's there already, to skip identical files
+      remote = {
+        f.path_lower: f.hash for f in self._ls(dir, recursive=True) if not f.is_dir}
+    except retry.ApiError:  # e.g. `dir` doesn't exist yet
+      remote = {}
+    remote_path = lambda p: '/'.join([dir, *p.relative_to(local).parts])
+
+    def upload(p: Path) -> ty.Optional[dict]:
+      with p.open('rb') as fp:
+        if (h := remote.get(remote_path(p).lower())) and h == hashing.content_hash(fp):
+          return None
+        return self.dropbox_content.up_session(fp)
+
+    started, done = time.monotonic(), 0
+    uploads, failed, skipped = [], [], []
+    with cf.ThreadPoolExecutor(workers, thread_name_prefix='put') as pool:
+      futures = {pool.submit(dl.propagate(upload), p): p for p in files}
+      for future in cf.as_completed(futures):
+        p = futures[future]
+        try:
+          cursor = future.result()
+        except Exception as e:
+          failed.append((p, e))
+          continue
+        if cursor is None:
+          skipped.append(p)
+          continue
+        uploads.append((cursor, remote_path(p)))
+        done += cursor['offset']
+        L.debug('%s/%s files, %.1fMB', len(uploads), len(files), done / 2**20)
+    elapsed = time.monotonic() - started
+    L.info('Uploaded %.1fMB in %.1fs (%.1fMB/s), committing...',
+           done / 2**20, elapsed, done / 2**20 / max(elapsed, 1e-3))
+
+    results = self.dropbox.finish_upload_batch(uploads).content if uploads else []
+    for (_, path), result in zip(uploads, results):
+      if isinstance(result, api.FileResponse):
+        print('ok', result.path)
+      else:
+        print('failed', path, result.get('failure'))
+    for p, e in failed:
+      print('failed', p, e)
+    ok = sum(isinstance(r, api.FileResponse) for r in results)
+    L.info('%s/%s files uploaded, %s identical ones skipped, in %.1fs',
+           ok, len(files), len(skipped), time.monotonic() - started)
+
+  def mirror(
+      self,
+      remote: str = Defaults.BOOKS_DIR,
+      local: str = '.',
+      workers: int = 4):
+    """Download `remote` (recursively) into the `local` directory.
+
+    Files whose local copy has the same content hash are skipped, so repeated
+    runs only download what changed. Interrupted downloads resume.
+    """
+    local, remote = Path(local).expanduser(), remote.rstrip('/')
+    todo, skipped = [], 0
+    for f in self._ls(remote, recursive=True):
+      if f.is_dir or not f.path_lower.startswith(remote.lower() + '/'):
+        continue
+      dst = local.joinpath(*f.path[len(remote) + 1:].split('/'))
+      if dst.is_file() and dst.stat().st_size == f.size and (
+          hashing.content_hash(dst) == f.hash):
+        skipped += 1
+      else:
+        todo.append((f, dst))
+    total = sum(f.size or 0 for f, _ in todo)
+    L.info('Downloading %s files (%.1fMB), %s up to date',
+           len(todo), total / 2**20, skipped)
+
+    def download(f: api.FileResponse, dst: Path) -> dict:
+      dst.parent.mkdir(parents=True, exist_ok=True)
+      return self.dropbox_content.down(f.path, dst, rev=f.meta.get('rev'))
+
+    started, done, failed = time.monotonic(), 0, 0
+    with cf.ThreadPoolExecutor(workers, thread_name_prefix='mirror') as pool:
+      futures = {pool.submit(dl.propagate(download), f, dst): (f, dst) for f, dst in todo}
+      for future in cf.as_completed(futures):
+        f, dst = futures[future]
+        try:
+          future.result()
+        except Exception as e:
+          failed += 1
+          print('failed', f.path, e)
+          continue
+        done += f.size or 0
+        print('ok', dst)
+    elapsed = time.monotonic() - started
+    L.info('Downloaded %s/%s files, %.1fMB in %.1fs (%.1fMB/s)',
+           len(todo) - failed, len(todo), done / 2**20, elapsed,
+           done / 2**20 / max(elapsed, 1e-3))
+
+  def metafix(self, workers: int = 8, dry_run: bool = False, all: bool = False):
     """Rename leftover ArXiv files (`1234.12345.pdf`) to contain titles.
 
+    Only looks at PDFs added (or changed) since the last run, unless `all`.
+    Metadata is fetched by `workers` in parallel, renames go in one batch.
+    With `dry_run`, just print the renames.
+
     TODO: match more generic filenames?
     """
     L.info('Listing *all* files...')
     # Doesn't seem it supports regexes?
-    pdfs = self.dropbox.search('pdf', file_extensions=['pdf'], exhaust=True)
-    L.info('Found %s PDFs. Looking for files to rename.', len(pdfs.content))
-    for file in pdfs.content:
-      if matcher := next(self.content_dispatcher(file.name), None):
-        new_name, _ = matcher(file.name)
-        basepath, _ = os.path.split(file.path)
-        new_path = os.path.join(basepath, new_name)
-        L.info('Rename:\n  `%s`\n    -> `%s`', file.path, new_path)
-        self.dropbox.mv(file.path, new_path)
+    pdfs = list(self._search('pdf', file_extensions=['pdf'], exhaust=True))
+    todo = pdfs if all or self.examined is None else self.examined.new(pdfs)
+    L.info('%s PDFs, %s not examined before', len(pdfs), len(todo))
+
+    self.content_dispatcher.prefetch(f.name for f in todo)
+
+    def rename(file: api.FileResponse) -> ty.Optional[syncplan.Move]:
+      if not (matcher := next(self.content_dispatcher(file.name), None)):
+        return None
+      new_name, _ = matcher(file.name)
+      if isinstance(new_name, tuple):  # (name, meta)
+        new_name = new_name[0]
+      if new_name == file.name:
+        return None
+      basepath, _ = os.path.split(file.path)
+      return syncplan.Move(file.path, os.path.join(basepath, new_name))
+
+    renames, examined = [], []
+    with cf.ThreadPoolExecutor(workers, thread_name_prefix='metafix') as pool:
+      futures = {pool.submit(dl.propagate(rename), f): f for f in todo}
+      for future in cf.as_completed(futures):
+        try:
+          move = future.result()
+        except Exception as e:  # e.g. metadata fetch failed, next time then
+          L.warning('Skipping %s: %s', futures[future].path, e)
+          continue
+        if move is None:
+          examined.append(futures[future])
+        else:
+          renames.append((futures[future], move))
+    renames.sort(key=lambda r: r[1].src)
+    L.info('Looked at %s PDFs, renaming %s.', len(todo), len(renames))
+    if dry_run:
+      return print('\n'.join(str(move) for _, move in renames))
+    if renames:
+      results = self.dropbox.mv_batch([(m.src, m.dst) for _, m in renames])
+      for (file, move), result in zip(renames, results.content):
+        if self._batch_ok(result, 'Rename', move):
+          examined.append(file)
+    if self.examined is not None:
+      self.examined.add(examined)
 
   def sync(
       self,
       syncdir: str = Defaults.BOOKS_DIR,
-      archivedir: str = Defaults.ARCHIVE_DIR):
+      archivedir: str = Defaults.ARCHIVE_DIR,
+      plan_only: bool = False):
     """Sync files by moving from root to `syncdir`.
 
     Use-case: ReMarkable always uploads PDFs to Dropbox root `/`.
@@ -274,54 +855,76 @@ class Cli:
       * /books/nlp/AttentionIsAllYouNeed.pdf
 
     The old file will be moved to `archivedir` for just-in-case backup.
+    With `plan_only`, just print what would be moved.
     """
-    class Accum:
-      def __init__(self, chk):
-        self.chk = chk
-        self.fails = set()
-
-      def __call__(self, file: api.FileResponse, other: api.FileResponse):
-        if self.chk(file, other):
-          self.fails.add((file.path, other.path))
-          return True
-        return False
-
-      def __repr__(self):
-        return f'Accum({self.fails})'
-
-    early_exit = {
-      # if file hashes are equal, don't do the move
-      'hash': Accum(lambda f, o: f.hash == o.hash),
-      # if the other file was modified after original, also don't move
-      'modtime': Accum(lambda f, o: f.last_modified < o.last_modified),
-    }
-    L.info('Early exit conditions: %s', list(early_exit))
-
-    is_pdf = lambda f: f.name.endswith('.pdf')
-    is_rm_sync_folder = lambda f: (
-      f.path.startswith(syncdir) and not f.path.startswith(archivedir))
-
-    for file in filter(is_pdf, self.dropbox.ls('/').content):
-      others_same_name = self.dropbox.search(
-          file.name, path=syncdir, filename_only=True).content
-      L.debug('Match %s: %s', file.name, [f.path for f in others_same_name])
-      if other := next(filter(is_rm_sync_folder, others_same_name), None):
-        if any(c(file, other) for c in early_exit.values()):
-          continue
-        # rm would be a bit unsafe if it fails, so this is a simple workaround.
-        # con: you'll have to periodically manual delete the trash folder
-        archive_path_cur = os.path.join(archivedir, other.name)
-        try:
-          L.info('Archive:\n  `%s`\n    -> `%s`', other.path, archive_path_cur)
-          self.dropbox.mv(other, archive_path_cur)
-          L.info('Moving:\n  `%s`\n    -> `%s`', file.path, other.path)
-          self.dropbox.mv(file, other.path)
-          # NB, we can also insert rm for archive_path_cur here
-        except Exception:
-          L.exception('Failed: %s -> %s', other.path, file.path)
-
-    for name, cond in early_exit.items():
-      L.debug('skipped[%s]:\n%s\n', name, cond)
+    L.info('Early exit conditions: %s', list(syncplan.EARLY_EXIT))
+    plan = syncplan.plan(
+      self._ls('/'), self._ls(syncdir, recursive=True), syncdir, archivedir)
+    if plan_only:
+      return print(plan)
+    self._run_sync_plan(plan)
+
+  def watch(
+      self,
+      syncdir: str = Defaults.BOOKS_DIR,
+      archivedir: str = Defaults.ARCHIVE_DIR,
+      debounce: float = 2.,
+      timeout: int = 30):
+    """Like `sync`, but whenever Dropbox reports new PDFs in the root.
+
+    Blocks on a Dropbox long-poll (`timeout` seconds each, 30-480) and only
+    fetches what changed, keeping the cursor in the local index so restarts
+    don't re-list everything. Stop with Ctrl-C (twice to abort).
+    """
+    if self.index is None:
+      self.index = idx.Index(Defaults.Local.DB)
+
+    def on_change(changes: list, reset: bool):
+      new = [
+        f for f in changes if isinstance(f, api.FileResponse) and not f.is_dir
+        and os.path.dirname(f.path_lower) == '/']
+      L.debug('%s changes (reset=%s), %s in root', len(changes), reset, len(new))
+      if not new:
+        return
+      plan = syncplan.plan(
+        new, self.index.ls(syncdir, recursive=True), syncdir, archivedir)
+      if plan.steps:
+        L.info('%s', plan)
+        self._run_sync_plan(plan)
+
+    w = watcher.Watcher(
+      self.dropbox, self.index, on_change, timeout=timeout, debounce=debounce)
+    L.info('Watching for changes...')
+    with w.stop_on_signals():
+      w.run()
+    L.info('Stopped watching.')
+
+  def _run_sync_plan(self, plan: syncplan.Plan):
+    """Archive all, then move replacements for what got archived: 2 batches."""
+    try:
+      if steps := plan.steps:
+        archived = self.dropbox.mv_batch(
+          [(s.other, s.archive.dst) for s in steps]).content
+        steps = [s for s, r in zip(steps, archived) if self._batch_ok(
+          r, 'Archive', s.archive)]
+      if steps:
+        moved = self.dropbox.mv_batch([(s.file, s.replace.dst) for s in steps])
+        for step, result in zip(steps, moved.content):
+          self._batch_ok(result, 'Moving', step.replace)
+        # NB, we can also insert rm_batch for the archived files here
+    except Exception:
+      L.exception('Failed syncing %s files', len(plan.steps))
+
+    for name, pairs in plan.skipped.items():
+      L.debug('skipped[%s]:\n%s\n', name, pairs)
+
+  @staticmethod
+  def _batch_ok(result: ty.Any, what: str, move: syncplan.Move) -> bool:
+    if isinstance(result, api.FileResponse):
+      L.info('%s:\n  %s', what, move)
+      return True
+    L.error('%s failed:\n  %s\n  %s', what, move, result)
+    return False
 
   def s(self, what: str, ext: str = '') -> None:
     """Search dropbox for files with extension `ext` (comma-separated).
@@ -329,14 +932,10 @@ class Cli:
     Example:
       tkdbox s "my file" --ext pdf,epub
     """
-    found = self.dropbox.search(
-        what,
-        file_extensions=ext.split(',') if ext else None,
-        filename_only=True
-    ).content
+    found = self._search(what, file_extensions=ext.split(',') if ext else None)
     print('\n'.join([ f.path for f in found ]))
 
 
 if __name__ == '__main__':
-  Cli.run()
+  client.main()
 
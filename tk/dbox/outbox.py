@@ -0,0 +1,168 @@
+"""Durable journal of deferred `put`s, drained in the background.
+
+`put --defer` only records the intent here (in `Defaults.Local.DB`) and
+returns. Drainers `claim` entries one at a time and checkpoint each step
+(metadata, target path, Dropbox transfer, `save_url` job, Notion row), so a
+retry picks up after the last step that went through instead of redoing it.
+Failures are retried with backoff, then parked as `failed` until `retry`.
+"""
+import dataclasses as dcls
+import hashlib
+import json
+import logging
+import time
+import typing as ty
+
+from pathlib import Path
+
+from tk.dbox import retry as retry_  # `Outbox.retry` is taken
+from tk.dbox.utils import db
+
+L = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY,
+  key TEXT NOT NULL UNIQUE,
+  args TEXT NOT NULL,
+  state TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_at REAL NOT NULL DEFAULT 0,
+  claimed REAL,
+  created REAL,
+  updated REAL,
+  error TEXT,
+  resolved TEXT,
+  path TEXT,
+  transfer TEXT,
+  job_id TEXT,
+  notion TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox(state, next_at);
+'''
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+# checkpoint columns, cf. `Entry`
+STEPS = ('resolved', 'path', 'transfer', 'job_id', 'notion')
+
+
+def key(args: dict) -> str:
+  """Idempotency key: queueing the same `put` twice yields one entry."""
+  return hashlib.sha256(json.dumps(args, sort_keys=True).encode()).hexdigest()
+
+
+@dcls.dataclass
+class Entry:
+  id: int
+  key: str
+  args: dict
+  state: str = PENDING
+  attempts: int = 0
+  next_at: float = 0.
+  claimed: ty.Optional[float] = None
+  created: ty.Optional[float] = None
+  updated: ty.Optional[float] = None
+  error: ty.Optional[str] = None
+  # {'fname', 'pdfurl', 'meta'} once the metadata is in
+  resolved: ty.Optional[dict] = None
+  path: ty.Optional[str] = None
+  # None (not started), 'job' (`save_url` running as `job_id`) or 'done'
+  transfer: ty.Optional[str] = None
+  job_id: ty.Optional[str] = None
+  # Notion page id, '-' if there's no Notion configured
+  notion: ty.Optional[str] = None
+
+  @classmethod
+  def fromrow(cls, row) -> 'Entry':
+    d = dict(row)
+    d['args'] = json.loads(d['args'])
+    d['resolved'] = d['resolved'] and json.loads(d['resolved'])
+    return cls(**d)
+
+
+class Outbox:
+  # retrying for roughly a day, then it's parked as `failed`
+  BACKOFF = retry_.RetryPolicy(max_attempts=10, base=10., cap=4 * 3600.)
+  # a drainer holding an entry this long has died
+  STALE = 600.
+
+  def __init__(self, path: ty.Union[str, Path]):
+    self.db = db.Db(path, SCHEMA)
+
+  def add(self, args: dict) -> tuple[Entry, bool]:
+    """Queue `args` (for `put`); the entry and whether it's new."""
+    now, k = time.time(), key(args)
+    new = self.db.execute(
+      'INSERT OR IGNORE INTO outbox (key, args, created, updated) '
+      'VALUES (?, ?, ?, ?) RETURNING id', (k, json.dumps(args), now, now))
+    return self.get(k), bool(new)
+
+  def get(self, k: ty.Union[int, str]) -> ty.Optional[Entry]:
+    rows = self.db.execute(
+      f'SELECT * FROM outbox WHERE {"id" if isinstance(k, int) else "key"} = ?',
+      (k,))
+    return Entry.fromrow(rows[0]) if rows else None
+
+  def claim(self) -> ty.Optional[Entry]:
+    """Take the oldest due entry; safe with several drainers around."""
+    now = time.time()
+    rows = self.db.execute(
+      'UPDATE outbox SET state = ?, claimed = ?, updated = ? WHERE id = ('
+      '  SELECT id FROM outbox'
+      '  WHERE (state = ? AND next_at <= ?) OR (state = ? AND claimed < ?)'
+      '  ORDER BY id LIMIT 1) RETURNING *',
+      (RUNNING, now, now, PENDING, now, RUNNING, now - self.STALE))
+    return Entry.fromrow(rows[0]) if rows else None
+
+  def checkpoint(self, entry: Entry, **steps):
+    """Record finished steps (cf. `STEPS`) on `entry` and in the journal."""
+    assert set(steps) <= set(STEPS), steps
+    self._set(entry, **steps)
+
+  def done(self, entry: Entry):
+    self._set(entry, state=DONE, error=None)
+
+  def later(self, entry: Entry, delay: float):
+    """Not failed, just not ready (e.g. `save_url` still running)."""
+    self._set(entry, state=PENDING, next_at=time.time() + delay)
+
+  def fail(self, entry: Entry, error: Exception) -> bool:
+    """Schedule a retry with backoff; False if it's given up on."""
+    attempts = entry.attempts + 1
+    if (wait := self.BACKOFF.delay(attempts - 1, error=error, idempotent=True)) is None:
+      self._set(entry, state=FAILED, attempts=attempts, error=str(error))
+      return False
+    self._set(
+      entry, state=PENDING, attempts=attempts, error=str(error),
+      next_at=time.time() + wait)
+    return True
+
+  def retry(self, entry_id: ty.Optional[int] = None) -> int:
+    """Put failed entries (all, or just `entry_id`) back in line."""
+    sql = 'UPDATE outbox SET state = ?, attempts = 0, next_at = 0 WHERE state = ?'
+    params: list = [PENDING, FAILED]
+    if entry_id is not None:
+      sql += ' AND id = ?'
+      params.append(entry_id)
+    return len(self.db.execute(sql + ' RETURNING id', params))
+
+  def entries(self, *states: str) -> list[Entry]:
+    sql, params = 'SELECT * FROM outbox', states
+    if states:
+      sql += f' WHERE state IN ({", ".join("?" * len(states))})'
+    return [Entry.fromrow(r) for r in self.db.execute(sql + ' ORDER BY id', params)]
+
+  def next_due(self) -> ty.Optional[float]:
+    """When the next pending entry is up, if any."""
+    rows = self.db.execute(
+      'SELECT min(next_at) AS t FROM outbox WHERE state = ?', (PENDING,))
+    return rows[0]['t']
+
+  def _set(self, entry: Entry, **fields):
+    for k, v in fields.items():
+      setattr(entry, k, v)
+    if (resolved := fields.get('resolved')) is not None:
+      fields['resolved'] = json.dumps(resolved, default=str)
+    self.db.execute(
+      f'UPDATE outbox SET {", ".join(f"{k} = ?" for k in fields)}, updated = ? '
+      'WHERE id = ?', (*fields.values(), time.time(), entry.id))
@@ -0,0 +1,134 @@
+"""ArXiv metadata from the export API, many IDs per request.
+
+Much lighter than an abstract page per paper: one Atom feed covers up to
+`BATCH_SIZE` IDs and is parsed as it streams in. IDs the feed doesn't have
+fall back to the usual HTML `citation_*` tags.
+Cf. https://info.arxiv.org/help/api/user-manual.html
+"""
+import dataclasses as dcls
+import logging
+import re
+import typing as ty
+import urllib.parse as urlparse
+import xml.etree.ElementTree as ET
+
+from tk.dbox.provider import meta
+
+L = logging.getLogger(__name__)
+
+EXPORT_URL = 'https://export.arxiv.org/api/query?id_list={ids}&max_results={n}'
+# the API is fine with a few hundred, URLs get unwieldy beyond that
+BATCH_SIZE = 200
+
+_ATOM = '{http://www.w3.org/2005/Atom}'
+_ARXIV = '{http://arxiv.org/schemas/atom}'
+_RE_VERSION = re.compile(r'v\d+$')
+
+Response = meta.CitationMetaExtractor.Response
+
+
+def _text(entry: ET.Element, tag: str) -> str:
+  return ' '.join((entry.findtext(tag) or '').split())
+
+
+def _attr(entry: ET.Element, tag: str, attr: str) -> ty.Optional[str]:
+  return None if (el := entry.find(tag)) is None else el.get(attr)
+
+
+def _entry(entry: ET.Element) -> ty.Optional[Response]:
+  """One feed `<entry>`, as if from the abstract page's `citation_*` tags."""
+  url = _text(entry, f'{_ATOM}id')
+  if '/abs/' not in url:  # e.g. `.../api/errors#...` for malformed IDs
+    L.warning('ArXiv API: %s', _text(entry, f'{_ATOM}summary') or url)
+    return None
+  versioned = url.split('/abs/', 1)[1]
+  pdf_url = next((
+    link.get('href') for link in entry.iter(f'{_ATOM}link')
+    if link.get('title') == 'pdf'), f'https://arxiv.org/pdf/{versioned}')
+  extra = {
+    k: v for k, v in (
+      ('version', versioned),
+      ('doi', _text(entry, f'{_ARXIV}doi')),
+      ('journal_ref', _text(entry, f'{_ARXIV}journal_ref')),
+      ('category', _attr(entry, f'{_ARXIV}primary_category', 'term')),
+    ) if v}
+  return Response(
+    meta=extra,
+    title=_text(entry, f'{_ATOM}title'),
+    paper_id=_RE_VERSION.sub('', versioned),
+    pdf_url=pdf_url,
+    abstract=_text(entry, f'{_ATOM}summary'),
+    author=[_text(a, f'{_ATOM}name') for a in entry.iter(f'{_ATOM}author')],
+    # same format as `citation_date`
+    date=_text(entry, f'{_ATOM}published')[:10].replace('-', '/') or '[UNK]',
+  )
+
+
+def parse_feed(chunks: ty.Iterable[ty.Union[bytes, str]]) -> ty.Iterator[Response]:
+  """Entries of an Atom feed, each as soon as its closing tag streams in."""
+  parser = ET.XMLPullParser(events=('end',))
+  for chunk in chunks:
+    parser.feed(chunk)
+    for _, el in parser.read_events():
+      if el.tag == f'{_ATOM}entry':
+        if (response := _entry(el)) is not None:
+          yield response
+        el.clear()  # don't keep the whole feed around
+  parser.close()
+
+
+@dcls.dataclass
+class ExportApiFetcher(meta.WithHtmlFetcher):
+  """`WithHtmlFetcher` that asks the export API first, in batches.
+
+  `prefetch` resolves many IDs up front (e.g. for `put_many`, `metafix`);
+  anything else is looked up on its own, still without the heavy HTML page.
+  """
+
+  # streams the body of a URL, cf. `api.GenericHtml.stream`
+  feed_getter: ty.Optional[ty.Callable[[str], ty.Iterable[bytes]]] = None
+  _found: dict[str, Response] = dcls.field(
+    default_factory=dict, init=False, repr=False)
+
+  def resolve(self, ids: ty.Iterable[str]) -> dict[str, Response]:
+    """Metadata per ID, for those the export API knows."""
+    found, ids = {}, list(dict.fromkeys(ids))
+    for i in range(0, len(ids), BATCH_SIZE):
+      batch = ids[i:i + BATCH_SIZE]
+      url = EXPORT_URL.format(
+        ids=urlparse.quote(','.join(batch), safe=','), n=len(batch))
+      for response in parse_feed(self.feed_getter(url)):
+        found[response.paper_id] = response
+        found[response.meta.get('version', response.paper_id)] = response
+    return {id: found[id] for id in ids if id in found}
+
+  def prefetch(self, ids_or_urls: ty.Iterable[str]) -> int:
+    """Resolve these in as few requests as possible; how many were found."""
+    ids = [self._get_id(x) for x in ids_or_urls]
+    ids = [id for id in ids if id not in self._found and not (
+      self.cache is not None and self.cache.get(self.provider, id)[0])]
+    if not ids:
+      return 0
+    try:
+      found = self.resolve(ids)
+    except Exception as e:  # then one by one it is
+      L.warning('ArXiv export API failed: %s', e)
+      return 0
+    self._found.update(found)
+    if self.cache is not None:
+      for id, response in found.items():
+        self.cache.put(self.provider, id, response)
+    L.debug('Prefetched %s/%s ArXiv IDs', len(found), len(ids))
+    return len(found)
+
+  def fetch_meta(self, id: str) -> Response:
+    if (response := self._found.get(id)) is not None:
+      return response
+    if self.feed_getter is not None:
+      try:
+        if (response := self.resolve([id]).get(id)) is not None:
+          return response
+      except Exception as e:
+        L.warning('ArXiv export API failed for %s: %s', id, e)
+    L.debug('Falling back to the abstract page for %s', id)
+    return super().fetch_meta(id)
@@ -6,6 +6,7 @@ import logging
 from collections import namedtuple
 
 from tk.dbox import api
+from tk.dbox.provider import arxiv
 from tk.dbox.provider import meta
 from tk.dbox.utils import text as txtutil
 
@@ -23,22 +24,34 @@ class Matcher:
 
 
 class Dispatcher:
-  def __init__(self):
-    _get = api.GenericHtml().get
-    self._arxiv = _arxiv = meta.WithHtmlFetcher(
+  def __init__(
+      self,
+      html: ty.Optional[api.GenericHtml] = None,
+      cache: ty.Optional[ty.Any] = None):
+    """`cache`: for paper metadata, cf. `cache.MetaCache`."""
+    html = html or api.GenericHtml()
+    _get = html.get
+    self._arxiv = _arxiv = arxiv.ExportApiFetcher(
       _get,
       pdfurl='https://arxiv.org/pdf/{id}.pdf',
       absurl='https://arxiv.org/abs/{id}',
+      html_stream=html.stream,
+      cache=cache,
+      feed_getter=html.stream,
     )
     self._review = _review = meta.WithHtmlFetcher(
       _get,
       pdfurl='https://openreview.net/pdf?id={id}',
       absurl='https://openreview.net/forum?id={id}',
+      html_stream=html.stream,
+      cache=cache,
     )
     self._acl = _acl = meta.WithHtmlFetcher(
       _get,
       pdfurl='https://aclanthology.org/{id}.pdf',
-      absurl='https://aclanthology.org/{id}/'
+      absurl='https://aclanthology.org/{id}/',
+      html_stream=html.stream,
+      cache=cache,
     )
     self.url_matchers = [
       Matcher('arxiv', lambda u: any(x in u for x in ('arxiv', )), _arxiv),
@@ -58,13 +71,18 @@ class Dispatcher:
     matchers = it.chain(self.url_matchers, self.nonurl_matchers)
     return (m.dispatch for m in matchers if m.name == name)
 
+  def prefetch(self, ids_or_urls: ty.Iterable[str]) -> int:
+    """Batch-resolve metadata for whatever of these is on ArXiv."""
+    return self._arxiv.prefetch([
+      x for x in ids_or_urls
+      if any(m.dispatch is self._arxiv for m in self._matchers(x))])
+
+  def _matchers(self, id_or_url: str) -> ty.Iterable[Matcher]:
+    matchers = self.url_matchers if txtutil.is_url(id_or_url) else self.nonurl_matchers
+    return (m for m in matchers if m.match(id_or_url))
+
   def __call__(self, id_or_url: str) -> ty.Generator[ty.Optional[UrlToUploadable], None, None]:
-    if txtutil.is_url(id_or_url):
-      for matcher in filter(lambda m: m.match(id_or_url), self.url_matchers):
-        L.debug("Matched: %s", matcher)
-        yield matcher.dispatch
-    else:
-      for matcher in filter(lambda m: m.match(id_or_url), self.nonurl_matchers):
-        L.debug("Matched: %s", matcher)
-        yield matcher.dispatch
+    for matcher in self._matchers(id_or_url):
+      L.debug("Matched: %s", matcher)
+      yield matcher.dispatch
 
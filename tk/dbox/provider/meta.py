@@ -1,5 +1,6 @@
 """Methods for metadata retrieval for some paper URL.
 """
+import codecs
 import re
 import os
 import urllib
@@ -9,6 +10,7 @@ import typing as ty
 
 from html.parser import HTMLParser
 
+from tk.dbox import retry
 from tk.dbox.utils import type as types
 from tk.dbox.utils import text as txtutil
 
@@ -28,23 +30,50 @@ class CitationMetaExtractor(HTMLParser):
 
   PREFIX_CITE = 'citation_'
 
+  class _HeadDone(Exception):
+    """Unwinds `HTMLParser.feed` once there's nothing more to find."""
+
   def __init__(self):
     super().__init__()
     self.description = {}
+    # past `<head>`, where all `citation_*` tags are
+    self.done = False
+
+  def feed(self, data: str) -> bool:
+    """Parse more of the page. True once the rest can be skipped."""
+    if not self.done:
+      try:
+        super().feed(data)
+      except self._HeadDone:
+        pass
+    return self.done
 
   def handle_starttag(self, tag: str, attrs: ty.List[ty.Tuple[str, str]]):
-    if tag != 'meta': return
-    attrs = dict(attrs)
-    if (k := attrs.get('name', '')).startswith(self.PREFIX_CITE):
-      k = k[len(self.PREFIX_CITE):]
+    if tag != 'meta':
+      if tag == 'body':
+        self._stop()
+      return
+    # not `dict(attrs)`: most meta tags aren't citations
+    name = next((v for a, v in attrs if a == 'name'), None) or ''
+    if name.startswith(self.PREFIX_CITE):
+      k = name[len(self.PREFIX_CITE):]
+      content = next((v for a, v in attrs if a == 'content'), None)
       if k == "arxiv_id":  # to make auto extraction easier
         k = "paper_id"
       # Repeating meta tags get represented as lists, others normal strings.
       if v := self.description.get(k):
         if not isinstance(v, list): self.description[k] = [v]
-        self.description[k].append(attrs['content'])
+        self.description[k].append(content)
       else:
-        self.description[k] = attrs['content']
+        self.description[k] = content
+
+  def handle_endtag(self, tag: str):
+    if tag == 'head':
+      self._stop()
+
+  def _stop(self):
+    self.done = True
+    raise self._HeadDone()
 
 
 @dcls.dataclass
@@ -61,12 +90,15 @@ class WithHtmlFetcher:
   #      absurl = 'https://arxiv.com/abs/{id}'
   pdfurl: str
   absurl: str
+  # get/put (provider, id) -> response, cf. `cache.MetaCache`
+  cache: ty.Optional[ty.Any] = None
+  # if set, used instead of `html_getter`: page in chunks, only read up to
+  # the end of `<head>` (cf. `api.GenericHtml.stream`)
+  html_stream: ty.Optional[ty.Callable[[str], ty.Iterable[bytes]]] = None
 
   def __call__(self, id_or_url: str):
     id = self._get_id(id_or_url)
-    url = self.mk_absurl(id)
-    page = self.html_getter(url)
-    meta = self._get_meta(page)
+    meta = self.cached_meta(id)
     name = txtutil.clean_camelcase_fname(meta.title)
     if meta.paper_id != id:
       L.warning("Differing IDs found: %s != %s", meta.paper_id, id)
@@ -100,9 +132,49 @@ class WithHtmlFetcher:
     L.warning("None of the heuristics matched, returning raw netloc: %s", url)
     return url.geturl().removesuffix(".pdf")
 
-  def _get_meta(self, html: str) -> CitationMetaExtractor.Response:
+  @property
+  def provider(self) -> str:
+    """Cache namespace, e.g. `arxiv.org`."""
+    return urllib.parse.urlparse(self.absurl).netloc
+
+  def cached_meta(self, id: str) -> CitationMetaExtractor.Response:
+    """`fetch_meta`, unless it's in the cache (incl. known 404s)."""
+    if self.cache is None:
+      return self.fetch_meta(id)
+    hit, meta = self.cache.get(self.provider, id)
+    if hit and meta is None:
+      raise LookupError(f'No such paper (cached): {self.mk_absurl(id)}')
+    if hit:
+      return meta
+    try:
+      meta = self.fetch_meta(id)
+    except retry.ApiError as e:
+      if e.status in (404, 410):
+        self.cache.put(self.provider, id, None)
+      raise
+    self.cache.put(self.provider, id, meta)
+    return meta
+
+  def fetch_meta(self, id: str) -> CitationMetaExtractor.Response:
+    getter = self.html_getter if self.html_stream is None else self.html_stream
+    return self._get_meta(getter(self.mk_absurl(id)))
+
+  def _get_meta(
+      self, html: ty.Union[str, ty.Iterable[bytes]]) -> CitationMetaExtractor.Response:
+    """From the page, or its chunks; stops reading these after `<head>`."""
     extractor = CitationMetaExtractor()
-    extractor.feed(html)
+    if isinstance(html, str):
+      extractor.feed(html)
+    else:
+      decoder = codecs.getincrementaldecoder('utf8')('replace')
+      chunks = iter(html)
+      try:
+        for chunk in chunks:
+          if extractor.feed(decoder.decode(chunk)):
+            break
+      finally:
+        if close := getattr(chunks, 'close', None):  # drops the connection
+          close()
     return CitationMetaExtractor.Response.fromdict(extractor.description)
 
   def mk_absurl(self, id: str) -> str:
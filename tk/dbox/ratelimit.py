@@ -0,0 +1,159 @@
+"""Client-side rate limiting: one token bucket per host, shared across threads.
+
+Buckets hand out reservations (tokens may go negative), so concurrent callers
+queue up fairly instead of spinning. When a server answers with `Retry-After`
+the bucket is blocked for that long and its rate halved; successful calls
+slowly bring it back to the nominal rate.
+"""
+import contextlib
+import dataclasses as dcls
+import logging
+import threading
+import time
+import typing as ty
+import urllib.parse
+
+L = logging.getLogger(__name__)
+
+# host -> (requests per second, burst)
+DEFAULT_LIMITS: dict[str, tuple[float, float]] = {
+  'api.dropboxapi.com': (10., 20),
+  'content.dropboxapi.com': (5., 10),
+  'api.notion.com': (3., 3),  # ~3 req/s average per integration
+  'arxiv.org': (1., 4),
+}
+
+
+class RateLimitTimeout(TimeoutError):
+  pass
+
+
+@dcls.dataclass
+class TokenBucket:
+  rate: float
+  capacity: float
+  # throttling never drops the rate below `nominal * min_factor`
+  min_factor: float = 1 / 16
+  clock: ty.Callable[[], float] = dcls.field(default=time.monotonic, repr=False)
+  sleep: ty.Callable[[float], None] = dcls.field(default=time.sleep, repr=False)
+
+  def __post_init__(self):
+    self.nominal = self.rate
+    self._tokens = float(self.capacity)
+    self._stamp = self.clock()
+    self._blocked_until = 0.
+    self._lock = threading.Lock()
+
+  def _refill(self, now: float):
+    elapsed = max(0., now - max(self._stamp, self._blocked_until))
+    self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+    self._stamp = max(self._stamp, now)
+
+  def reserve(self, timeout: ty.Optional[float] = None) -> float:
+    """Take a token, return how long the caller must wait before using it."""
+    with self._lock:
+      now = self.clock()
+      self._refill(now)
+      # nothing refills while blocked, so the token wait comes on top
+      wait = max(0., self._blocked_until - now) + (
+        (1 - self._tokens) / self.rate if self._tokens < 1 else 0.)
+      if timeout is not None and wait > timeout:
+        raise RateLimitTimeout(f'Would need to wait {wait:.2f}s > {timeout:.2f}s')
+      self._tokens -= 1
+      return wait
+
+  def acquire(self, timeout: ty.Optional[float] = None) -> float:
+    if wait := self.reserve(timeout):
+      self.sleep(wait)
+    return wait
+
+  def throttle(self, retry_after: ty.Optional[float] = None):
+    """Server pushed back: pause for `retry_after` and halve the rate."""
+    with self._lock:
+      now = self.clock()
+      self._refill(now)
+      self.rate = max(self.nominal * self.min_factor, self.rate / 2)
+      pause = retry_after if retry_after is not None else 1 / self.rate
+      self._blocked_until = max(self._blocked_until, now + pause)
+      self._tokens = min(self._tokens, 0.)
+    L.info('Throttled to %.2f req/s for %.1fs', self.rate, pause)
+
+  def relax(self):
+    """Successful call: additively recover towards the nominal rate."""
+    if self.rate < self.nominal:
+      with self._lock:
+        self.rate = min(self.nominal, self.rate + self.nominal / 32)
+
+
+class RateLimiter:
+  """Per-host buckets; hosts without a configured limit are not limited."""
+
+  def __init__(
+      self,
+      limits: ty.Optional[dict[str, tuple[float, float]]] = None,
+      **bucket_kwargs):
+    self.limits = DEFAULT_LIMITS if limits is None else limits
+    self._bucket_kwargs = bucket_kwargs
+    self._buckets: dict[str, TokenBucket] = {}
+    self._lock = threading.Lock()
+
+  def _host(self, url: str) -> ty.Optional[str]:
+    host = urllib.parse.urlsplit(url).hostname or url
+    # subdomains share the parent's bucket, e.g. `www.arxiv.org`
+    while host and host not in self.limits:
+      _, _, host = host.partition('.')
+    return host or None
+
+  def bucket(self, url: str) -> ty.Optional[TokenBucket]:
+    if (host := self._host(url)) is None:
+      return None
+    with self._lock:
+      if (bucket := self._buckets.get(host)) is None:
+        rate, burst = self.limits[host]
+        bucket = self._buckets[host] = TokenBucket(
+          rate, burst, **self._bucket_kwargs)
+    return bucket
+
+  def reserve(self, url: str, timeout: ty.Optional[float] = None) -> float:
+    """Like `acquire` but leaves the waiting to the caller (e.g. asyncio)."""
+    if bucket := self.bucket(url):
+      return bucket.reserve(timeout)
+    return 0.
+
+  def acquire(self, url: str, timeout: ty.Optional[float] = None) -> float:
+    if bucket := self.bucket(url):
+      return bucket.acquire(timeout)
+    return 0.
+
+  def throttle(self, url: str, retry_after: ty.Optional[float] = None):
+    if bucket := self.bucket(url):
+      bucket.throttle(retry_after)
+
+  def relax(self, url: str):
+    if bucket := self.bucket(url):
+      bucket.relax()
+
+
+_default: ty.Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def default() -> RateLimiter:
+  global _default
+  with _default_lock:
+    if _default is None:
+      _default = RateLimiter()
+    return _default
+
+
+@contextlib.contextmanager
+def use(limiter: RateLimiter) -> ty.Iterator[RateLimiter]:
+  """Temporarily swap the process-wide limiter (mostly for tests)."""
+  global _default
+  with _default_lock:
+    old, _default = _default, limiter
+  try:
+    yield limiter
+  finally:
+    with _default_lock:
+      _default = old
@@ -0,0 +1,211 @@
+"""Retries with jittered exponential backoff.
+
+Rate-limit responses (HTTP 429, Dropbox `too_many_requests`, Notion
+`rate_limited`) mean the server did not process the call, so these are always
+retried, honouring `Retry-After`. Server errors and dropped connections are
+only retried for idempotent calls since the first attempt may have landed.
+"""
+import asyncio
+import dataclasses as dcls
+import email.utils
+import logging
+import random
+import time
+import typing as ty
+
+import requests
+
+from tk.dbox import deadline as dl
+
+L = logging.getLogger(__name__)
+
+RATE_LIMIT_TAGS = ('too_many_requests', 'too_many_write_operations', 'rate_limited')
+# transport-level errors worth retrying (for idempotent calls)
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+class ApiError(Exception):
+  """Non-ok API response; message is the response body as before."""
+
+  def __init__(self, response: requests.Response):
+    super().__init__(response.text)
+    self.response = response
+    self.status = response.status_code
+
+
+@dcls.dataclass
+class CallStats:
+  method: str
+  url: str
+  attempts: int = 0
+  waited: float = 0.
+  status: ty.Optional[int] = None
+
+  @property
+  def retried(self) -> bool:
+    return self.attempts > 1
+
+
+def _json(response: requests.Response) -> dict:
+  """Body of an error response, if it's JSON and already read.
+
+  Ok responses are left alone, and so are streamed ones (`_content` is
+  only set once read): reading would pull in the whole body up front.
+  """
+  if response.ok or response._content is False or 'json' not in (
+      response.headers.get('Content-Type') or ''):
+    return {}
+  try:
+    body = response.json()
+  except ValueError:
+    return {}
+  return body if isinstance(body, dict) else {}
+
+
+def is_rate_limited(response: requests.Response) -> bool:
+  if response.status_code == 429:
+    return True
+  body = _json(response)
+  error = body.get('error')
+  reason = error.get('reason', {}) if isinstance(error, dict) else {}
+  tags = (
+    body.get('code'),  # notion
+    reason.get('.tag') if isinstance(reason, dict) else None,  # dropbox
+    body.get('error_summary', '').split('/')[0],  # dropbox
+  )
+  return any(t in RATE_LIMIT_TAGS for t in tags)
+
+
+def retry_after(response: requests.Response) -> ty.Optional[float]:
+  """Seconds the server asked us to wait, if it said so."""
+  if header := response.headers.get('Retry-After'):
+    try:
+      return max(0., float(header))
+    except ValueError:
+      if when := email.utils.parsedate_to_datetime(header):
+        return max(0., when.timestamp() - time.time())
+  error = _json(response).get('error')
+  if isinstance(error, dict) and (after := error.get('retry_after')) is not None:
+    return float(after)
+  return None
+
+
+@dcls.dataclass
+class RetryPolicy:
+  max_attempts: int = 5
+  # backoff is uniform in [0, min(cap, base * 2**attempt)] ("full jitter")
+  base: float = 0.5
+  cap: float = 30.
+  retry_statuses: frozenset[int] = frozenset({500, 502, 503, 504})
+  sleep: ty.Callable[[float], None] = dcls.field(default=time.sleep, repr=False)
+  asleep: ty.Callable[[float], ty.Awaitable] = dcls.field(
+    default=asyncio.sleep, repr=False)
+
+  def backoff(self, attempt: int) -> float:
+    return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+  def delay(
+      self,
+      attempt: int,
+      response: ty.Optional[requests.Response] = None,
+      error: ty.Optional[Exception] = None,
+      idempotent: bool = False) -> ty.Optional[float]:
+    """Seconds to wait before retrying, `None` if we shouldn't retry.
+
+    `error` is a (retryable) transport error raised instead of a response.
+    """
+    if attempt + 1 >= self.max_attempts:
+      return None
+    if response is not None:
+      if is_rate_limited(response):
+        after = retry_after(response)
+        # small jitter on top so that parallel workers don't wake up together
+        return self.backoff(attempt) if after is None else after + self.backoff(0)
+      if idempotent and response.status_code in self.retry_statuses:
+        after = retry_after(response)
+        return self.backoff(attempt) if after is None else after
+      return None
+    if idempotent and error is not None:
+      return self.backoff(attempt)
+    return None
+
+  def _next_wait(
+      self,
+      stats: CallStats,
+      response: ty.Optional[requests.Response],
+      error: ty.Optional[Exception],
+      idempotent: bool) -> ty.Optional[float]:
+    """After an attempt: seconds to wait before the next, None if settled.
+
+    Settled: `response` is ok or final, or `error` is to be raised. Shared
+    by `call` and `acall`, which only differ in how they send and sleep.
+    """
+    if response is not None:
+      stats.status = response.status_code
+      if response.ok:
+        return None
+    wait = self.delay(stats.attempts - 1, response, error, idempotent)
+    if wait is not None and (deadline := dl.current()):
+      if wait >= deadline.remaining():
+        L.warning('Not retrying %s %s: past deadline', stats.method, stats.url)
+        wait = None
+    if wait is not None:
+      L.warning(
+        'Retrying %s %s in %.1fs (attempt %s, %s)', stats.method, stats.url,
+        wait, stats.attempts, stats.status if error is None else error)
+      stats.waited += wait
+      if response is not None:  # e.g. streamed: gives its connection back
+        response.close()
+    return wait
+
+  def call(
+      self,
+      send: ty.Callable[[], requests.Response],
+      idempotent: bool,
+      stats: CallStats,
+      errors: tuple[type, ...] = TRANSPORT_ERRORS) -> requests.Response:
+    """Calls `send` until it succeeds or the policy gives up.
+
+    Returns the last response (which may be non-ok); re-raises the last
+    transport error (one of `errors`) if retries are exhausted.
+    """
+    while True:
+      response, error = None, None
+      stats.attempts += 1
+      try:
+        response = send()
+      except errors as e:
+        error = e
+      if (wait := self._next_wait(stats, response, error, idempotent)) is None:
+        if error is not None:
+          raise error
+        return response
+      self.sleep(wait)
+
+  async def acall(
+      self,
+      send: ty.Callable[[], ty.Awaitable[requests.Response]],
+      idempotent: bool,
+      stats: CallStats,
+      errors: tuple[type, ...] = TRANSPORT_ERRORS) -> requests.Response:
+    """Same as `call`, for coroutines."""
+    while True:
+      response, error = None, None
+      stats.attempts += 1
+      try:
+        response = await send()
+      except errors as e:
+        error = e
+      if (wait := self._next_wait(stats, response, error, idempotent)) is None:
+        if error is not None:
+          raise error
+        return response
+      await self.asleep(wait)
+
+
+def summarize(stats: ty.Iterable[CallStats]) -> str:
+  stats = list(stats)
+  retried = [s for s in stats if s.retried]
+  return '{} calls, {} retried ({} extra attempts), waited {:.1f}s'.format(
+    len(stats), len(retried),
+    sum(s.attempts - 1 for s in retried), sum(s.waited for s in retried))
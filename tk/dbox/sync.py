@@ -0,0 +1,107 @@
+"""Plans the root -> `syncdir` moves done by `tkdbox sync`.
+
+Works on two listings (Dropbox root and a recursive one of `syncdir`) joined
+in memory by filename, instead of one search round trip per root file.
+"""
+import dataclasses as dcls
+import logging
+import os
+import typing as ty
+
+from tk.dbox import api
+
+L = logging.getLogger(__name__)
+
+Check = ty.Callable[[api.FileResponse, api.FileResponse], bool]
+
+EARLY_EXIT: dict[str, Check] = {
+  # if file hashes are equal, don't do the move
+  'hash': lambda f, o: f.hash is not None and f.hash == o.hash,
+  # if the other file was modified after original, also don't move
+  'modtime': lambda f, o: bool(
+    f.last_modified and o.last_modified and f.last_modified < o.last_modified),
+}
+
+
+@dcls.dataclass(frozen=True)
+class Move:
+  src: str
+  dst: str
+
+  def __str__(self):
+    return f'`{self.src}`\n    -> `{self.dst}`'
+
+
+@dcls.dataclass
+class Step:
+  """Replace `other` (in `syncdir`) by the annotated `file` from the root.
+
+  `other` first goes to the archive, rm would be a bit unsafe if it fails.
+  """
+  file: api.FileResponse
+  other: api.FileResponse
+  archive: Move
+  replace: Move
+
+
+@dcls.dataclass
+class Plan:
+  steps: list[Step] = dcls.field(default_factory=list)
+  # early exit condition -> [(root file, synced file)]
+  skipped: dict[str, list[tuple[str, str]]] = dcls.field(default_factory=dict)
+  # root PDFs with no counterpart in `syncdir`
+  unmatched: list[str] = dcls.field(default_factory=list)
+
+  def __str__(self):
+    lines = [f'{len(self.steps)} file(s) to sync:']
+    for step in self.steps:
+      lines.append(f'  Archive: {step.archive}')
+      lines.append(f'  Move:    {step.replace}')
+    for name, pairs in self.skipped.items():
+      lines.append(f'Skipped ({name}): {len(pairs)}')
+      lines.extend(f'  {f} ~ {o}' for f, o in pairs)
+    if self.unmatched:
+      lines.append(f'No match in sync dir: {len(self.unmatched)}')
+    return '\n'.join(lines)
+
+
+def _under(path: str, directory: str) -> bool:
+  directory = directory.rstrip('/').lower()
+  return path.lower().startswith(directory + '/')
+
+
+def plan(
+    root_files: ty.Iterable[api.FileResponse],
+    synced_files: ty.Iterable[api.FileResponse],
+    syncdir: str,
+    archivedir: str,
+    early_exit: ty.Optional[dict[str, Check]] = None,
+    is_candidate: ty.Callable[[api.FileResponse], bool] = (
+      lambda f: f.name.lower().endswith('.pdf'))) -> Plan:
+  """Match root files to same-named files under `syncdir` (not `archivedir`)."""
+  early_exit = EARLY_EXIT if early_exit is None else early_exit
+  by_name: dict[str, list[api.FileResponse]] = {}
+  for other in synced_files:
+    if other.is_dir or not _under(other.path, syncdir) or _under(other.path, archivedir):
+      continue
+    by_name.setdefault(other.name.lower(), []).append(other)
+
+  result = Plan(skipped={name: [] for name in early_exit})
+  for file in filter(is_candidate, root_files):
+    if file.is_dir:
+      continue
+    if not (others := by_name.get(file.name.lower())):
+      result.unmatched.append(file.path)
+      continue
+    if len(others) > 1:
+      L.warning('Several matches for %s, using the first: %s',
+                file.name, [o.path for o in others])
+    other = min(others, key=lambda o: o.path.lower())
+    if failed := next((n for n, c in early_exit.items() if c(file, other)), None):
+      result.skipped[failed].append((file.path, other.path))
+      continue
+    result.steps.append(Step(
+      file, other,
+      archive=Move(other.path, os.path.join(archivedir, other.name)),
+      replace=Move(file.path, other.path)))
+  return result
@@ -0,0 +1,108 @@
+"""Shared HTTP transport.
+
+One pooled, keep-alive `requests.Session` per host, so that back-to-back API
+calls reuse TCP+TLS connections instead of handshaking every time.
+All `Api` subclasses go through `default()` unless given a transport
+explicitly; tests can swap it via `use(fake)`.
+"""
+import contextlib
+import dataclasses as dcls
+import logging
+import threading
+import typing as ty
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tk.dbox import deadline as dl
+
+L = logging.getLogger(__name__)
+
+
+@dcls.dataclass
+class Transport:
+  # max connections kept alive per host
+  pool_size: int = 10
+  # (connect, read) seconds, used when the caller doesn't pass a timeout;
+  # either way clamped to the current deadline, if any
+  timeout: tuple[float, float] = (10., 60.)
+
+  def __post_init__(self):
+    if isinstance(self.timeout, list):  # e.g. when read from json config
+      self.timeout = tuple(self.timeout)
+    self._sessions: dict[str, requests.Session] = {}
+    self._lock = threading.Lock()
+
+  def session(self, url: str) -> requests.Session:
+    host = urllib.parse.urlsplit(url).netloc
+    with self._lock:
+      if (session := self._sessions.get(host)) is None:
+        L.debug('New session for %s (pool=%s)', host, self.pool_size)
+        session = self._sessions[host] = self._mk_session()
+    return session
+
+  def _mk_session(self) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+  def request(self, method: str, url: str, **kwargs) -> requests.Response:
+    timeout = kwargs.pop('timeout', self.timeout)
+    if deadline := dl.current():
+      deadline.check(f'before {method} {url}')
+      timeout = deadline.clamp(timeout)
+    try:
+      return self.session(url).request(method, url, timeout=timeout, **kwargs)
+    except requests.Timeout as e:
+      if deadline and deadline.expired():
+        raise dl.DeadlineExceeded(f'Deadline exceeded during {method} {url}') from e
+      raise
+
+  def close(self):
+    with self._lock:
+      sessions, self._sessions = self._sessions, {}
+    for session in sessions.values():
+      session.close()
+
+
+class TransportLike(ty.Protocol):
+  def request(self, method: str, url: str, **kwargs) -> requests.Response: ...
+
+
+_default: ty.Optional[TransportLike] = None
+_default_lock = threading.Lock()
+
+
+def default() -> TransportLike:
+  """Process-wide transport, created lazily."""
+  global _default
+  with _default_lock:
+    if _default is None:
+      _default = Transport()
+    return _default
+
+
+def configure(**kwargs) -> Transport:
+  """Replace the process-wide transport, e.g. `configure(pool_size=32)`."""
+  global _default
+  with _default_lock:
+    old, _default = _default, Transport(**kwargs)
+  if isinstance(old, Transport):
+    old.close()
+  return _default
+
+
+@contextlib.contextmanager
+def use(transport: TransportLike) -> ty.Iterator[TransportLike]:
+  """Temporarily swap the process-wide transport (mostly for tests)."""
+  global _default
+  with _default_lock:
+    old, _default = _default, transport
+  try:
+    yield transport
+  finally:
+    with _default_lock:
+      _default = old
@@ -1,9 +1,25 @@
 import argparse
+import contextlib
 import typing as ty
 import inspect as I
 import logging
 
 
+# Where `prompt` reads answers from; cf. `input_from`.
+_input: ty.Callable[[str], str] = input
+
+
+@contextlib.contextmanager
+def input_from(read: ty.Callable[[str], str]) -> ty.Iterator[None]:
+  """Temporarily answer prompts with `read` (e.g. forwarded to a client)."""
+  global _input
+  old, _input = _input, read
+  try:
+    yield
+  finally:
+    _input = old
+
+
 def prompt(prompt: str, accepted_responses: ty.Sequence[str]) -> str:
   """Prompt until case-insensitive matches from `accepted_responses` are chosen.
 
@@ -13,7 +29,7 @@ def prompt(prompt: str, accepted_responses: ty.Sequence[str]) -> str:
   default = accepted_responses[-1].upper()
   responses_str = '/'.join([*accepted_responses[:-1], default])
   prompt = f'{prompt} ({responses_str}) > '
-  while (response := (input(prompt) or default).lower()) not in accepted_responses:
+  while (response := (_input(prompt) or default).lower()) not in accepted_responses:
     print('Please respond', responses_str.lower())
   return response
 
@@ -21,12 +37,23 @@ def prompt(prompt: str, accepted_responses: ty.Sequence[str]) -> str:
 def cli_from_instancemethods(
     cls: ty.Type,
     common_args: argparse.ArgumentParser,
-    log: ty.Optional[logging.Logger] = None) -> ty.Tuple[ty.Callable, dict]:
+    log: ty.Optional[logging.Logger] = None,
+    argv: ty.Optional[ty.Sequence[str]] = None) -> ty.Tuple[ty.Callable, dict]:
   '''Automatically infer CLI from a method's public interface.
 
   Returns a method to be called and corresponding args (incl `common_args`).
   If `log` is given, then sends a debug log around method execution.
+  `argv` defaults to `sys.argv[1:]`.
   '''
+  parser, methods = parser_from_instancemethods(cls, common_args)
+  return parse(parser, methods, argv, log)
+
+
+def parser_from_instancemethods(
+    cls: ty.Type,
+    common_args: argparse.ArgumentParser,
+) -> ty.Tuple[argparse.ArgumentParser, dict[str, ty.Callable]]:
+  '''The (reusable) parser behind `cli_from_instancemethods`.'''
   parser = argparse.ArgumentParser()
   subparser = parser.add_subparsers(title='cmd', required=True, dest='cmd')
   isclassmethod = lambda x: I.ismethod(x) and x.__self__ != cls
@@ -36,7 +63,9 @@ def cli_from_instancemethods(
   }
   for method_name, method in methods.items():
     mparser = subparser.add_parser(
-        method_name, parents=[common_args], help=I.getdoc(method))
+        method_name, parents=[common_args], help=I.getdoc(method),
+        # also accept `put-many`
+        aliases=[method_name.replace('_', '-')] if '_' in method_name else [])
     sig = I.signature(method)
 
     def add_type_param(flag, annot, default):
@@ -55,17 +84,32 @@ def cli_from_instancemethods(
             type_ = arg
             break
 
-      mparser.add_argument(flag, type=type_, default=default, **kws)
+      if type_ is bool:  # flags, e.g. `--dry_run`
+        kws = {'action': 'store_false' if default else 'store_true'}
+        return mparser.add_argument(*flag, default=default, **kws)
+
+      mparser.add_argument(*flag, type=type_, default=default, **kws)
 
     for name, param in sig.parameters.items():
       if name == 'self': continue
       type_ = param.annotation if param.annotation != I._empty else str
       # if parameter has a default, then we don't see it as a raw CLI value.
-      flag = f'--{name}' if param.default != I._empty else name
+      flag = [f'--{name}'] if param.default != I._empty else [name]
+      if flag[0].startswith('--') and '_' in name:  # also accept `--dry-run`
+        flag.append(f'--{name.replace("_", "-")}')
       add_type_param(flag, type_, param.default)
 
-  args = parser.parse_args().__dict__
-  cmd = args.pop('cmd')
+  return parser, methods
+
+
+def parse(
+    parser: argparse.ArgumentParser,
+    methods: dict[str, ty.Callable],
+    argv: ty.Optional[ty.Sequence[str]] = None,
+    log: ty.Optional[logging.Logger] = None) -> ty.Tuple[ty.Callable, dict]:
+  '''Cf. `cli_from_instancemethods`.'''
+  args = parser.parse_args(argv).__dict__
+  cmd = args.pop('cmd').replace('-', '_')  # aliased, cf. `parser_from_instancemethods`
   method = methods[cmd]
 
   def logged_method(*a, **kw):
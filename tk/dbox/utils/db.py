@@ -0,0 +1,41 @@
+import logging
+import sqlite3
+import threading
+import typing as ty
+
+from pathlib import Path
+
+L = logging.getLogger(__name__)
+
+
+class Db:
+  """Thin thread-safe wrapper around one sqlite file shared by local stores.
+
+  Each store (index, outbox, caches) creates its own tables via `schema`.
+  """
+
+  def __init__(self, path: ty.Union[str, Path], schema: str = ''):
+    if str(path) != ':memory:':
+      Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+      path = Path(path).expanduser()
+    self.path = path
+    self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self.conn.row_factory = sqlite3.Row
+    self.lock = threading.RLock()
+    with self.lock, self.conn:
+      if str(path) != ':memory:':
+        self.conn.execute('PRAGMA journal_mode=WAL')
+      if schema:
+        self.conn.executescript(schema)
+
+  def execute(self, sql: str, params: ty.Sequence = ()) -> list[sqlite3.Row]:
+    with self.lock, self.conn:
+      return self.conn.execute(sql, params).fetchall()
+
+  def executemany(self, sql: str, rows: ty.Iterable[ty.Sequence]):
+    with self.lock, self.conn:
+      self.conn.executemany(sql, rows)
+
+  def close(self):
+    with self.lock:
+      self.conn.close()
@@ -0,0 +1,18 @@
+"""Process-wide thread pools, created on first use."""
+import concurrent.futures as cf
+import threading
+import typing as ty
+
+
+def lazy(max_workers: int, thread_name_prefix: str) -> ty.Callable[[], cf.ThreadPoolExecutor]:
+  """Getter for a pool that's only started once something needs it."""
+  pool: ty.Optional[cf.ThreadPoolExecutor] = None
+  lock = threading.Lock()
+
+  def executor() -> cf.ThreadPoolExecutor:
+    nonlocal pool
+    with lock:
+      if pool is None:
+        pool = cf.ThreadPoolExecutor(max_workers, thread_name_prefix=thread_name_prefix)
+      return pool
+  return executor
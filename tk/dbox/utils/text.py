@@ -10,17 +10,99 @@ L = logging.getLogger(__name__)
 
 _RE_ONLY_WORDS = re.compile(r'[\W_]+')
 
-# TODO move to a proper res/ dir? cf: https://gist.github.com/gruber/8891611
-# NB, this regex matches most URLs but also apparently hangs in some cases.
-# Also cf. https://github.com/Traumatizn/RegEx/blob/main/Python/Url_Pattern.md
-# which is a copy of the original gist
-_RE_URL = re.compile(r'''
-  (?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))
-'''.strip())
+# TLDs a bare `host.tld` may end in (the ones from Gruber's URL regex,
+# cf. https://gist.github.com/gruber/8891611, which this replaces: it
+# backtracked exponentially on e.g. `http://` followed by a lot of dots).
+_TLDS = frozenset('''
+  com net org edu gov mil aero asia biz cat coop info int jobs mobi museum
+  name post pro tel travel xxx ac ad ae af ag ai al am an ao aq ar as at au
+  aw ax az ba bb bd be bf bg bh bi bj bm bn bo br bs bt bv bw by bz ca cc cd
+  cf cg ch ci ck cl cm cn co cr cs cu cv cx cy cz dd de dj dk dm do dz ec ee
+  eg eh er es et eu fi fj fk fm fo fr ga gb gd ge gf gg gh gi gl gm gn gp gq
+  gr gs gt gu gw gy hk hm hn hr ht hu id ie il im in io iq ir is it je jm jo
+  jp ke kg kh ki km kn kp kr kw ky kz la lb lc li lk lr ls lt lu lv ly ma mc
+  md me mg mh mk ml mm mn mo mp mq mr ms mt mu mv mw mx my mz na nc ne nf ng
+  ni nl no np nr nu nz om pa pe pf pg ph pk pl pm pn pr ps pt pw py qa re ro
+  rs ru rw sa sb sc sd se sg sh si sj sk sl sm sn so sr ss st su sv sx sy sz
+  tc td tf tg th tj tk tl tm tn to tp tr tt tv tw tz ua ug uk us uy uz va vc
+  ve vg vi vn vu wf ws ye yt yu za zm zw
+'''.split())
+_SCHEMES = ('http:', 'https:')
+_HOST_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789.-')
+# can't be part of a URL, or rather end it, respectively
+_URL_STOP = frozenset('()<>{}[]')
+_URL_TRAILING = frozenset('`!;:\'".,<>?«»“”‘’')
+
+
+def _is_word(c: str) -> bool:  # as in regex `\w`
+  return c.isalnum() or c == '_'
+
+
+def _has_path(s: str, start: int) -> bool:
+  """Whether `s[start:]` begins with 2+ URL chars, not just punctuation.
+
+  A `(...)` group counts as one char, e.g. for Wikipedia-style links.
+  """
+  i = start
+  while i < len(s):
+    c = s[i]
+    if c == '(':
+      # no whitespace inside; scanning on from its end keeps this linear
+      close = s.find(')', i + 2)
+      if close < 0 or any(map(str.isspace, s[i + 1:close])):
+        return False
+      if i > start:
+        return True
+      i = close + 1
+      continue
+    if c.isspace() or c in _URL_STOP:
+      return False
+    if i > start and c not in _URL_TRAILING:
+      return True
+    i += 1
+  return False
+
+
+def _has_host(s: str) -> bool:
+  """`s` starts with a `host.tld` (e.g. `arxiv.org/abs/...`, `x.ai`)."""
+  end = 0
+  while end < len(s) and s[end].lower() in _HOST_CHARS:
+    end += 1
+  if not end or not s[0].isalnum():
+    return False
+  host = s[:end].lower()
+  # followed by a path, whatever the labels look like
+  if s[end:end + 1] == '/' and '.' in host:
+    name, tld = host.rsplit('.', 1)
+    if name and tld in _TLDS and _has_path(s, end + 1):
+      return True
+  # or ends at a well-formed label `a.b-c.tld` (not an email: no `@` after)
+  i, sep = 0, ''
+  while i < end:
+    j = i
+    while j < end and host[j] not in '.-':
+      j += 1
+    if j == i:  # empty label, anything after isn't a host
+      return False
+    if sep == '.' and host[i:j] in _TLDS:
+      after = s[j:j + 1]
+      if after in ('.', '-') or (after != '@' and not _is_word(after)):
+        return True
+    sep, i = host[j:j + 1], j + 1
+  return False
 
 
 def is_url(s: str) -> bool:
-  return _RE_URL.match(s)
+  """Whether `s` starts with a web URL: `http(s):...` or `host.tld[/...]`.
+
+  Linear in `len(s)`, a few passes over it at most.
+  """
+  if s[:6].lower().startswith(_SCHEMES):
+    start = s.index(':') + 1
+    if (c := s[start:start + 1]) and (c == '/' or c == '%' or (
+        c.isascii() and c.isalnum())) and _has_path(s, start + 1):
+      return True
+  return _has_host(s)
 
 
 def clean_camelcase_fname(fname: str) -> str:
@@ -65,3 +147,24 @@ def name_from(url: str) -> str:
   """Return the most likely name for the PDF."""
   return next(potential_pdf_names(url))
 
+
+
+_RE_BIB_ENTRY = re.compile(r'^\s*@(\w+)\s*[{(]', re.M)
+_RE_BIB_FIELD = re.compile(r'(\w+)\s*=\s*(?:\{([^{}]*)\}|"([^"]*)")')
+
+
+def bib_items(bib: str) -> ty.Iterable[str]:
+  """Something `put` can dispatch on per BibTeX entry: ArXiv ID, URL or DOI."""
+  starts = [m.start() for m in _RE_BIB_ENTRY.finditer(bib)]
+  for start, end in zip(starts, starts[1:] + [len(bib)]):
+    fields = {
+      k.lower(): (v1 or v2).strip()
+      for k, v1, v2 in _RE_BIB_FIELD.findall(bib[start:end])}
+    if eprint := fields.get('eprint'):
+      yield eprint.removeprefix('arXiv:')
+    elif url := fields.get('url'):
+      yield url
+    elif doi := fields.get('doi'):
+      yield f'https://doi.org/{doi}'
+    else:
+      L.warning('Nothing to fetch in: %s', bib[start:end].split(',')[0])
@@ -0,0 +1,131 @@
+"""Wait for Dropbox changes with `list_folder/longpoll`, instead of polling.
+
+A long-poll is one cheap, auth-less request that blocks until something
+changes after a cursor. Only then is the delta fetched (through the local
+index, which also keeps the cursor across restarts).
+"""
+import concurrent.futures as cf
+import contextlib
+import logging
+import signal
+import threading
+import typing as ty
+
+from tk.dbox import api
+from tk.dbox import deadline as dl
+from tk.dbox import index as idx
+from tk.dbox import retry
+
+L = logging.getLogger(__name__)
+
+# (changed entries, whether the index had to be re-listed from scratch)
+OnChange = ty.Callable[[list[ty.Union[api.FileResponse, dict]], bool], ty.Any]
+
+
+def latest(entries: ty.Iterable[ty.Union[api.FileResponse, dict]]) -> list:
+  """Last entry per path, e.g. a file added and then deleted is just deleted."""
+  by_path = {}
+  for entry in entries:
+    path = entry.path_lower if isinstance(entry, api.FileResponse) else (
+      entry.get('path_lower') or entry.get('path_display', '').lower())
+    by_path.pop(path, None)
+    by_path[path] = entry
+  return list(by_path.values())
+
+
+class Watcher:
+  """Calls `on_change` for every (debounced) batch of changes under `root`."""
+
+  def __init__(
+      self,
+      dropbox: api.Dropbox,
+      index: idx.Index,
+      on_change: OnChange,
+      root: str = '',
+      timeout: int = 30,
+      debounce: float = 2.):
+    """`debounce`: wait this long after a change, as uploads come in bursts."""
+    self.dropbox = dropbox
+    self.index = index
+    self.on_change = on_change
+    self.root = root
+    self.timeout = timeout
+    self.debounce = debounce
+    self.stop = threading.Event()
+    self._errors = 0
+
+  def run(self):
+    """Loop until `stop` is set (cf. `stop_on_signals`) or the deadline hits."""
+    if self.index.cursor(self.index.root_of(self.root)) is None:
+      self._handle(None)  # first run: index everything, handle what's there
+    while not self.stop.is_set():
+      try:
+        self.step()
+        self._errors = 0
+      except dl.DeadlineExceeded:
+        raise
+      except Exception:
+        self._errors += 1
+        wait = self.dropbox.retry.backoff(self._errors)
+        L.exception('Watch failed (%s in a row), retrying in %.1fs', self._errors, wait)
+        self.stop.wait(wait)
+
+  def step(self):
+    """One long-poll, and if there were changes, one delta."""
+    cursor = self.index.cursor(self.index.root_of(self.root))
+    try:
+      result = self._longpoll(cursor)
+    except retry.ApiError as e:
+      if 'reset' not in str(e):
+        raise
+      result = {'changes': True}  # fetching the delta will re-list
+    if result is None:
+      return  # stopping
+    if result.get('changes'):
+      L.debug('Changes reported, waiting %ss for more', self.debounce)
+      if self.stop.wait(self.debounce):
+        return
+      self._handle(self.index.changes(self.dropbox, self.root))
+    if backoff := result.get('backoff'):
+      L.debug('Asked to back off for %ss', backoff)
+      self.stop.wait(backoff)
+
+  def _handle(self, changes: ty.Optional[list]):
+    reset = changes is None
+    if reset:  # no cursor or it expired: whatever is there counts as changed
+      self.index.refresh(self.dropbox, self.root)
+      changes = self.index.ls(self.root, recursive=True)
+    if changes:
+      self.on_change(latest(changes), reset)
+
+  def _longpoll(self, cursor: str) -> ty.Optional[dict]:
+    """`Dropbox.longpoll` in a daemon thread, so `stop` can cut it short."""
+    result = cf.Future()
+
+    def _run():
+      try:
+        result.set_result(self.dropbox.longpoll(cursor, self.timeout))
+      except BaseException as e:
+        result.set_exception(e)
+    threading.Thread(target=dl.propagate(_run), daemon=True).start()
+    while not self.stop.is_set():
+      with contextlib.suppress(cf.TimeoutError):
+        return result.result(timeout=.5)
+    return None
+
+  @contextlib.contextmanager
+  def stop_on_signals(self, *signums: int):
+    """First SIGINT/SIGTERM stops after the current step, a second one aborts."""
+    signums = signums or (signal.SIGINT, signal.SIGTERM)
+
+    def _stop(_signum, _frame):
+      L.info('Stopping (again to abort)...')
+      self.stop.set()
+      for s in signums:
+        signal.signal(s, old[s])
+    old = {s: signal.signal(s, _stop) for s in signums}
+    try:
+      yield self
+    finally:
+      for s in signums:
+        signal.signal(s, old[s])